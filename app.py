@@ -7,42 +7,63 @@ from models import db
 from datetime import timedelta
 import os
 from views import *
+from commands import register_commands
+from services.token_blocklist import token_blocklist
+from services.user_profiles import get_user_profile
+from services.database import database_url, engine_options, configure_engine
+from services.instrumentation import init_instrumentation
 import boto3
 import bcrypt
 from redis import Redis
 
-def create_app():
+def create_app(config=None):
     app = Flask(__name__)
 
     # App Configurations
-    app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///test.db'
+    app.config['SQLALCHEMY_DATABASE_URI'] = database_url()
     app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
     app.config['SECRET_KEY'] = 'vsgewvwesvsgevafdsag'
     app.config['JWT_SECRET_KEY'] = 'vsgewvwesvsgevafdsag'
     app.config['JWT_ACCESS_TOKEN_EXPIRES'] = timedelta(days=1)  # Set token expiration time
     app.config['MAX_CONTENT_LENGTH'] = 16 * 1024 * 1024  # Max request size 16MB
+    app.config['REDIS_ENABLED'] = os.environ.get("REDIS_ENABLED", "true").lower() == "true"
+
+    # Overrides for scripts and benchmarks (e.g. a separate database)
+    if config:
+        app.config.update(config)
+
+    # Pool, pre-ping and statement timeout from the environment, per backend
+    app.config.setdefault('SQLALCHEMY_ENGINE_OPTIONS', engine_options(app.config['SQLALCHEMY_DATABASE_URI']))
 
     redis_host = os.environ.get("REDIS_HOST", "localhost")
     redis_port = int(os.environ.get("REDIS_PORT", 6379))
     redis_db = int(os.environ.get("REDIS_DB", 0))
 
     redis_client = Redis(host=redis_host, port=redis_port, db=redis_db)
-
+    if app.config['REDIS_ENABLED']:
+        app.extensions['redis'] = redis_client
 
     # Initialize Extensions
     db.init_app(app)
+    with app.app_context():
+        configure_engine(db.engine)
+        # Per-endpoint SQL/latency metrics, Server-Timing headers and /metrics
+        init_instrumentation(app, db.engine)
     migrate = Migrate(app, db)
     CORS(app)
     
     # JWT Setup
     jwt = JWTManager(app)
 
-    # Blocklist for revoked tokens
+    # Blocklist for revoked tokens, answered from a per-worker Bloom filter
     @jwt.token_in_blocklist_loader
     def token_in_blocklist_callback(jwt_header, jwt_data):
-        jti = jwt_data['jti']
-        token = TokenBlocklist.query.filter_by(jti=jti).first()
-        return token is not None
+        return token_blocklist.is_revoked(jwt_data['jti'], jwt_data.get('exp'))
+
+    # current_user for JWT-protected views, served from the profile cache
+    @jwt.user_lookup_loader
+    def user_lookup_callback(jwt_header, jwt_data):
+        return get_user_profile(jwt_data['sub'])
 
     # Register blueprints
     app.register_blueprint(user_bp)
@@ -50,6 +71,12 @@ def create_app():
     app.register_blueprint(event_bp)
     app.register_blueprint(auth_bp)
     app.register_blueprint(yap_bp)
+    app.register_blueprint(upload_bp)
+    app.register_blueprint(metrics_bp)
+    app.register_blueprint(autocomplete_bp)
+
+    # CLI maintenance commands
+    register_commands(app)
 
     # Define the root route
     @app.route('/')
@@ -59,6 +86,6 @@ def create_app():
     return app
 
 if __name__ == '__main__':
-    # Create the app and run it
+    # Development server only; production runs gunicorn against wsgi:app
     app = create_app()
-    app.run(host='0.0.0.0', port=5000, debug=True)
+    app.run(host='0.0.0.0', port=5000, debug=os.environ.get("FLASK_DEBUG", "true").lower() == "true")
@@ -0,0 +1,158 @@
+"""
+Autocomplete latency on the in-memory index.
+
+Loads --products synthetic products (as in benchmarks.search), --users
+users and --hashtags hashtags into a throwaway SQLite file, or into
+--database-url, builds the index once and then times suggestions for
+queries typed a letter at a time, with and without typos:
+
+    prefix      every prefix of a title word, username or hashtag
+    typo        whole words with one letter swapped, dropped or changed
+    endpoint    GET /autocomplete through the Flask test client
+
+It also times how long a committed product takes to show up.
+
+    python -m benchmarks.autocomplete --products 100000 --users 100000
+"""
+import argparse
+import os
+import random
+import tempfile
+import time
+from flask_jwt_extended import create_access_token
+from app import create_app
+from models import db, Users, Products, Hashtag
+from services.autocomplete import autocomplete
+from services.bulk_load import load_tables
+from .dataset import Pools
+from .search import generate, percentile
+
+TARGET_MS = 5
+
+
+def generate_people(users, hashtags, first_id, seed):
+    rng = random.Random(seed + 2)
+    pools = Pools(rng, seed)
+
+    def user_rows():
+        for n in range(first_id, first_id + users):
+            first, last = pools.pick(pools.first_names), pools.pick(pools.last_names)
+            yield {
+                'id': n, 'first_name': first, 'last_name': last, 'username': f'{first}{last}{n}'.lower(),
+                'email': f'user{n}@example.com', 'password': 'x', 'category': 'bench',
+            }
+
+    def hashtag_rows():
+        for n in range(1, hashtags + 1):
+            yield {'id': n, 'name': f'#{pools.pick(pools.words)}{pools.pick(pools.words)}{n}'}
+
+    yield Users, user_rows()
+    yield Hashtag, hashtag_rows()
+
+
+def typo(word, rng):
+    i = rng.randrange(len(word) - 1)
+    edit = rng.choice(['swap', 'drop', 'change'])
+    if edit == 'swap':
+        return word[:i] + word[i + 1] + word[i] + word[i + 2:]
+    if edit == 'drop':
+        return word[:i] + word[i + 1:]
+    return word[:i] + rng.choice('abcdefghijklmnopqrstuvwxyz') + word[i + 1:]
+
+
+def make_queries(words, count, seed):
+    """Every prefix of sampled words as typed, and the same words with one typo."""
+    rng = random.Random(seed + 3)
+    sample = [word for word in rng.sample(words, min(count, len(words)))]
+    prefixes = [word[:length] for word in sample for length in range(1, len(word) + 1)]
+    typos = [typo(word, rng) for word in sample if len(word) >= 5]
+    return prefixes, typos
+
+
+def measure(run, queries):
+    latencies = []
+    for query in queries:
+        start = time.perf_counter()
+        run(query)
+        latencies.append((time.perf_counter() - start) * 1000)
+    latencies.sort()
+    return latencies
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--products', type=int, default=100_000)
+    parser.add_argument('--users', type=int, default=100_000)
+    parser.add_argument('--hashtags', type=int, default=10_000)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--words', type=int, default=200, help='Words to type out letter by letter.')
+    parser.add_argument('--database-url', help='Database to fill; emptied first. Defaults to a temporary SQLite file.')
+    args = parser.parse_args()
+
+    temporary = None
+    database_url = args.database_url
+    if database_url is None:
+        handle, temporary = tempfile.mkstemp(suffix='.db')
+        os.close(handle)
+        database_url = f'sqlite:///{temporary}'
+
+    try:
+        app = create_app({'SQLALCHEMY_DATABASE_URI': database_url, 'REDIS_ENABLED': False})
+        with app.app_context():
+            db.drop_all()
+            db.create_all()
+            print(f"Loading {args.products} products, {args.users} users and {args.hashtags} hashtags...")
+            load_tables(generate(args.products, args.seed))
+            sellers = db.session.query(db.func.count(Users.id)).scalar()
+            load_tables(generate_people(args.users, args.hashtags, sellers + 1, args.seed))
+
+            start = time.perf_counter()
+            autocomplete.start()
+            autocomplete.wait()
+            print(f"\nBuilt index in {time.perf_counter() - start:.1f}s")
+
+            words = sorted(
+                {word.lower() for title, in db.session.query(Products.title).limit(5000) for word in title.split() if len(word) >= 3}
+                | {username for username, in db.session.query(Users.username).order_by(Users.id.desc()).limit(5000)}
+            )
+            words += [name.lstrip('#') for name, in db.session.query(Hashtag.name).limit(1000)]
+            prefixes, typos = make_queries(words, args.words, args.seed)
+            token = create_access_token(identity=1)
+            db.session.remove()
+
+        client = app.test_client()
+        headers = {'Authorization': f'Bearer {token}'}
+
+        def endpoint(q):
+            return client.get('/autocomplete', query_string={'q': q}, headers=headers).get_json()
+
+        with app.app_context():
+            print(f"\n{'queries':>10} {'count':>8} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'max ms':>8}")
+            for name, run, sample in [
+                ('prefix', autocomplete.suggest, prefixes),
+                ('typo', autocomplete.suggest, typos),
+                ('endpoint', endpoint, prefixes),
+            ]:
+                latencies = measure(run, sample)
+                print(f"{name:>10} {len(sample):>8} {percentile(latencies, 0.5):>8.2f} {percentile(latencies, 0.95):>8.2f} "
+                      f"{percentile(latencies, 0.99):>8.2f} {latencies[-1]:>8.2f}")
+
+            found = sum(1 for q in typos if any(autocomplete.suggest(q).values()))
+            print(f"\n{found}/{len(typos)} typo queries returned suggestions (target p95 under {TARGET_MS} ms)")
+
+            seller_id = db.session.query(Products.seller_id).limit(1).scalar()
+            product = Products(title='Zyxwvut Lantern', brand='Quillfeather', price=10, category='Books', seller_id=seller_id)
+            db.session.add(product)
+            start = time.perf_counter()
+            db.session.commit()
+            visible = any(item['id'] == product.id for item in autocomplete.suggest('zyxwv', ['products'])['products'])
+            print(f"New product {'visible' if visible else 'NOT visible'} {(time.perf_counter() - start) * 1000:.1f} ms after commit")
+    finally:
+        if temporary:
+            for suffix in ('', '-wal', '-shm'):
+                if os.path.exists(temporary + suffix):
+                    os.remove(temporary + suffix)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,236 @@
+"""
+Synthetic CampoSocial data for benchmarks, scaled from a user count.
+
+Rows are generated from a fixed random seed in foreign-key order and
+inserted in batches, so the same --users and --seed always give the same
+database. Faker fills small pools of names, words and sentences up front;
+rows draw from the pools, which keeps generation fast at a million users.
+Rows go through services.bulk_load (COPY on PostgreSQL).
+
+    python -m benchmarks.dataset --users 10000 --database-url sqlite:////tmp/bench.db
+"""
+import argparse
+from datetime import datetime, timedelta
+import random
+from faker import Faker
+from models import (
+    db, Users, Friendship, Yap, Like, Message, Seller, Products, ProductImages, Reviews, Events
+)
+
+# Rows per user for each table
+RATIOS = {
+    'friendships': 5,
+    'yaps': 5,
+    'likes': 10,
+    'messages': 5,
+    'sellers': 0.02,
+    'products': 0.1,
+    'reviews': 0.5,
+    'events': 0.01,
+}
+BATCH_SIZE = 5000
+POOL_SIZE = 1000
+HISTORY_DAYS = 365
+
+PRODUCT_CATEGORIES = ['Books', 'Electronics', 'Clothing', 'Kitchenware', 'Furniture', 'Sports', 'Stationery', 'Beauty']
+EVENT_CATEGORIES = ['Music', 'Sports', 'Tech', 'Art', 'Career', 'Party']
+COURSES = ['Computer Science', 'Law', 'Medicine', 'Economics', 'Engineering', 'Architecture', 'Journalism']
+
+
+def counts(users):
+    return {'users': users, **{table: max(1, int(users * ratio)) for table, ratio in RATIOS.items()}}
+
+
+class Pools:
+    def __init__(self, rng, seed):
+        fake = Faker()
+        fake.seed_instance(seed)
+        self.rng = rng
+        self.first_names = [fake.first_name() for _ in range(POOL_SIZE)]
+        self.last_names = [fake.last_name() for _ in range(POOL_SIZE)]
+        self.words = [fake.word() for _ in range(POOL_SIZE)]
+        self.sentences = [fake.sentence(nb_words=12) for _ in range(POOL_SIZE)]
+        self.cities = [fake.city() for _ in range(100)]
+        self.now = datetime(2026, 1, 1)
+
+    def pick(self, pool):
+        return pool[self.rng.randrange(len(pool))]
+
+    def text(self, sentences=2):
+        return ' '.join(self.pick(self.sentences) for _ in range(sentences))
+
+    def past(self, days=HISTORY_DAYS):
+        return self.now - timedelta(seconds=self.rng.randrange(days * 86400))
+
+
+def yap_id(n):
+    return f'y{n}'
+
+
+def product_id(n):
+    return f'p{n}'
+
+
+def seller_id(n):
+    return f's{n}'
+
+
+def generate(users, seed=0):
+    """Yield (table, rows) for every table, parents before children."""
+    rng = random.Random(seed)
+    pools = Pools(rng, seed)
+    sizes = counts(users)
+
+    def user_rows():
+        for n in range(1, users + 1):
+            first, last = pools.pick(pools.first_names), pools.pick(pools.last_names)
+            joined = pools.past()
+            yield {
+                'id': n,
+                'first_name': first,
+                'last_name': last,
+                'username': f'{first.lower()}{n}',
+                'email': f'{first.lower()}.{last.lower()}{n}@example.com',
+                'password': 'x',
+                'category': pools.pick(COURSES),
+                'created_at': joined,
+                'updated_at': joined,
+            }
+
+    def friendship_rows():
+        # Offsets below users/2 never give both (u, v) and (v, u)
+        degree = min(RATIOS['friendships'], max(0, (users - 1) // 2))
+        for user_id in range(1, users + 1):
+            for offset in rng.sample(range(1, (users + 1) // 2), degree) if degree else ():
+                yield {
+                    'user_id': user_id,
+                    'friend_id': (user_id - 1 + offset) % users + 1,
+                    'status': 'accepted' if rng.random() < 0.8 else 'pending',
+                    'created_at': pools.past(),
+                }
+
+    def yap_rows():
+        for n in range(sizes['yaps']):
+            created = pools.past()
+            yield {
+                'id': yap_id(n),
+                'content': pools.text(1),
+                'user_id': rng.randint(1, users),
+                'location': pools.pick(pools.cities) if rng.random() < 0.2 else None,
+                'created_at': created,
+                'updated_at': created,
+            }
+
+    def like_rows():
+        for _ in range(sizes['likes']):
+            yield {'user_id': rng.randint(1, users), 'yap_id': yap_id(rng.randrange(sizes['yaps'])), 'created_at': pools.past()}
+
+    def message_rows():
+        for _ in range(sizes['messages']):
+            yield {'user_id': rng.randint(1, users), 'encrypted_content': pools.text(1), 'timestamp': pools.past()}
+
+    def seller_rows():
+        for n, user_id in enumerate(rng.sample(range(1, users + 1), min(sizes['sellers'], users))):
+            yield {
+                'id': seller_id(n),
+                'display_name': f'{pools.pick(pools.words).title()} Store',
+                'is_verified': rng.random() < 0.3,
+                'user_id': user_id,
+                'created_at': pools.past(),
+            }
+
+    def product_rows():
+        for n in range(sizes['products']):
+            created = pools.past()
+            yield {
+                'id': product_id(n),
+                'title': f'{pools.pick(pools.words).title()} {pools.pick(pools.words)}',
+                'description': pools.pick(pools.sentences),
+                'brand': pools.pick(pools.words).title(),
+                'price': round(rng.uniform(1, 500), 2),
+                'category': pools.pick(PRODUCT_CATEGORIES),
+                'seller_id': seller_id(rng.randrange(min(sizes['sellers'], users))),
+                'total_sales': rng.randrange(200),
+                'created_at': created,
+                'updated_at': created,
+            }
+
+    def product_image_rows():
+        for n in range(sizes['products']):
+            for image in range(rng.randint(1, 3)):
+                yield {'product_id': product_id(n), 'image_url': f'https://cdn.example.com/products/{n}/{image}.jpg'}
+
+    def review_rows():
+        for _ in range(sizes['reviews']):
+            created = pools.past()
+            yield {
+                'user_id': rng.randint(1, users),
+                'product_id': product_id(rng.randrange(sizes['products'])),
+                'rating': float(rng.randint(1, 5)),
+                'text': pools.pick(pools.sentences),
+                'created_at': created,
+                'updated_at': created,
+            }
+
+    def event_rows():
+        for n in range(sizes['events']):
+            day = pools.now + timedelta(days=rng.randint(-90, 90))
+            start = day.replace(hour=rng.randint(8, 20))
+            created = pools.past()
+            yield {
+                'id': f'e{n}',
+                'title': f'{pools.pick(pools.words).title()} {pools.pick(EVENT_CATEGORIES)} Night',
+                'description': pools.pick(pools.sentences),
+                'start_time': start,
+                'end_time': start + timedelta(hours=rng.randint(1, 4)),
+                'date_of_event': day,
+                'entry_fee': str(rng.choice([0, 100, 200, 500])),
+                'category': pools.pick(EVENT_CATEGORIES),
+                'user_id': rng.randint(1, users),
+                'created_at': created,
+                'updated_at': created,
+            }
+
+    yield Users, user_rows()
+    yield Friendship, friendship_rows()
+    yield Yap, yap_rows()
+    yield Like, like_rows()
+    yield Message, message_rows()
+    yield Seller, seller_rows()
+    yield Products, product_rows()
+    yield ProductImages, product_image_rows()
+    yield Reviews, review_rows()
+    yield Events, event_rows()
+
+
+def load(users, seed=0, batch_size=BATCH_SIZE, report=print):
+    """Generate and insert the dataset into the current app's database. Returns rows per table."""
+    from services.bulk_load import load_tables
+    from services.yap_counters import reconcile_yap_counters
+    from services.product_ratings import reconcile_product_ratings
+
+    loaded = load_tables(generate(users, seed), batch_size, report)
+    # Bulk inserts skip the ORM listeners that maintain like_count and the rating aggregates
+    reconcile_yap_counters()
+    reconcile_product_ratings()
+    return loaded
+
+
+def main():
+    from app import create_app
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--users', type=int, default=10_000)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--batch-size', type=int, default=BATCH_SIZE)
+    parser.add_argument('--database-url', required=True, help='Database to create the tables in and fill.')
+    args = parser.parse_args()
+
+    app = create_app({'SQLALCHEMY_DATABASE_URI': args.database_url, 'REDIS_ENABLED': False})
+    with app.app_context():
+        db.create_all()
+        load(args.users, args.seed, args.batch_size)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,189 @@
+"""
+Latency and query counts for the hot endpoints on a synthetic dataset.
+
+Builds (or reuses) a database from benchmarks.dataset at the requested
+scale, then requests each endpoint --requests times as user 1, either
+in-process through the Flask test client or against gunicorn. Query counts
+come from the Server-Timing header added by services/instrumentation.py.
+Results are written as JSON; pass an earlier file to --compare to see what
+changed between commits.
+
+    python -m benchmarks.endpoints --users 10000 --output before.json
+    python -m benchmarks.endpoints --users 10000 --output after.json --compare before.json
+    python -m benchmarks.endpoints --users 100000 --database-url sqlite:////tmp/bench100k.db --mode gunicorn
+"""
+import argparse
+from datetime import datetime, timezone
+import json
+import os
+import re
+import subprocess
+import tempfile
+import time
+import requests
+from flask_jwt_extended import create_access_token
+from app import create_app
+from models import db, Users
+from . import dataset
+from .serving import start_server, ROOT
+
+ENDPOINTS = [
+    '/yaps',
+    '/yaps?cursor=',
+    '/users',
+    '/products',
+    '/events',
+    '/marketplace/search?q=a',
+    '/chat-list',
+]
+QUERY_COUNT = re.compile(r'desc="(\d+) queries"')
+
+
+def percentile(sorted_values, fraction):
+    if not sorted_values:
+        return None
+    return sorted_values[min(len(sorted_values) - 1, int(len(sorted_values) * fraction))]
+
+
+def summarize(latencies, query_counts, statuses):
+    latencies = sorted(latencies)
+    ok = statuses.get('200', 0)
+    return {
+        'requests': len(latencies),
+        'statuses': statuses,
+        'p50_ms': percentile(latencies, 0.50),
+        'p95_ms': percentile(latencies, 0.95),
+        'p99_ms': percentile(latencies, 0.99),
+        'queries': max(query_counts) if query_counts else None,
+        'served': ok > 0,
+    }
+
+
+def run_endpoint(get, path, count):
+    latencies, query_counts, statuses = [], [], {}
+    for _ in range(count):
+        start = time.perf_counter()
+        status, server_timing = get(path)
+        latencies.append((time.perf_counter() - start) * 1000)
+        statuses[str(status)] = statuses.get(str(status), 0) + 1
+        match = QUERY_COUNT.search(server_timing or '')
+        if match:
+            query_counts.append(int(match.group(1)))
+    return summarize(latencies, query_counts, statuses)
+
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT, capture_output=True, text=True).stdout.strip() or None
+    except OSError:
+        return None
+
+
+def compare(previous, current):
+    print(f"\n{'endpoint':>26} {'p95 ms':>18} {'queries':>14}")
+    for path, result in current['endpoints'].items():
+        before = previous['endpoints'].get(path)
+        if not before:
+            continue
+
+        def delta(key, fmt):
+            old, new = before.get(key), result.get(key)
+            if old is None or new is None:
+                return '-'
+            return f"{old:{fmt}} -> {new:{fmt}}"
+
+        print(f"{path:>26} {delta('p95_ms', '.1f'):>18} {delta('queries', 'd'):>14}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--users', type=int, default=10_000)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--database-url', help='Reuse this database, seeding it first if it has no users.')
+    parser.add_argument('--mode', choices=['testclient', 'gunicorn'], default='testclient')
+    parser.add_argument('--workers', type=int, default=os.cpu_count())
+    parser.add_argument('--port', type=int, default=5099)
+    parser.add_argument('--requests', type=int, default=50, help='Requests per endpoint.')
+    parser.add_argument('--warmup', type=int, default=3, help='Unmeasured requests per endpoint first.')
+    parser.add_argument('--output', default='benchmark-results.json')
+    parser.add_argument('--compare', help='Earlier results file to compare against.')
+    args = parser.parse_args()
+
+    temporary = None
+    database_url = args.database_url
+    if database_url is None:
+        handle, temporary = tempfile.mkstemp(suffix='.db')
+        os.close(handle)
+        database_url = f'sqlite:///{temporary}'
+
+    config = {'SQLALCHEMY_DATABASE_URI': database_url, 'REDIS_ENABLED': False}
+    server = None
+    try:
+        app = create_app(config)
+        # Failing endpoints are reported by status code instead of a traceback per request
+        app.logger.disabled = True
+        with app.app_context():
+            db.create_all()
+            if db.session.query(Users.id).first() is None:
+                print(f"Seeding {args.users} users...")
+                dataset.load(args.users, args.seed)
+            users = db.session.query(db.func.count(Users.id)).scalar()
+            token = create_access_token(identity=1)
+        headers = {'Authorization': f'Bearer {token}'}
+
+        if args.mode == 'gunicorn':
+            server, url = start_server(f'app:create_app({config!r})', 'gthread', args.workers, 4, args.port)
+            session = requests.Session()
+
+            def get(path):
+                response = session.get(url + path, headers=headers)
+                return response.status_code, response.headers.get('Server-Timing')
+        else:
+            client = app.test_client()
+
+            def get(path):
+                response = client.get(path, headers=headers)
+                return response.status_code, response.headers.get('Server-Timing')
+
+        results = {}
+        print(f"{'endpoint':>26} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'queries':>8}  statuses")
+        for path in ENDPOINTS:
+            for _ in range(args.warmup):
+                get(path)
+            result = run_endpoint(get, path, args.requests)
+            results[path] = result
+            if not result['served']:
+                print(f"{path:>26} {'not served':>35}  {result['statuses']}")
+                continue
+            queries = result['queries'] if result['queries'] is not None else '-'
+            print(f"{path:>26} {result['p50_ms']:>8.1f} {result['p95_ms']:>8.1f} {result['p99_ms']:>8.1f} {queries:>8}  {result['statuses']}")
+
+        report = {
+            'commit': git_commit(),
+            'recorded_at': datetime.now(timezone.utc).isoformat(),
+            'mode': args.mode,
+            'database': database_url.split(':', 1)[0],
+            'users': users,
+            'seed': args.seed,
+            'requests_per_endpoint': args.requests,
+            'endpoints': results,
+        }
+        with open(args.output, 'w') as output:
+            json.dump(report, output, indent=2)
+        print(f"\nWrote {args.output}")
+
+        if args.compare:
+            with open(args.compare) as previous:
+                compare(json.load(previous), report)
+    finally:
+        if server is not None:
+            server.terminate()
+            server.wait()
+        if temporary:
+            for suffix in ('', '-wal', '-shm'):
+                if os.path.exists(temporary + suffix):
+                    os.remove(temporary + suffix)
+
+
+if __name__ == '__main__':
+    main()
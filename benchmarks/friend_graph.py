@@ -0,0 +1,88 @@
+"""
+Query-count benchmark for GET /users backed by the friend graph.
+
+Seeds a throwaway SQLite database per size and counts the SQL statements a
+single request issues, cold (graph not built yet) and warm.
+
+    python -m benchmarks.friend_graph --sizes 100 1000 5000 --degree 20
+"""
+import argparse
+import os
+import random
+import tempfile
+import time
+from sqlalchemy import event, insert
+from flask_jwt_extended import create_access_token
+from app import create_app
+from models import db, Users, Friendship
+from services.friend_graph import friend_graph
+
+
+def seed(user_count, degree):
+    db.session.execute(insert(Users), [
+        {
+            'id': user_id,
+            'first_name': 'First',
+            'last_name': 'Last',
+            'username': f'user{user_id}',
+            'email': f'user{user_id}@example.com',
+            'password': 'x',
+            'category': 'bench',
+        }
+        for user_id in range(1, user_count + 1)
+    ])
+
+    pairs = set()
+    for user_id in range(1, user_count + 1):
+        for friend_id in random.sample(range(1, user_count + 1), min(degree // 2, user_count - 1)):
+            if friend_id != user_id and (friend_id, user_id) not in pairs:
+                pairs.add((user_id, friend_id))
+    db.session.execute(insert(Friendship), [
+        {'user_id': user_id, 'friend_id': friend_id, 'status': 'accepted'} for user_id, friend_id in pairs
+    ])
+    db.session.commit()
+
+
+def run(user_count, degree):
+    handle, path = tempfile.mkstemp(suffix='.db')
+    os.close(handle)
+    app = create_app({'SQLALCHEMY_DATABASE_URI': f'sqlite:///{path}', 'REDIS_ENABLED': False})
+    try:
+        with app.app_context():
+            db.create_all()
+            seed(user_count, degree)
+            friend_graph.invalidate()
+            headers = {'Authorization': f'Bearer {create_access_token(identity=1)}'}
+
+            statements = []
+            event.listen(db.engine, 'before_cursor_execute', lambda *args: statements.append(args[2]))
+
+            client = app.test_client()
+            results = {}
+            for phase in ('cold', 'warm'):
+                statements.clear()
+                start = time.perf_counter()
+                response = client.get('/users', headers=headers)
+                elapsed = (time.perf_counter() - start) * 1000
+                assert response.status_code == 200, response.get_data(as_text=True)
+                results[phase] = (len(statements), elapsed)
+            return results
+    finally:
+        os.remove(path)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', type=int, nargs='+', default=[100, 1000, 5000])
+    parser.add_argument('--degree', type=int, default=20)
+    args = parser.parse_args()
+
+    print(f"{'users':>8} {'cold queries':>13} {'cold ms':>9} {'warm queries':>13} {'warm ms':>9}")
+    for size in args.sizes:
+        results = run(size, args.degree)
+        (cold_queries, cold_ms), (warm_queries, warm_ms) = results['cold'], results['warm']
+        print(f"{size:>8} {cold_queries:>13} {cold_ms:>9.1f} {warm_queries:>13} {warm_ms:>9.1f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,58 @@
+"""
+Password verification throughput (logins/sec per core) by bcrypt cost.
+
+Runs verifications through the same bounded pool the /login view uses,
+first one at a time and then with --threads concurrent callers, and
+compares against the legacy werkzeug default hash.
+
+    python -m benchmarks.passwords --rounds 10 11 12 13 --seconds 3
+"""
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+import os
+import time
+from werkzeug.security import generate_password_hash, check_password_hash
+from services import passwords
+
+
+def measure(verify, seconds, threads):
+    deadline = time.perf_counter() + seconds
+
+    def loop():
+        count = 0
+        while time.perf_counter() < deadline:
+            verify()
+            count += 1
+        return count
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=threads) as callers:
+        total = sum(callers.map(lambda _: loop(), range(threads)))
+    return total / (time.perf_counter() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rounds', type=int, nargs='+', default=[10, 11, 12, 13])
+    parser.add_argument('--seconds', type=float, default=3)
+    parser.add_argument('--threads', type=int, default=passwords.HASH_WORKERS)
+    args = parser.parse_args()
+
+    password = 'correct horse battery staple'
+    print(f"hash pool: {passwords.HASH_WORKERS} workers, {os.cpu_count()} cores")
+    print(f"{'scheme':>16} {'1 caller/s':>11} {'N callers/s':>12} {'per core/s':>11}")
+
+    for rounds in args.rounds:
+        stored = passwords.hash_password(password, rounds=rounds)
+        verify = lambda: passwords.verify_password(password, stored, rounds=rounds)
+        single = measure(verify, args.seconds, 1)
+        parallel = measure(verify, args.seconds, args.threads)
+        print(f"{f'bcrypt {rounds}':>16} {single:>11.1f} {parallel:>12.1f} {parallel / passwords.HASH_WORKERS:>11.1f}")
+
+    legacy = generate_password_hash(password)
+    single = measure(lambda: check_password_hash(legacy, password), args.seconds, 1)
+    print(f"{legacy.split(':')[0] + ' (legacy)':>16} {single:>11.1f} {'-':>12} {single:>11.1f}")
+
+
+if __name__ == '__main__':
+    main()
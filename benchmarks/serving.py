@@ -0,0 +1,158 @@
+"""
+Requests/sec on the hot GET endpoints for each gunicorn worker model.
+
+Seeds a throwaway SQLite database, then for every worker class starts
+gunicorn with gunicorn.conf.py against it and drives each endpoint with
+--concurrency client threads for --seconds.
+
+    python -m benchmarks.serving --workers 4 --concurrency 32 --seconds 10
+
+The client shares the machine with the server; for absolute numbers run it
+from another host with --url against an already running server.
+"""
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+import os
+import subprocess
+import sys
+import tempfile
+import time
+import requests
+from sqlalchemy import insert
+from flask_jwt_extended import create_access_token
+from app import create_app
+from models import db, Users, Yap
+
+ENDPOINTS = ['/yaps', '/yaps?cursor=', '/users', '/authenticated_user']
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def seed(user_count, yaps_per_user):
+    db.session.execute(insert(Users), [
+        {
+            'id': user_id,
+            'first_name': 'First',
+            'last_name': 'Last',
+            'username': f'user{user_id}',
+            'email': f'user{user_id}@example.com',
+            'password': 'x',
+            'category': 'bench',
+        }
+        for user_id in range(1, user_count + 1)
+    ])
+    db.session.execute(insert(Yap), [
+        {'id': f'yap{user_id}-{n}', 'content': f'Yap {n} from user {user_id}', 'user_id': user_id}
+        for user_id in range(1, user_count + 1)
+        for n in range(yaps_per_user)
+    ])
+    db.session.commit()
+
+
+def start_server(app_spec, worker_class, workers, threads, port):
+    env = dict(
+        os.environ,
+        GUNICORN_WORKER_CLASS=worker_class,
+        WEB_CONCURRENCY=str(workers),
+        GUNICORN_THREADS=str(threads),
+        GUNICORN_BIND=f'127.0.0.1:{port}',
+        GUNICORN_ACCESS_LOG='',
+        GUNICORN_LOG_LEVEL='warning',
+    )
+    server = subprocess.Popen(
+        [sys.executable, '-m', 'gunicorn', '-c', 'gunicorn.conf.py', app_spec],
+        cwd=ROOT, env=env
+    )
+    url = f'http://127.0.0.1:{port}'
+    deadline = time.monotonic() + 30
+    while time.monotonic() < deadline:
+        if server.poll() is not None:
+            raise RuntimeError(f"gunicorn ({worker_class}) exited with {server.returncode}")
+        try:
+            requests.get(url + '/', timeout=1)
+            return server, url
+        except requests.ConnectionError:
+            time.sleep(0.2)
+    server.terminate()
+    raise RuntimeError(f"gunicorn ({worker_class}) did not start")
+
+
+def load(url, headers, seconds, concurrency):
+    deadline = time.perf_counter() + seconds
+
+    def loop():
+        latencies, errors = [], 0
+        with requests.Session() as session:
+            while time.perf_counter() < deadline:
+                start = time.perf_counter()
+                response = session.get(url, headers=headers)
+                if response.status_code == 200:
+                    latencies.append(time.perf_counter() - start)
+                else:
+                    errors += 1
+        return latencies, errors
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as clients:
+        results = list(clients.map(lambda _: loop(), range(concurrency)))
+    elapsed = time.perf_counter() - start
+
+    latencies = sorted(latency for result, _ in results for latency in result)
+    errors = sum(errors for _, errors in results)
+    if not latencies:
+        return 0.0, None, None, errors
+    p50 = latencies[len(latencies) // 2] * 1000
+    p99 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))] * 1000
+    return len(latencies) / elapsed, p50, p99, errors
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--worker-classes', nargs='+', default=['sync', 'gthread', 'gevent'])
+    parser.add_argument('--workers', type=int, default=os.cpu_count())
+    parser.add_argument('--threads', type=int, default=4, help='Threads per gthread worker.')
+    parser.add_argument('--concurrency', type=int, default=32)
+    parser.add_argument('--seconds', type=float, default=10)
+    parser.add_argument('--users', type=int, default=1000)
+    parser.add_argument('--yaps-per-user', type=int, default=10)
+    parser.add_argument('--port', type=int, default=5099)
+    parser.add_argument('--redis', action='store_true', help='Let the server use Redis (REDIS_HOST etc.).')
+    parser.add_argument('--url', help='Benchmark an already running server (with a user id 1) instead of starting gunicorn.')
+    args = parser.parse_args()
+
+    handle, path = tempfile.mkstemp(suffix='.db')
+    os.close(handle)
+    config = {'SQLALCHEMY_DATABASE_URI': f'sqlite:///{path}', 'REDIS_ENABLED': args.redis}
+    try:
+        app = create_app(config)
+        with app.app_context():
+            if not args.url:
+                db.create_all()
+                seed(args.users, args.yaps_per_user)
+            headers = {'Authorization': f'Bearer {create_access_token(identity=1)}'}
+
+        app_spec = f'app:create_app({config!r})'
+        print(f"{args.workers} workers, {args.concurrency} client threads, {os.cpu_count()} cores")
+        print(f"{'worker class':>12} {'endpoint':>20} {'req/s':>9} {'p50 ms':>8} {'p99 ms':>8} {'errors':>7}")
+
+        for worker_class in ([args.url] if args.url else args.worker_classes):
+            if args.url:
+                server, url = None, args.url.rstrip('/')
+            else:
+                server, url = start_server(app_spec, worker_class, args.workers, args.threads, args.port)
+            try:
+                for endpoint in ENDPOINTS:
+                    rate, p50, p99, errors = load(url + endpoint, headers, args.seconds, args.concurrency)
+                    p50 = f'{p50:.1f}' if p50 is not None else '-'
+                    p99 = f'{p99:.1f}' if p99 is not None else '-'
+                    label = 'remote' if args.url else worker_class
+                    print(f"{label:>12} {endpoint:>20} {rate:>9.1f} {p50:>8} {p99:>8} {errors:>7}")
+            finally:
+                if server is not None:
+                    server.terminate()
+                    server.wait()
+    finally:
+        os.remove(path)
+
+
+if __name__ == '__main__':
+    main()
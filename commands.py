@@ -0,0 +1,131 @@
+import time
+import click
+
+
+def register_commands(app):
+    """Attach maintenance commands to the `flask` CLI."""
+
+    @app.cli.command('backfill-timelines')
+    @click.option('--reset', is_flag=True, help='Delete existing timelines before rebuilding.')
+    def backfill_timelines_command(reset):
+        """Build home timelines in Redis from existing Follow and Yap rows."""
+        from services.timeline import backfill_timelines
+
+        authors = backfill_timelines(reset=reset)
+        click.echo(f"Backfilled timelines for {authors} authors")
+
+    @app.cli.command('reconcile-yap-counters')
+    def reconcile_yap_counters_command():
+        """Recompute denormalized like/reply/retweet counts on yaps."""
+        from services.yap_counters import reconcile_yap_counters
+
+        updated = reconcile_yap_counters()
+        click.echo(f"Reconciled counters on {updated} yaps")
+
+    @app.cli.command('reconcile-product-ratings')
+    def reconcile_product_ratings_command():
+        """Recompute denormalized rating sums and counts on products and sellers."""
+        from services.product_ratings import reconcile_product_ratings
+
+        products, sellers = reconcile_product_ratings()
+        click.echo(f"Reconciled ratings on {products} products and {sellers} sellers")
+
+    @app.cli.command('media-worker')
+    @click.option('--backfill', is_flag=True, help='First generate variants for stored images that have none.')
+    @click.option('--max-jobs', type=int, default=None, help='Exit after handling this many queued jobs.')
+    def media_worker_command(backfill, max_jobs):
+        """Generate thumbnails and WebP/AVIF variants for uploaded images."""
+        from services.media_variants import backfill_variants, run_worker
+
+        if backfill:
+            processed = backfill_variants()
+            click.echo(f"Generated variants for {processed} images")
+        click.echo("Waiting for images...")
+        handled = run_worker(max_jobs=max_jobs)
+        click.echo(f"Processed {handled} queued images")
+
+    @app.cli.command('gc-media')
+    @click.option('--recount', is_flag=True, help='Recompute reference counts from the database first.')
+    @click.option('--grace-hours', type=int, default=None, help='Keep unreferenced blobs uploaded more recently than this.')
+    def gc_media_command(recount, grace_hours):
+        """Delete stored media that no row references any more."""
+        from services.media_blobs import collect_garbage, recount_references, GC_GRACE_HOURS
+
+        if recount:
+            blobs = recount_references()
+            click.echo(f"Recounted references for {blobs} blobs")
+        deleted = collect_garbage(GC_GRACE_HOURS if grace_hours is None else grace_hours)
+        click.echo(f"Deleted {deleted} unreferenced blobs")
+
+    @app.cli.command('prune-blocklist')
+    def prune_blocklist_command():
+        """Delete revoked-token entries older than JWT_ACCESS_TOKEN_EXPIRES."""
+        from services.token_blocklist import prune_blocklist
+
+        deleted = prune_blocklist()
+        click.echo(f"Pruned {deleted} expired blocklist entries")
+
+    @app.cli.command('check-query-plans')
+    @click.option('--verbose', is_flag=True, help='Print the plan of every query, not just failing ones.')
+    def check_query_plans_command(verbose):
+        """EXPLAIN the hot view queries and fail if any needs a full table scan."""
+        from services.query_plans import check_query_plans
+
+        failures = 0
+        for name, plan, problems in check_query_plans():
+            if problems:
+                failures += 1
+            click.echo(f"{'FAIL' if problems else 'ok':>4}  {name}" + (f": {', '.join(problems)}" if problems else ''))
+            if problems or verbose:
+                for line in plan:
+                    click.echo(f"        {line}")
+        if failures:
+            raise click.ClickException(f"{failures} hot queries fall back to full scans")
+
+    @app.cli.command('bulk-load')
+    @click.argument('fixtures', required=False, type=click.Path(exists=True, file_okay=False))
+    @click.option('--users', type=int, default=None, help='Generate a synthetic dataset of this many users instead.')
+    @click.option('--seed', type=int, default=0, help='Random seed for --users.')
+    @click.option('--batch-size', type=int, default=None, help='Rows per insert or COPY batch.')
+    def bulk_load_command(fixtures, users, seed, batch_size):
+        """Load JSON/CSV fixtures (named after their tables) or generated rows in batches."""
+        from services.bulk_load import load_tables, fixture_sources, BATCH_SIZE
+
+        if (fixtures is None) == (users is None):
+            raise click.UsageError("Pass either a fixture directory or --users")
+        batch_size = batch_size or BATCH_SIZE
+        start = time.perf_counter()
+        if users is not None:
+            from benchmarks.dataset import load
+
+            loaded = load(users, seed, batch_size, report=click.echo)
+        else:
+            from models import MEDIA_URL_COLUMNS
+            from services.media_blobs import recount_references
+            from services.product_ratings import reconcile_product_ratings
+            from services.yap_counters import reconcile_yap_counters
+
+            try:
+                loaded = load_tables(fixture_sources(fixtures), batch_size, report=click.echo)
+            except ValueError as exc:
+                raise click.ClickException(str(exc))
+            # Bulk inserts skip the ORM listeners that maintain the counters,
+            # blob reference counts and rating aggregates
+            if any(loaded.get(table) for table in ('yaps', 'likes', 'replies')):
+                reconcile_yap_counters()
+            media_tables = {model.__tablename__ for model, _ in MEDIA_URL_COLUMNS} | {'media_blobs'}
+            if any(loaded.get(table) for table in media_tables):
+                recount_references()
+            if loaded.get('reviews'):
+                reconcile_product_ratings()
+        elapsed = time.perf_counter() - start
+        total = sum(loaded.values())
+        click.echo(f"Loaded {total} rows in {elapsed:.1f}s ({total / max(elapsed, 1e-9):.0f} rows/s)")
+
+    @app.cli.command('rebuild-search-index')
+    def rebuild_search_index_command():
+        """Create the product search index if needed and re-index every product."""
+        from services.product_search import rebuild_search_index
+
+        indexed = rebuild_search_index()
+        click.echo(f"Indexed {indexed} products")
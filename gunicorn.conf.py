@@ -0,0 +1,65 @@
+"""
+Gunicorn settings, driven by environment variables.
+
+    gunicorn -c gunicorn.conf.py wsgi:app
+
+GUNICORN_WORKER_CLASS picks the worker model:
+
+- sync: one request at a time per worker process.
+- gthread (default): GUNICORN_THREADS requests per worker on a thread pool.
+  Suits this app, whose requests mostly wait on the database, Redis and R2.
+- gevent: GUNICORN_WORKER_CONNECTIONS greenlets per worker. Needs gevent
+  installed. bcrypt does not yield to the event loop, so logins block the
+  whole worker while hashing.
+
+Signals sent to the master:
+
+- HUP reloads this file and gracefully replaces the workers.
+- TERM stops after in-flight requests finish (up to GUNICORN_GRACEFUL_TIMEOUT).
+- USR2 then WINCH/TERM on the old master deploys new code without downtime.
+
+With preloading on (the default), HUP does not pick up new application code.
+"""
+import multiprocessing
+import os
+
+worker_class = os.getenv('GUNICORN_WORKER_CLASS', 'gthread')
+
+if worker_class == 'gevent':
+    # Patch before the app (and its Redis and database clients) is preloaded
+    from gevent import monkey
+    monkey.patch_all()
+
+bind = os.getenv('GUNICORN_BIND', f"0.0.0.0:{os.getenv('PORT', 5000)}")
+workers = int(os.getenv('WEB_CONCURRENCY', multiprocessing.cpu_count() * 2 + 1))
+threads = int(os.getenv('GUNICORN_THREADS', 4 if worker_class == 'gthread' else 1))
+worker_connections = int(os.getenv('GUNICORN_WORKER_CONNECTIONS', 1000))
+
+# Import the app once in the master so workers fork with it already loaded
+preload_app = os.getenv('GUNICORN_PRELOAD', 'true').lower() == 'true'
+
+# Recycle workers after a jittered number of requests to cap memory growth
+max_requests = int(os.getenv('GUNICORN_MAX_REQUESTS', 1000))
+max_requests_jitter = int(os.getenv('GUNICORN_MAX_REQUESTS_JITTER', 100))
+
+timeout = int(os.getenv('GUNICORN_TIMEOUT', 30))
+graceful_timeout = int(os.getenv('GUNICORN_GRACEFUL_TIMEOUT', 30))
+keepalive = int(os.getenv('GUNICORN_KEEPALIVE', 5))
+
+# An empty GUNICORN_ACCESS_LOG turns the access log off
+accesslog = os.getenv('GUNICORN_ACCESS_LOG', '-') or None
+errorlog = '-'
+loglevel = os.getenv('GUNICORN_LOG_LEVEL', 'info')
+
+
+def post_fork(server, worker):
+    from models import db
+    from services.autocomplete import autocomplete
+
+    app = worker.app.wsgi()
+    # Database connections opened while preloading must not be shared across workers
+    if preload_app:
+        with app.app_context():
+            db.engine.dispose(close=False)
+    # Build the autocomplete index now rather than on the first request
+    autocomplete.start(app)
@@ -0,0 +1,127 @@
+"""Add yap counters, media tables and indexes for the hot view queries
+
+Revision ID: 3b7e5a2c9d41
+Revises:
+Create Date: 2026-10-17 17:30:00.000000
+
+Existing databases were created with db.create_all(), so this first revision
+brings them up to the models: the denormalized yap counters (filled from the
+likes, replies and retweets), the media_variants and media_blobs tables, and
+the hot query indexes. Anything create_all already made is skipped. A
+database created from the current models can be stamped instead: flask db
+stamp head.
+
+On PostgreSQL the indexes are built CONCURRENTLY so the tables stay writable.
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '3b7e5a2c9d41'
+down_revision = None
+branch_labels = None
+depends_on = None
+
+
+YAP_COUNTERS = ('like_count', 'reply_count', 'retweet_count')
+
+INDEXES = [
+    # Timelines: GET /yaps, cursor pages, a user's yaps, fan-out backfill
+    ('ix_yaps_created_at_id', 'yaps', ['created_at', 'id']),
+    ('ix_yaps_user_id_created_at', 'yaps', ['user_id', 'created_at']),
+    ('ix_yapmedia_yap_id', 'yapmedia', ['yap_id']),
+    ('ix_likes_yap_id_user_id', 'likes', ['yap_id', 'user_id']),
+    ('ix_replies_yap_id_created_at', 'replies', ['yap_id', 'created_at']),
+    ('ix_follows_following_id', 'follows', ['following_id']),
+    ('ix_notifications_recipient_id_is_read_created_at', 'notifications', ['recipient_id', 'is_read', 'created_at']),
+
+    # Friends and chat
+    ('ix_friendships_friend_id_status', 'friendships', ['friend_id', 'status']),
+    ('ix_messages_user_id_timestamp', 'messages', ['user_id', 'timestamp']),
+    ('ix_chat_media_message_id', 'chat_media', ['message_id']),
+
+    # Marketplace
+    ('ix_products_category_created_at', 'products', ['category', 'created_at']),
+    ('ix_products_seller_id', 'products', ['seller_id']),
+    ('ix_product_images_product_id', 'product_images', ['product_id']),
+    ('ix_product_variations_product_id', 'product_variations', ['product_id']),
+    ('ix_reviews_product_id', 'reviews', ['product_id']),
+    ('ix_cart_user_id', 'cart', ['user_id']),
+    ('ix_cart_items_cart_id_product_id', 'cart_items', ['cart_id', 'product_id']),
+    ('ix_orders_user_id_created_at', 'orders', ['user_id', 'created_at']),
+
+    # Events
+    ('ix_events_category_date_of_event', 'events', ['category', 'date_of_event']),
+    ('ix_events_date_of_event', 'events', ['date_of_event']),
+    ('ix_events_user_id', 'events', ['user_id']),
+    ('ix_comment_events_event_id', 'comment_events', ['event_id']),
+
+    # token_in_blocklist_loader confirmations
+    ('ix_token_blocklist_jti', 'token_blocklist', ['jti']),
+]
+
+
+def _add_yap_counters(inspector):
+    existing = {column['name'] for column in inspector.get_columns('yaps')}
+    missing = [name for name in YAP_COUNTERS if name not in existing]
+    for name in missing:
+        op.add_column('yaps', sa.Column(name, sa.Integer(), nullable=False, server_default='0'))
+    if missing:
+        op.execute(
+            "UPDATE yaps SET "
+            "like_count = (SELECT COUNT(*) FROM likes WHERE likes.yap_id = yaps.id), "
+            "reply_count = (SELECT COUNT(*) FROM replies WHERE replies.yap_id = yaps.id), "
+            "retweet_count = (SELECT COUNT(*) FROM yaps AS retweets WHERE retweets.original_yap_id = yaps.id)"
+        )
+
+
+def _create_media_tables(inspector):
+    tables = set(inspector.get_table_names())
+    if 'media_variants' not in tables:
+        op.create_table(
+            'media_variants',
+            sa.Column('id', sa.Integer(), nullable=False),
+            sa.Column('source_url', sa.String(length=255), nullable=False),
+            sa.Column('url', sa.String(length=255), nullable=False),
+            sa.Column('width', sa.Integer(), nullable=False),
+            sa.Column('height', sa.Integer(), nullable=False),
+            sa.Column('format', sa.String(length=10), nullable=False),
+            sa.Column('size', sa.Integer(), nullable=False),
+            sa.Column('created_at', sa.DateTime(), nullable=True),
+            sa.PrimaryKeyConstraint('id'),
+            sa.UniqueConstraint('source_url', 'width', 'format', name='uq_media_variants_source_width_format'),
+        )
+    if 'media_blobs' not in tables:
+        op.create_table(
+            'media_blobs',
+            sa.Column('key', sa.String(length=255), nullable=False),
+            sa.Column('sha256', sa.String(length=64), nullable=False),
+            sa.Column('size', sa.Integer(), nullable=False),
+            sa.Column('content_type', sa.String(length=100), nullable=True),
+            sa.Column('ref_count', sa.Integer(), nullable=False, server_default='0'),
+            sa.Column('created_at', sa.DateTime(), nullable=False),
+            sa.Column('last_uploaded_at', sa.DateTime(), nullable=False),
+            sa.PrimaryKeyConstraint('key'),
+        )
+
+
+def upgrade():
+    inspector = sa.inspect(op.get_bind())
+    _add_yap_counters(inspector)
+    _create_media_tables(inspector)
+
+    with op.get_context().autocommit_block():
+        for name, table, columns in INDEXES:
+            op.create_index(name, table, columns, if_not_exists=True, postgresql_concurrently=True)
+
+
+def downgrade():
+    with op.get_context().autocommit_block():
+        for name, table, columns in reversed(INDEXES):
+            op.drop_index(name, table_name=table, if_exists=True, postgresql_concurrently=True)
+
+    op.drop_table('media_blobs')
+    op.drop_table('media_variants')
+    for name in reversed(YAP_COUNTERS):
+        op.drop_column('yaps', name)
@@ -0,0 +1,28 @@
+"""Index yaps.original_yap_id
+
+Revision ID: 8c1d4f6e2a57
+Revises: 3b7e5a2c9d41
+Create Date: 2026-10-17 18:00:00.000000
+
+Without it reconcile_yap_counters scans every yap once per yap to count
+retweets, which dominates bulk loads.
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '8c1d4f6e2a57'
+down_revision = '3b7e5a2c9d41'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.get_context().autocommit_block():
+        op.create_index('ix_yaps_original_yap_id', 'yaps', ['original_yap_id'], if_not_exists=True, postgresql_concurrently=True)
+
+
+def downgrade():
+    with op.get_context().autocommit_block():
+        op.drop_index('ix_yaps_original_yap_id', table_name='yaps', if_exists=True, postgresql_concurrently=True)
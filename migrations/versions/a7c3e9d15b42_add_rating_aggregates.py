@@ -0,0 +1,44 @@
+"""Add rating aggregates to products and sellers
+
+Revision ID: a7c3e9d15b42
+Revises: f2b8c5a1d930
+Create Date: 2026-10-17 20:00:00.000000
+
+rating_sum and rating_count are kept in sync with reviews by ORM listeners
+in models.py; the existing reviews are summed in here once. The columns
+have constant defaults, so adding them does not rewrite either table on
+PostgreSQL 11+.
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'a7c3e9d15b42'
+down_revision = 'f2b8c5a1d930'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    for table in ('products', 'sellers'):
+        op.add_column(table, sa.Column('rating_sum', sa.Float(), nullable=False, server_default='0'))
+        op.add_column(table, sa.Column('rating_count', sa.Integer(), nullable=False, server_default='0'))
+
+    op.execute(
+        "UPDATE products SET "
+        "rating_sum = (SELECT COALESCE(SUM(rating), 0) FROM reviews WHERE reviews.product_id = products.id), "
+        "rating_count = (SELECT COUNT(rating) FROM reviews WHERE reviews.product_id = products.id) "
+        "WHERE EXISTS (SELECT 1 FROM reviews WHERE reviews.product_id = products.id)"
+    )
+    op.execute(
+        "UPDATE sellers SET "
+        "rating_sum = (SELECT COALESCE(SUM(rating_sum), 0) FROM products WHERE products.seller_id = sellers.id), "
+        "rating_count = (SELECT COALESCE(SUM(rating_count), 0) FROM products WHERE products.seller_id = sellers.id)"
+    )
+
+
+def downgrade():
+    for table in ('sellers', 'products'):
+        op.drop_column(table, 'rating_count')
+        op.drop_column(table, 'rating_sum')
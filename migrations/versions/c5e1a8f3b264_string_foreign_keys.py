@@ -0,0 +1,67 @@
+"""Make foreign keys to string primary keys strings
+
+Revision ID: c5e1a8f3b264
+Revises: a7c3e9d15b42
+Create Date: 2026-10-18 10:00:00.000000
+
+products.seller_id, yaps.original_yap_id and likes.yap_id were created as
+integers although sellers.id and yaps.id are cuid strings. On PostgreSQL the
+existing values are cast in place. SQLite cannot change a column's type, so
+the tables are copied; the products copy loses the search index triggers,
+which are created again afterwards.
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c5e1a8f3b264'
+down_revision = 'a7c3e9d15b42'
+branch_labels = None
+depends_on = None
+
+
+# The search index triggers from f2b8c5a1d930, dropped along with the old products table
+SQLITE_TRIGGERS = [
+    "CREATE TRIGGER IF NOT EXISTS products_fts_insert AFTER INSERT ON products BEGIN "
+    "INSERT INTO products_fts (title, brand, description, product_id, category, price) "
+    "VALUES (new.title, new.brand, new.description, new.id, new.category, new.price); "
+    "END",
+    "CREATE TRIGGER IF NOT EXISTS products_fts_delete AFTER DELETE ON products BEGIN "
+    "DELETE FROM products_fts WHERE products_fts MATCH 'product_id:\"' || old.id || '\"'; "
+    "END",
+    "CREATE TRIGGER IF NOT EXISTS products_fts_update AFTER UPDATE OF id, title, brand, description, category, price ON products BEGIN "
+    "DELETE FROM products_fts WHERE products_fts MATCH 'product_id:\"' || old.id || '\"'; "
+    "INSERT INTO products_fts (title, brand, description, product_id, category, price) "
+    "VALUES (new.title, new.brand, new.description, new.id, new.category, new.price); "
+    "END",
+]
+
+COLUMNS = [
+    ('products', 'seller_id'),
+    ('yaps', 'original_yap_id'),
+    ('likes', 'yap_id'),
+]
+
+
+def _alter(type_, cast):
+    dialect = op.get_bind().dialect.name
+    for table, column in COLUMNS:
+        if dialect == 'sqlite':
+            with op.batch_alter_table(table) as batch:
+                batch.alter_column(column, type_=type_)
+        else:
+            op.alter_column(table, column, type_=type_, postgresql_using=f'{column}::{cast}')
+
+    if dialect == 'sqlite':
+        for statement in SQLITE_TRIGGERS:
+            op.execute(statement)
+
+
+def upgrade():
+    _alter(sa.String(), 'varchar')
+
+
+def downgrade():
+    # Fails if any row already holds a non-numeric id
+    _alter(sa.Integer(), 'integer')
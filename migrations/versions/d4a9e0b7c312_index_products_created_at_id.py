@@ -0,0 +1,27 @@
+"""Index products by (created_at, id) for the paginated catalog
+
+Revision ID: d4a9e0b7c312
+Revises: 8c1d4f6e2a57
+Create Date: 2026-10-17 18:30:00.000000
+
+GET /products pages newest first with a (created_at, id) keyset cursor.
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'd4a9e0b7c312'
+down_revision = '8c1d4f6e2a57'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.get_context().autocommit_block():
+        op.create_index('ix_products_created_at_id', 'products', ['created_at', 'id'], if_not_exists=True, postgresql_concurrently=True)
+
+
+def downgrade():
+    with op.get_context().autocommit_block():
+        op.drop_index('ix_products_created_at_id', table_name='products', if_exists=True, postgresql_concurrently=True)
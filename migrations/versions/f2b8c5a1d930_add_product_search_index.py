@@ -0,0 +1,74 @@
+"""Add the full-text product search index
+
+Revision ID: f2b8c5a1d930
+Revises: d4a9e0b7c312
+Create Date: 2026-10-17 19:00:00.000000
+
+SQLite gets an FTS5 table kept in sync by triggers, filled from the
+existing products. PostgreSQL gets a generated tsvector column and a GIN
+index; adding a stored generated column rewrites the products table.
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'f2b8c5a1d930'
+down_revision = 'd4a9e0b7c312'
+branch_labels = None
+depends_on = None
+
+
+SQLITE_UPGRADE = [
+    "CREATE VIRTUAL TABLE IF NOT EXISTS products_fts USING fts5("
+    "title, brand, description, product_id, category UNINDEXED, price UNINDEXED, "
+    "tokenize='unicode61 remove_diacritics 2')",
+    "CREATE TRIGGER IF NOT EXISTS products_fts_insert AFTER INSERT ON products BEGIN "
+    "INSERT INTO products_fts (title, brand, description, product_id, category, price) "
+    "VALUES (new.title, new.brand, new.description, new.id, new.category, new.price); "
+    "END",
+    "CREATE TRIGGER IF NOT EXISTS products_fts_delete AFTER DELETE ON products BEGIN "
+    "DELETE FROM products_fts WHERE products_fts MATCH 'product_id:\"' || old.id || '\"'; "
+    "END",
+    "CREATE TRIGGER IF NOT EXISTS products_fts_update AFTER UPDATE OF id, title, brand, description, category, price ON products BEGIN "
+    "DELETE FROM products_fts WHERE products_fts MATCH 'product_id:\"' || old.id || '\"'; "
+    "INSERT INTO products_fts (title, brand, description, product_id, category, price) "
+    "VALUES (new.title, new.brand, new.description, new.id, new.category, new.price); "
+    "END",
+    "DELETE FROM products_fts",
+    "INSERT INTO products_fts (title, brand, description, product_id, category, price) "
+    "SELECT title, brand, description, id, category, price FROM products",
+]
+SQLITE_DOWNGRADE = [
+    "DROP TRIGGER IF EXISTS products_fts_update",
+    "DROP TRIGGER IF EXISTS products_fts_delete",
+    "DROP TRIGGER IF EXISTS products_fts_insert",
+    "DROP TABLE IF EXISTS products_fts",
+]
+
+
+def upgrade():
+    dialect = op.get_bind().dialect.name
+    if dialect == 'sqlite':
+        for statement in SQLITE_UPGRADE:
+            op.execute(statement)
+    elif dialect == 'postgresql':
+        op.execute(
+            "ALTER TABLE products ADD COLUMN IF NOT EXISTS search_vector tsvector GENERATED ALWAYS AS ("
+            "setweight(to_tsvector('english', coalesce(title, '')), 'A') || "
+            "setweight(to_tsvector('english', coalesce(brand, '')), 'B') || "
+            "setweight(to_tsvector('english', coalesce(description, '')), 'C')) STORED"
+        )
+        with op.get_context().autocommit_block():
+            op.execute("CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_products_search_vector ON products USING gin (search_vector)")
+
+
+def downgrade():
+    dialect = op.get_bind().dialect.name
+    if dialect == 'sqlite':
+        for statement in SQLITE_DOWNGRADE:
+            op.execute(statement)
+    elif dialect == 'postgresql':
+        with op.get_context().autocommit_block():
+            op.execute("DROP INDEX CONCURRENTLY IF EXISTS ix_products_search_vector")
+        op.execute("ALTER TABLE products DROP COLUMN IF EXISTS search_vector")
@@ -1,8 +1,9 @@
 from flask_sqlalchemy import SQLAlchemy
-from sqlalchemy import MetaData, CheckConstraint
+from sqlalchemy import MetaData, CheckConstraint, event, select
 from datetime import datetime
 from sqlalchemy_serializer import SerializerMixin
 from sqlalchemy.orm import validates
+from sqlalchemy.orm.attributes import get_history
 from cuid import cuid
 
 # Define metadata with a naming convention for foreign keys
@@ -61,8 +62,11 @@ class Users(db.Model, SerializerMixin):
     def accept_friend_request(self, friend_id):
         friendship = Friendship.query.filter_by(user_id=friend_id, friend_id=self.id, status='pending').first()
         if friendship:
+            from services.friend_graph import friend_graph
+
             friendship.status = 'accepted'
             db.session.commit()
+            friend_graph.add_friendship(friend_id, self.id)
 
     # Method to get all friends
     def get_friends(self):
@@ -83,28 +87,21 @@ class Users(db.Model, SerializerMixin):
 
     # Method to calculate the number of mutual friends with each user
     def mutual_friends_with_users(self):
-        my_friends = self.get_friend_ids()
-        users = Users.query.filter(Users.id != self.id).all()  # Get all users except the current user
-        mutual_friends_count = {}
-
-        for user in users:
-            user_friends = user.get_friend_ids()
-            mutual_count = len(my_friends & user_friends)  # Intersection of two friend sets
-            mutual_friends_count[user] = mutual_count
+        from services.friend_graph import friend_graph
 
-        return mutual_friends_count
+        users = Users.query.filter(Users.id != self.id).all()  # Get all users except the current user
+        counts = friend_graph.mutual_counts(self.id, [user.id for user in users])
+        return {user: counts[user.id] for user in users}
 
     # Method to recommend mutual friends
     def recommend_mutual_friends(self):
-        friends = self.get_friends()
-        mutual_friends = {}
-        for friend in friends:
-            for mutual_friend in friend.get_friends():
-                if mutual_friend != self and mutual_friend not in friends:
-                    mutual_friends[mutual_friend] = mutual_friends.get(mutual_friend, 0) + 1
+        from services.friend_graph import recommend_friends
+
+        ranked = recommend_friends(self.id)
+        users = {user.id: user for user in Users.query.filter(Users.id.in_([user_id for user_id, _ in ranked])).all()}
 
-        # Sort mutual friends by the number of mutual connections
-        return sorted(mutual_friends.items(), key=lambda x: x[1], reverse=True)
+        # Sorted by the number of mutual connections
+        return [(users[user_id], count) for user_id, count in ranked if user_id in users]
     
     @validates('username')
     def validate_username(self, key, username):
@@ -129,6 +126,8 @@ class Friendship(db.Model):
     # Unique constraint to prevent duplicate friendship entries
     __table_args__ = (
         db.UniqueConstraint('user_id', 'friend_id', name='unique_friendship'),
+        # Incoming requests and reverse lookups; user_id is covered by the unique constraint
+        db.Index('ix_friendships_friend_id_status', 'friend_id', 'status'),
     )
 
     # Backref for accessing both directions of a friendship
@@ -144,6 +143,8 @@ class ChatMedia(db.Model):
     message_id = db.Column(db.Integer, db.ForeignKey('messages.id'), nullable=False)
     created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
 
+    __table_args__ = (db.Index('ix_chat_media_message_id', 'message_id'),)
+
 class Message(db.Model):
     __tablename__ = 'messages'
     id = db.Column(db.Integer, primary_key=True)
@@ -158,6 +159,9 @@ class Message(db.Model):
     reactions = db.relationship('Reaction', backref='message', lazy=True)
     media = db.relationship('ChatMedia', backref='message', lazy=True)
 
+    # A user's messages, newest first
+    __table_args__ = (db.Index('ix_messages_user_id_timestamp', 'user_id', 'timestamp'),)
+
 class Reaction(db.Model):
     __tablename__ = 'reactions'
     id = db.Column(db.Integer, primary_key=True)
@@ -191,6 +195,12 @@ class Events(db.Model, SerializerMixin):
     updated_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow, onupdate=datetime.utcnow)
     user_id = db.Column(db.Integer, db.ForeignKey('users.id'))
     comments = db.relationship('Comment_events', backref='event', lazy=True)
+
+    __table_args__ = (
+        db.Index('ix_events_category_date_of_event', 'category', 'date_of_event'),
+        db.Index('ix_events_date_of_event', 'date_of_event'),
+        db.Index('ix_events_user_id', 'user_id'),
+    )
     
 class Products(db.Model, SerializerMixin):
     __tablename__ = 'products'
@@ -204,7 +214,7 @@ class Products(db.Model, SerializerMixin):
     category = db.Column(db.String(50))
     created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
     updated_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow, onupdate=datetime.utcnow)
-    seller_id = db.Column(db.Integer, db.ForeignKey('sellers.id'))
+    seller_id = db.Column(db.String, db.ForeignKey('sellers.id'))
 
     # Other relationships
     reviews = db.relationship('Reviews', backref='product', lazy=True)
@@ -216,11 +226,23 @@ class Products(db.Model, SerializerMixin):
     order_items = db.relationship('OrderItem', backref='product', lazy=True, cascade='all, delete-orphan')
 
     total_sales = db.Column(db.Integer, default=0)  
+
+    # Denormalized rating aggregates, kept in sync by the listeners at the bottom of this module
+    rating_sum = db.Column(db.Float, nullable=False, default=0, server_default='0')
+    rating_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+
+    __table_args__ = (
+        # Keyset pagination of the catalog orders by (created_at, id)
+        db.Index('ix_products_created_at_id', 'created_at', 'id'),
+        db.Index('ix_products_category_created_at', 'category', 'created_at'),
+        db.Index('ix_products_seller_id', 'seller_id'),
+    )
+
     # Method to get the average rating of the product
     def average_rating(self):
-        if len(self.reviews) == 0:
+        if not self.rating_count:
             return None
-        return sum([review.rating for review in self.reviews]) / len(self.reviews)
+        return self.rating_sum / self.rating_count
     def to_dict(self):
         return {
             'id': self.id,
@@ -242,6 +264,8 @@ class ProductImages(db.Model):
     image_url = db.Column(db.String(255), nullable=False)
     product_id = db.Column(db.String, db.ForeignKey('products.id'))   
 
+    __table_args__ = (db.Index('ix_product_images_product_id', 'product_id'),)
+
 class ProductVariation(db.Model, SerializerMixin):
     __tablename__ = 'product_variations'
 
@@ -258,6 +282,8 @@ class ProductVariation(db.Model, SerializerMixin):
     # Relationship back to the product
     product = db.relationship('Products', back_populates='variations')  # Ensure bidirectional relationship
 
+    __table_args__ = (db.Index('ix_product_variations_product_id', 'product_id'),)
+
 class Seller(db.Model):
     __tablename__ = 'sellers'
     
@@ -272,6 +298,10 @@ class Seller(db.Model):
     created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)  
     products = db.relationship('Products', backref='seller', lazy=True)
 
+    # Totals of the products' rating aggregates, kept in sync by the listeners at the bottom of this module
+    rating_sum = db.Column(db.Float, nullable=False, default=0, server_default='0')
+    rating_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+
 
     # Method to get total sales across seller's products
     def total_sales(self):
@@ -281,6 +311,12 @@ class Seller(db.Model):
     def product_count(self):
         return len(self.products)   
 
+    # Method to get the average rating across the seller's products
+    def average_rating(self):
+        if not self.rating_count:
+            return None
+        return self.rating_sum / self.rating_count
+
 class Cart(db.Model):
     __tablename__ = 'cart'
     
@@ -291,6 +327,8 @@ class Cart(db.Model):
     # Relationship to store the items in the cart
     cart_items = db.relationship('CartItem', backref='cart', lazy=True, cascade='all, delete-orphan')
 
+    __table_args__ = (db.Index('ix_cart_user_id', 'user_id'),)
+
     # Method to calculate total cart price
     def total_price(self):
         return sum([item.total_item_price() for item in self.cart_items])
@@ -309,6 +347,8 @@ class CartItem(db.Model):
     product = db.relationship('Products', back_populates='cart_items', lazy=True)
     product_variation = db.relationship('ProductVariation', backref='cart_items', lazy=True)
 
+    __table_args__ = (db.Index('ix_cart_items_cart_id_product_id', 'cart_id', 'product_id'),)
+
     # Method to calculate the total price for this CartItem
     def total_item_price(self):
         if self.product_variation:  # Use variation price if it exists
@@ -340,6 +380,9 @@ class Order(db.Model):
     # Relationship to store the items in the order (copied from the cart)
     order_items = db.relationship('OrderItem', backref='order', lazy=True, cascade='all, delete-orphan')
 
+    # A user's orders, latest first
+    __table_args__ = (db.Index('ix_orders_user_id_created_at', 'user_id', 'created_at'),)
+
     # Method to calculate the total order price from its items
     def calculate_total(self):
         return sum([item.total_item_price() for item in self.order_items])
@@ -366,12 +409,17 @@ class Yap(db.Model):
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     location = db.Column(db.String, nullable=True)
+
+    # Denormalized counters, kept in sync by the listeners at the bottom of this module
+    like_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    reply_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    retweet_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
     
     # Foreign key to user
     user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
 
     # Retweet reference
-    original_yap_id = db.Column(db.Integer, db.ForeignKey('yaps.id'))
+    original_yap_id = db.Column(db.String, db.ForeignKey('yaps.id'))
     retweets = db.relationship('Yap', backref=db.backref('original_yap', remote_side=[id]), lazy=True)
     
     # Relationships
@@ -380,6 +428,15 @@ class Yap(db.Model):
     hashtags = db.relationship('YapHashtag', backref='yap', lazy=True)
     media = db.relationship('YapMedia', backref='yap', lazy=True)  # Relationship to multiple media files
 
+    # Keyset pagination of the timeline orders by (created_at, id)
+    __table_args__ = (
+        db.Index('ix_yaps_created_at_id', 'created_at', 'id'),
+        # A user's yaps, newest first, and timeline backfill per author
+        db.Index('ix_yaps_user_id_created_at', 'user_id', 'created_at'),
+        # Retweet counts in reconcile_yap_counters
+        db.Index('ix_yaps_original_yap_id', 'original_yap_id'),
+    )
+
     def __repr__(self):
         return f"<Yap {self.id} by {self.user.username}>"
 
@@ -406,6 +463,7 @@ class Reply(db.Model):
 
     media = db.relationship('YapReplyMedia', backref='reply', lazy=True)  # Relationship to multiple media files
 
+    __table_args__ = (db.Index('ix_replies_yap_id_created_at', 'yap_id', 'created_at'),)
 
     def __repr__(self):
         return f"<Reply {self.id} by {self.user.username}>"
@@ -436,6 +494,8 @@ class Follow(db.Model):
 
     __table_args__ = (
         db.UniqueConstraint('follower_id', 'following_id', name='uq_follower_following'),
+        # Fan-out to an author's followers
+        db.Index('ix_follows_following_id', 'following_id'),
     )
 
     def __repr__(self):
@@ -499,6 +559,9 @@ class Notification(db.Model):
     is_read = db.Column(db.Boolean, default=False)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
 
+    # Unread notifications for a user, newest first
+    __table_args__ = (db.Index('ix_notifications_recipient_id_is_read_created_at', 'recipient_id', 'is_read', 'created_at'),)
+
     def __repr__(self):
         return f"<Notification to {self.recipient.username} - {self.type}>"  
 
@@ -515,8 +578,51 @@ class YapMedia(db.Model):
     # Media type (can be 'image' or 'video')
     media_type = db.Column(db.String(10), nullable=False)  # e.g., 'image' or 'video'
 
+    __table_args__ = (db.Index('ix_yapmedia_yap_id', 'yap_id'),)
+
     def __repr__(self):
-        return f"<Media {self.media_type} for Yap {self.yap_id}>"          
+        return f"<Media {self.media_type} for Yap {self.yap_id}>"
+
+
+# Resized copy of an uploaded image (yap media, product images, avatars, event images)
+class MediaVariant(db.Model):
+    __tablename__ = 'media_variants'
+
+    id = db.Column(db.Integer, primary_key=True)
+
+    # URL of the original upload, as stored on the owning row
+    source_url = db.Column(db.String(255), nullable=False)
+    url = db.Column(db.String(255), nullable=False)
+    width = db.Column(db.Integer, nullable=False)
+    height = db.Column(db.Integer, nullable=False)
+    format = db.Column(db.String(10), nullable=False)  # e.g., 'webp' or 'avif'
+    size = db.Column(db.Integer, nullable=False)  # bytes
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    # The unique constraint also serves lookups by source_url
+    __table_args__ = (db.UniqueConstraint('source_url', 'width', 'format', name='uq_media_variants_source_width_format'),)
+
+    def __repr__(self):
+        return f"<MediaVariant {self.width}w {self.format} of {self.source_url}>"
+
+
+# Content-addressed media object, shared by every row whose URL points at it
+class MediaBlob(db.Model):
+    __tablename__ = 'media_blobs'
+
+    key = db.Column(db.String(255), primary_key=True)  # media/<sha256[:2]>/<sha256>.<ext>
+    sha256 = db.Column(db.String(64), nullable=False)
+    size = db.Column(db.Integer, nullable=False)  # bytes
+    content_type = db.Column(db.String(100), nullable=True)
+
+    # Number of rows referencing the blob, kept in sync by the listeners below
+    ref_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    # Bumped on every upload of the same content; unreferenced blobs are only collected once this is old
+    last_uploaded_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+
+    def __repr__(self):
+        return f"<MediaBlob {self.key} refs={self.ref_count}>"
 
 
 # Like model (likes for yaps and replies)
@@ -527,9 +633,11 @@ class Like(db.Model):
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
     
-    yap_id = db.Column(db.Integer, db.ForeignKey('yaps.id'), nullable=True)
+    yap_id = db.Column(db.String, db.ForeignKey('yaps.id'), nullable=True)
     reply_id = db.Column(db.Integer, db.ForeignKey('replies.id'), nullable=True)
 
+    __table_args__ = (db.Index('ix_likes_yap_id_user_id', 'yap_id', 'user_id'),)
+
     def __repr__(self):
         return f"<Like by {self.user.username}>"
 
@@ -543,6 +651,8 @@ class Comment_events(db.Model, SerializerMixin):
     user_id = db.Column(db.Integer, db.ForeignKey('users.id'))
     event_id = db.Column(db.String, db.ForeignKey('events.id'))
 
+    __table_args__ = (db.Index('ix_comment_events_event_id', 'event_id'),)
+
 
 class Reviews(db.Model, SerializerMixin):
     __tablename__ = 'reviews'
@@ -555,6 +665,8 @@ class Reviews(db.Model, SerializerMixin):
     user_id = db.Column(db.Integer, db.ForeignKey('users.id'))
     product_id = db.Column(db.String, db.ForeignKey('products.id'))
 
+    __table_args__ = (db.Index('ix_reviews_product_id', 'product_id'),)
+
 
 class Wishlists(db.Model, SerializerMixin):
     __tablename__ = 'wishlists'
@@ -573,6 +685,171 @@ class TokenBlocklist(db.Model):
     jti =  db.Column(db.String(100),nullable=True)
     created_at = db.Column(db.DateTime(), default=datetime.utcnow)
 
+    __table_args__ = (db.Index('ix_token_blocklist_jti', 'jti'),)
+
+
+
+# Keep Yap counters in sync. The UPDATE runs on the flush connection, so it
+# commits or rolls back together with the like/reply/retweet row.
+def _bump_yap_counter(connection, yap_id, column, delta):
+    if yap_id is None:
+        return
+    yaps = Yap.__table__
+    # updated_at is passed through so a counter change does not trigger its onupdate
+    connection.execute(
+        yaps.update().where(yaps.c.id == yap_id).values({column: yaps.c[column] + delta, 'updated_at': yaps.c.updated_at})
+    )
+
+
+@event.listens_for(Like, 'after_insert')
+def _like_inserted(mapper, connection, target):
+    _bump_yap_counter(connection, target.yap_id, 'like_count', 1)
+
+
+@event.listens_for(Like, 'after_delete')
+def _like_deleted(mapper, connection, target):
+    _bump_yap_counter(connection, target.yap_id, 'like_count', -1)
+
+
+@event.listens_for(Reply, 'after_insert')
+def _reply_inserted(mapper, connection, target):
+    _bump_yap_counter(connection, target.yap_id, 'reply_count', 1)
+
+
+@event.listens_for(Reply, 'after_delete')
+def _reply_deleted(mapper, connection, target):
+    _bump_yap_counter(connection, target.yap_id, 'reply_count', -1)
+
+
+@event.listens_for(Yap, 'after_insert')
+def _retweet_inserted(mapper, connection, target):
+    _bump_yap_counter(connection, target.original_yap_id, 'retweet_count', 1)
+
+
+@event.listens_for(Yap, 'after_delete')
+def _retweet_deleted(mapper, connection, target):
+    _bump_yap_counter(connection, target.original_yap_id, 'retweet_count', -1)
+
+
+# Keep the rating aggregates on products and their sellers in sync with
+# reviews. Like the counters above, the UPDATEs commit or roll back with the
+# review. Reviews without a rating are not counted, as with AVG().
+def _bump_rating(connection, product_id, rating, delta):
+    if product_id is None or rating is None:
+        return
+    products = Products.__table__
+    sellers = Seller.__table__
+    connection.execute(
+        products.update().where(products.c.id == product_id).values(
+            rating_sum=products.c.rating_sum + rating * delta,
+            rating_count=products.c.rating_count + delta,
+            updated_at=products.c.updated_at,
+        )
+    )
+    seller_id = select(products.c.seller_id).where(products.c.id == product_id).scalar_subquery()
+    connection.execute(
+        sellers.update().where(sellers.c.id == seller_id).values(
+            rating_sum=sellers.c.rating_sum + rating * delta,
+            rating_count=sellers.c.rating_count + delta,
+        )
+    )
+
+
+@event.listens_for(Reviews, 'after_insert')
+def _review_inserted(mapper, connection, target):
+    _bump_rating(connection, target.product_id, target.rating, 1)
+
+
+@event.listens_for(Reviews, 'after_update')
+def _review_updated(mapper, connection, target):
+    rating = get_history(target, 'rating')
+    product_id = get_history(target, 'product_id')
+    if not rating.has_changes() and not product_id.has_changes():
+        return
+    old_rating = rating.deleted[0] if rating.deleted else target.rating
+    old_product_id = product_id.deleted[0] if product_id.deleted else target.product_id
+    _bump_rating(connection, old_product_id, old_rating, -1)
+    _bump_rating(connection, target.product_id, target.rating, 1)
+
+
+@event.listens_for(Reviews, 'after_delete')
+def _review_deleted(mapper, connection, target):
+    _bump_rating(connection, target.product_id, target.rating, -1)
+
+
+def _move_seller_rating(connection, seller_id, rating_sum, rating_count, delta):
+    if seller_id is None or not rating_count:
+        return
+    sellers = Seller.__table__
+    connection.execute(
+        sellers.update().where(sellers.c.id == seller_id).values(
+            rating_sum=sellers.c.rating_sum + rating_sum * delta,
+            rating_count=sellers.c.rating_count + rating_count * delta,
+        )
+    )
+
+
+@event.listens_for(Products, 'after_update')
+def _product_seller_changed(mapper, connection, target):
+    history = get_history(target, 'seller_id')
+    if history.has_changes():
+        for seller_id in history.deleted:
+            _move_seller_rating(connection, seller_id, target.rating_sum, target.rating_count, -1)
+        _move_seller_rating(connection, target.seller_id, target.rating_sum, target.rating_count, 1)
+
+
+# No after_delete for Products: deleting one sets its reviews' product_id to
+# NULL first, and _review_updated takes each rating off the seller then.
+
+
+# Keep MediaBlob reference counts in sync with the rows that store media URLs.
+# Like the counters above, the UPDATE commits or rolls back with the row.
+def _bump_media_refs(connection, urls, delta):
+    urls = [url for url in urls if url]
+    if not urls:
+        # Most flushes carry no media; skip building the storage client for them
+        return
+    from services.storage import get_storage
+
+    storage = get_storage()
+    keys = [key for key in (storage.key_for_url(url) for url in urls) if key]
+    if not keys:
+        return
+    blobs = MediaBlob.__table__
+    for key in keys:
+        connection.execute(
+            blobs.update().where(blobs.c.key == key).values(ref_count=blobs.c.ref_count + delta)
+        )
+
+
+def _track_media_refs(model, column):
+    @event.listens_for(model, 'after_insert')
+    def media_ref_inserted(mapper, connection, target):
+        _bump_media_refs(connection, [getattr(target, column)], 1)
+
+    @event.listens_for(model, 'after_update')
+    def media_ref_updated(mapper, connection, target):
+        history = get_history(target, column)
+        if history.has_changes():
+            _bump_media_refs(connection, history.added, 1)
+            _bump_media_refs(connection, history.deleted, -1)
+
+    @event.listens_for(model, 'after_delete')
+    def media_ref_deleted(mapper, connection, target):
+        _bump_media_refs(connection, [getattr(target, column)], -1)
+
+
+MEDIA_URL_COLUMNS = (
+    (YapMedia, 'media_url'),
+    (ProductImages, 'image_url'),
+    (Events, 'image_url'),
+    (Users, 'avatar'),
+    (Seller, 'avatar'),
+    (ChatMedia, 'media_url'),
+)
+
+for _model, _column in MEDIA_URL_COLUMNS:
+    _track_media_refs(_model, _column)
 
 
 # Serialization rules
@@ -1,5 +1,6 @@
 from app import db, create_app  # Import your app's create_app function
 from models import Products, ProductImages, ProductVariation
+from services.bulk_load import load_tables
 from datetime import datetime
 import random
 import cuid
@@ -123,44 +124,37 @@ def seed_products():
     }
     ]
 
+    # Product ids are assigned here so image and variation rows can refer to them
+    products, images, variations = [], [], []
+    now = datetime.utcnow()
     for product_data in products_data:
-        # Create Product
-        product = Products(
-            id=cuid.cuid(),
-            title=product_data['title'],
-            description=product_data['description'],
-            contact_info=product_data['contact_info'],
-            brand=product_data['brand'],
-            price=product_data['price'],
-            category=product_data['category'],
-            seller_id=product_data['seller_id'],
-            total_sales=product_data['total_sales'],
-            created_at=datetime.utcnow(),
-            updated_at=datetime.utcnow(),
-        )
+        product_id = cuid.cuid()
+        products.append({
+            'id': product_id,
+            'title': product_data['title'],
+            'description': product_data['description'],
+            'contact_info': product_data['contact_info'],
+            'brand': product_data['brand'],
+            'price': product_data['price'],
+            'category': product_data['category'],
+            'seller_id': product_data['seller_id'],
+            'total_sales': product_data['total_sales'],
+            'created_at': now,
+            'updated_at': now,
+        })
+        images.extend({'product_id': product_id, 'image_url': image_url} for image_url in product_data['images'])
+        variations.extend({
+            'id': cuid.cuid(),
+            'product_id': product_id,
+            'variation_name': variation_data['name'],
+            'variation_value': variation_data['value'],
+            'price': variation_data['price'],
+            'stock': variation_data['stock'],
+            'created_at': now,
+            'updated_at': now,
+        } for variation_data in product_data['variations'])
 
-        # Add product images
-        for image_url in product_data['images']:
-            product_image = ProductImages(image_url=image_url, product=product)
-            db.session.add(product_image)
-
-        # Add product variations
-        for variation_data in product_data['variations']:
-            variation = ProductVariation(
-                product=product,
-                variation_name=variation_data['name'],
-                variation_value=variation_data['value'],
-                price=variation_data['price'],
-                stock=variation_data['stock'],
-                created_at=datetime.utcnow(),
-                updated_at=datetime.utcnow(),
-            )
-            db.session.add(variation)
-
-        db.session.add(product)
-
-    # Commit to the database
-    db.session.commit()
+    load_tables([(Products, products), (ProductImages, images), (ProductVariation, variations)])
 
     print("Database seeded successfully with Bleach-inspired products!")
 
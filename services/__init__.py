@@ -0,0 +1,12 @@
+from flask import current_app
+
+
+def get_redis():
+    """
+    Return the Redis client created in create_app, or None when running
+    outside an app context (scripts, benchmarks) or before it was attached.
+    """
+    try:
+        return current_app.extensions.get('redis')
+    except RuntimeError:
+        return None
@@ -0,0 +1,582 @@
+from bisect import bisect_left, insort
+from collections import Counter
+import heapq
+import json
+import os
+import re
+import threading
+import time
+import unicodedata
+import uuid
+from flask import current_app
+from sqlalchemy import event, func, inspect
+from sqlalchemy.orm import Session
+from models import db, Products, Users, Hashtag, YapHashtag, Follow
+from . import get_redis
+from .pubsub import Subscriber, publish
+
+CHANGED_CHANNEL = 'autocomplete:changed'
+KINDS = ('products', 'brands', 'users', 'hashtags')
+# Full rebuild this often in the background, picking up writes that bypass
+# the ORM (bulk loads, raw SQL) and changes missed while Redis was down.
+REBUILD_SECONDS = int(os.getenv('AUTOCOMPLETE_REBUILD_SECONDS', 900))
+# Terms shorter than this are only matched as typed
+FUZZY_MIN_LENGTH = 4
+# Typos allowed per term: one from FUZZY_MIN_LENGTH letters, two from this many
+TWO_TYPOS_MIN_LENGTH = 8
+
+# Relevance of a term match; fuzzy matches lose FUZZY_PENALTY per typo
+EXACT_SCORE = 1.0
+PREFIX_SCORE = 0.9
+FUZZY_SCORE = 0.8
+FUZZY_PENALTY = 0.1
+# Most distinct vocabulary tokens checked by edit distance for one mistyped term
+FUZZY_CANDIDATES = 64
+FUZZY_COMMON_GRAM_TOKENS = 1000
+# Prefixes matching more vocabulary tokens than this are answered from a kept
+# list of their heaviest entries instead of merging every posting list
+WIDE_PREFIX_TOKENS = 256
+WIDE_PREFIX_DEPTH = 32
+
+# Columns whose changes are worth re-indexing, per model
+INDEXED_FIELDS = {
+    Products: ('title', 'brand', 'total_sales'),
+    Users: ('username', 'first_name', 'last_name', 'display_name', 'avatar'),
+    Hashtag: ('name',),
+}
+
+
+def normalize(text):
+    """Lowercase word tokens with accents removed: 'Café Noir' -> ['cafe', 'noir']."""
+    decomposed = unicodedata.normalize('NFKD', text or '')
+    return re.findall(r'\w+', ''.join(c for c in decomposed if not unicodedata.combining(c)).lower())
+
+
+def _grams(token, prefix=False):
+    padded = f'^{token}' if prefix else f'^{token}$'
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+def _distance(a, b, limit, prefix=False):
+    """
+    Optimal string alignment distance between a and b, or between a and the
+    closest prefix of b; limit + 1 once it is certain to exceed limit.
+    """
+    if prefix:
+        b = b[:len(a) + limit]
+        if len(b) < len(a) - limit:
+            return limit + 1
+    elif abs(len(a) - len(b)) > limit:
+        return limit + 1
+    # Only cells within limit of the diagonal can stay within limit
+    outside = limit + 1
+    previous2, previous = None, [j if j <= limit else outside for j in range(len(b) + 1)]
+    for i in range(1, len(a) + 1):
+        current = [i if i <= limit else outside] + [outside] * len(b)
+        for j in range(max(1, i - limit), min(len(b), i + limit) + 1):
+            cost = a[i - 1] != b[j - 1]
+            value = min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + cost)
+            if i > 1 and j > 1 and a[i - 1] == b[j - 2] and a[i - 2] == b[j - 1]:
+                value = min(value, previous2[j - 2] + 1)
+            current[j] = min(value, outside)
+        if min(current) > limit:
+            return outside
+        previous2, previous = previous, current
+    return min(previous) if prefix else previous[-1]
+
+
+class TermIndex:
+    """
+    Prefix and typo-tolerant lookup over the entries of one kind.
+
+    Every entry is split into word tokens. Each token has a posting list of
+    (-weight, key) kept sorted, so the heaviest matches come first without
+    sorting at query time. Tokens are kept in a sorted vocabulary for prefix
+    ranges, and in a trigram index for typo candidates, which are then
+    confirmed by edit distance. Prefixes covering many tokens (one or two
+    letters typed) keep a list of their heaviest entries, updated on add.
+    """
+
+    def __init__(self, entries=()):
+        self._entries = {}  # key -> (weight, tokens, data)
+        self._postings = {}  # token -> sorted [(-weight, key)]
+        self._grams = {}  # trigram -> {token}
+        self._wide = {}  # prefix -> heaviest [(-weight, key)], filled on first use
+        for key, text, weight, data in entries:
+            tokens = frozenset(normalize(text))
+            self._entries[key] = (weight, tokens, data)
+            for token in tokens:
+                self._postings.setdefault(token, []).append((-weight, key))
+        for token, posting in self._postings.items():
+            posting.sort()
+            for gram in _grams(token):
+                self._grams.setdefault(gram, set()).add(token)
+        self._vocabulary = sorted(self._postings)
+        self._fill_wide()
+
+    def _fill_wide(self):
+        # Heaviest entries of every wide prefix in one pass over the entries,
+        # so the first one or two letters typed never merge thousands of lists
+        length, wide = 1, set()
+        while True:
+            counts = Counter(token[:length] for token in self._vocabulary if len(token) >= length)
+            found = {prefix for prefix, count in counts.items() if count > WIDE_PREFIX_TOKENS}
+            if not found:
+                break
+            wide |= found
+            length += 1
+        if not wide:
+            return
+        self._wide = {prefix: [] for prefix in wide}
+        for key, (weight, tokens, _) in sorted(self._entries.items(), key=lambda item: (-item[1][0], item[0])):
+            for prefix in {token[:length] for token in tokens for length in range(1, len(token) + 1)} & wide:
+                top = self._wide[prefix]
+                if len(top) < WIDE_PREFIX_DEPTH:
+                    top.append((-weight, key))
+        for top in self._wide.values():
+            top.sort()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key):
+        entry = self._entries.get(key)
+        return entry[2] if entry is not None else None
+
+    def add(self, key, text, weight, data):
+        self.remove(key)
+        tokens = frozenset(normalize(text))
+        self._entries[key] = (weight, tokens, data)
+        item = (-weight, key)
+        for token in tokens:
+            posting = self._postings.get(token)
+            if posting is None:
+                posting = self._postings[token] = []
+                insort(self._vocabulary, token)
+                for gram in _grams(token):
+                    self._grams.setdefault(gram, set()).add(token)
+            insort(posting, item)
+        for prefix in self._wide_prefixes(tokens):
+            top = self._wide[prefix]
+            # A list shorter than WIDE_PREFIX_DEPTH holds every matching entry
+            if item not in top and (len(top) < WIDE_PREFIX_DEPTH or item < top[-1]):
+                insort(top, item)
+                del top[WIDE_PREFIX_DEPTH:]
+
+    def remove(self, key):
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return
+        weight, tokens, _ = entry
+        for token in tokens:
+            posting = self._postings[token]
+            del posting[bisect_left(posting, (-weight, key))]
+            if not posting:
+                del self._postings[token]
+                del self._vocabulary[bisect_left(self._vocabulary, token)]
+                for gram in _grams(token):
+                    self._grams[gram].discard(token)
+        # The next entry in line is not known; recompute these on next use
+        for prefix in self._wide_prefixes(tokens):
+            if (-weight, key) in self._wide[prefix]:
+                del self._wide[prefix]
+
+    def _wide_prefixes(self, tokens):
+        return {token[:length] for token in tokens for length in range(1, len(token) + 1)} & self._wide.keys()
+
+    # Queries
+
+    def _range(self, prefix):
+        """(start, end) of the vocabulary tokens starting with prefix."""
+        return bisect_left(self._vocabulary, prefix), bisect_left(self._vocabulary, prefix + '\U0010ffff')
+
+    def _fuzzy(self, term, prefix):
+        """{token: score} of vocabulary tokens within the typo budget of term."""
+        if len(term) < FUZZY_MIN_LENGTH:
+            return {}
+        limit = 2 if len(term) >= TWO_TYPOS_MIN_LENGTH else 1
+        grams = _grams(term, prefix)
+        # One typo breaks at most four trigrams (a transposition touches two letters)
+        needed = max(1, len(grams) - 4 * limit)
+        # Trigrams common to thousands of tokens ("^jo", "son") say little and
+        # cost the most to count; leave them out while rarer ones remain
+        rare = [gram for gram in grams if len(self._grams.get(gram, ())) <= FUZZY_COMMON_GRAM_TOKENS]
+        if rare:
+            needed = max(1, needed - (len(grams) - len(rare)))
+            grams = rare
+        shared = Counter()
+        for gram in grams:
+            shared.update(self._grams.get(gram, ()))
+
+        # Tokens sharing the most trigrams first, stopping below the first that
+        # match or after FUZZY_CANDIDATES distinct comparisons
+        matches, distances, matched_count = {}, {}, None
+        for token, count in shared.most_common(4 * FUZZY_CANDIDATES):
+            if count < needed or (matched_count is not None and count < matched_count):
+                break
+            compared = token[:len(term) + limit] if prefix else token
+            distance = distances.get(compared)
+            if distance is None:
+                if len(distances) == FUZZY_CANDIDATES:
+                    break
+                distance = distances[compared] = _distance(term, compared, limit, prefix)
+            if distance <= limit:
+                matches[token] = FUZZY_SCORE - FUZZY_PENALTY * (distance - 1)
+                matched_count = count if matched_count is None else matched_count
+        return matches
+
+    def _expand(self, term, prefix=False):
+        """{token: score} for a whole-word term: the word itself, else the words it may be a typo of."""
+        if term in self._postings:
+            return {term: EXACT_SCORE}
+        return self._fuzzy(term, prefix)
+
+    def _heaviest(self, streams, limit):
+        """The first limit distinct (-weight, key) items from streams of posting items."""
+        items, seen = [], set()
+        for stream in streams:
+            for item in stream:
+                if item[1] not in seen:
+                    seen.add(item[1])
+                    items.append(item)
+                    if len(items) == limit:
+                        return items
+        return items
+
+    def _completions(self, prefix, start, end, limit):
+        # The word exactly as typed first, then everything it begins, heaviest first
+        streams = [self._postings[prefix]] if prefix in self._postings else []
+        if end - start > WIDE_PREFIX_TOKENS and limit <= WIDE_PREFIX_DEPTH:
+            top = self._wide.get(prefix)
+            if top is None:
+                tokens = self._vocabulary[start:end]
+                top = self._wide[prefix] = self._heaviest([heapq.merge(*(self._postings[token] for token in tokens))], WIDE_PREFIX_DEPTH)
+            streams.append(top)
+        else:
+            streams.append(heapq.merge(*(self._postings[token] for token in self._vocabulary[start:end])))
+        return self._heaviest(streams, limit)
+
+    def _ranked(self, expansions, prefix, limit):
+        """Entries matching every expansion (and a token starting with prefix), best score then heaviest first."""
+        # Candidates from the most selective term, checked against the others
+        driver = min(expansions, key=lambda tokens: sum(len(self._postings[token]) for token in tokens))
+        candidates = {key for token in driver for _, key in self._postings[token]}
+        scored = []
+        for key in candidates:
+            weight, entry_tokens, _ = self._entries[key]
+            score = 0.0
+            for tokens in expansions:
+                term_score = 0.0
+                for token in entry_tokens:
+                    if tokens.get(token, 0.0) > term_score:
+                        term_score = tokens[token]
+                if not term_score:
+                    break
+                score += term_score
+            else:
+                if prefix is not None:
+                    term_score = 0.0
+                    for token in entry_tokens:
+                        if token == prefix:
+                            term_score = EXACT_SCORE
+                        elif token.startswith(prefix) and not term_score:
+                            term_score = PREFIX_SCORE
+                    if not term_score:
+                        continue
+                    score += term_score
+                scored.append((-score, -weight, key))
+        return [(-weight, key) for _, weight, key in heapq.nsmallest(limit, scored)]
+
+    def search(self, terms, last_is_prefix, limit):
+        """Data of the best entries matching every term, heaviest first among equally good matches."""
+        if not terms:
+            return []
+        expansions = [self._expand(term) for term in terms[:-1]]
+        last = terms[-1]
+        start, end = self._range(last) if last_is_prefix else (0, 0)
+        if start == end:
+            # Nothing begins with it, or the word is finished: match it whole, allowing typos
+            expansions.append(self._expand(last, prefix=last_is_prefix))
+            last = None
+        if not all(expansions):
+            return []
+
+        if not expansions:
+            items = self._completions(last, start, end, limit)
+        elif len(expansions) == 1 and last is None:
+            # Posting lists are already in weight order; merge them a score at a time
+            tokens = expansions[0]
+            items = self._heaviest([
+                heapq.merge(*(self._postings[token] for token, token_score in tokens.items() if token_score == score))
+                for score in sorted(set(tokens.values()), reverse=True)
+            ], limit)
+        else:
+            items = self._ranked(expansions, last, limit)
+        return [self._entries[key][2] for _, key in items]
+
+
+def _product_entry(product_id, title, brand, total_sales):
+    data = {'id': product_id, 'title': title, 'brand': brand}
+    return product_id, ' '.join(filter(None, [title, brand])), total_sales or 0, data
+
+
+def _user_entry(user_id, username, first_name, last_name, display_name, avatar, followers=0):
+    name = display_name or ' '.join(filter(None, [first_name, last_name]))
+    data = {'id': user_id, 'username': username, 'name': name, 'avatar': avatar, 'followers': followers}
+    text = ' '.join(filter(None, [username, first_name, last_name, display_name]))
+    return user_id, text, followers, data
+
+
+def _hashtag_entry(hashtag_id, name, yaps=0):
+    return hashtag_id, name.lstrip('#'), yaps, {'id': hashtag_id, 'name': name, 'yaps': yaps}
+
+
+def _brand_key(brand):
+    return ' '.join(normalize(brand))
+
+
+class Autocomplete:
+    """
+    Per-worker suggestions for the search box, served from memory.
+
+    Products (title and brand), brands, users (username and names) and
+    hashtags are loaded with a handful of queries in the background, when the
+    worker starts or on first use; until then suggestions are empty. Committed
+    ORM writes to those models are applied in place by the session hooks
+    below and broadcast over Redis pub/sub, so other workers apply them too.
+    A full rebuild runs in the background every REBUILD_SECONDS, and after
+    the subscriber reconnects, while the old index keeps answering.
+    """
+
+    def __init__(self):
+        self._indexes = None
+        self._brand_counts = Counter()  # brand key -> products
+        self._built_at = 0.0
+        self._needs_rebuild = False
+        self._rebuilding = False
+        self._replay = []  # changes applied while a rebuild was running
+        self._ready = threading.Event()  # set once the first build is in
+        self._origin = uuid.uuid4().hex
+        self._lock = threading.RLock()
+        self._subscriber = Subscriber(CHANGED_CHANNEL, self._on_changed, on_subscribe=self._on_subscribe)
+
+    # Building
+
+    def _load(self):
+        followers = dict(db.session.query(Follow.following_id, func.count(Follow.id)).group_by(Follow.following_id))
+        hashtag_uses = func.count(YapHashtag.id)
+        products = db.session.query(Products.id, Products.title, Products.brand, Products.total_sales).all()
+
+        brand_counts, brand_labels = Counter(), {}
+        for product in products:
+            if product.brand and _brand_key(product.brand):
+                brand_counts[_brand_key(product.brand)] += 1
+                brand_labels.setdefault(_brand_key(product.brand), product.brand)
+
+        indexes = {
+            'products': TermIndex(_product_entry(*product) for product in products),
+            'brands': TermIndex(
+                (key, key, count, {'name': brand_labels[key], 'products': count}) for key, count in brand_counts.items()
+            ),
+            'users': TermIndex(
+                _user_entry(*user, followers=followers.get(user.id, 0))
+                for user in db.session.query(
+                    Users.id, Users.username, Users.first_name, Users.last_name, Users.display_name, Users.avatar
+                )
+            ),
+            'hashtags': TermIndex(
+                _hashtag_entry(*hashtag)
+                for hashtag in db.session.query(Hashtag.id, Hashtag.name, hashtag_uses)
+                .outerjoin(YapHashtag, YapHashtag.hashtag_id == Hashtag.id).group_by(Hashtag.id, Hashtag.name)
+            ),
+        }
+        return indexes, brand_counts
+
+    def _rebuild(self):
+        with self._lock:
+            self._rebuilding = True
+            self._replay = []
+        try:
+            indexes, brand_counts = self._load()
+        except Exception:
+            with self._lock:
+                self._rebuilding = False
+            raise
+        with self._lock:
+            self._rebuilding = False
+            self._indexes, self._brand_counts = indexes, brand_counts
+            # Changes committed while loading may not be in what was read;
+            # applying one twice leaves the index as it was
+            for changes in self._replay:
+                self._apply(changes)
+            self._replay = []
+            self._built_at = time.monotonic()
+            self._ready.set()
+
+    def _rebuild_in_background(self, app):
+        def run():
+            with app.app_context():
+                try:
+                    self._rebuild()
+                except Exception:
+                    app.logger.exception('Autocomplete index build failed')
+                finally:
+                    db.session.remove()
+
+        threading.Thread(target=run, name='autocomplete:rebuild', daemon=True).start()
+
+    def start(self, app=None):
+        """Build the index in the background unless a build is already running."""
+        with self._lock:
+            if self._rebuilding:
+                return
+            self._rebuilding = True
+            self._needs_rebuild = False
+        self._rebuild_in_background(app or current_app._get_current_object())
+
+    def wait(self, timeout=None):
+        """Block until the first build is in; returns False on timeout."""
+        return self._ready.wait(timeout)
+
+    def _ensure_current(self):
+        redis_client = get_redis()
+        if redis_client is not None:
+            self._subscriber.ensure_started(redis_client)
+
+        # Requests never wait for a build: the old index (or nothing) answers meanwhile
+        stale = (
+            self._indexes is None or self._needs_rebuild
+            or time.monotonic() - self._built_at > REBUILD_SECONDS
+        )
+        if stale and not self._rebuilding:
+            self.start()
+
+    # Incremental updates
+
+    def _apply(self, changes):
+        """Apply [(model name, key, fields or None when deleted)] to the loaded indexes."""
+        if self._rebuilding:
+            self._replay.append(changes)
+        if self._indexes is None:
+            return
+        for model, key, fields in changes:
+            if model == 'product':
+                previous = self._indexes['products'].get(key)
+                if previous is not None:
+                    self._count_brand(previous['brand'], -1)
+                if fields is None:
+                    self._indexes['products'].remove(key)
+                else:
+                    self._indexes['products'].add(*_product_entry(key, fields['title'], fields['brand'], fields['total_sales']))
+                    self._count_brand(fields['brand'], 1)
+            elif model == 'user':
+                if fields is None:
+                    self._indexes['users'].remove(key)
+                else:
+                    previous = self._indexes['users'].get(key)
+                    self._indexes['users'].add(*_user_entry(key, **fields, followers=previous['followers'] if previous else 0))
+            elif model == 'hashtag':
+                if fields is None:
+                    self._indexes['hashtags'].remove(key)
+                else:
+                    previous = self._indexes['hashtags'].get(key)
+                    self._indexes['hashtags'].add(*_hashtag_entry(key, fields['name'], previous['yaps'] if previous else 0))
+
+    def _count_brand(self, brand, delta):
+        key = _brand_key(brand) if brand else ''
+        if not key:
+            return
+        self._brand_counts[key] += delta
+        count = self._brand_counts[key]
+        if count <= 0:
+            del self._brand_counts[key]
+            self._indexes['brands'].remove(key)
+        else:
+            previous = self._indexes['brands'].get(key)
+            name = previous['name'] if previous else brand
+            self._indexes['brands'].add(key, key, count, {'name': name, 'products': count})
+
+    def changed(self, changes):
+        """Apply changes committed by this worker and tell the other workers."""
+        with self._lock:
+            self._apply(changes)
+        publish(CHANGED_CHANNEL, json.dumps({'origin': self._origin, 'changes': changes}))
+
+    def _on_changed(self, data):
+        # Runs on the subscriber thread
+        message = json.loads(data)
+        if message['origin'] == self._origin:
+            return
+        with self._lock:
+            self._apply([tuple(change) for change in message['changes']])
+
+    def _on_subscribe(self):
+        # Anything published while we were not subscribed is picked up by a rebuild
+        if self._indexes is not None:
+            self._needs_rebuild = True
+
+    # Public API
+
+    def suggest(self, q, kinds=KINDS, limit=5):
+        """{kind: [suggestion]} for what has been typed so far; the last word may be incomplete."""
+        self._ensure_current()
+        terms = normalize(q)
+        last_is_prefix = bool(q) and not q[-1].isspace()
+        with self._lock:
+            if self._indexes is None:
+                return {kind: [] for kind in kinds}
+            return {kind: self._indexes[kind].search(terms, last_is_prefix, limit) for kind in kinds}
+
+    def reset(self):
+        with self._lock:
+            self._indexes = None
+            self._brand_counts = Counter()
+            self._ready.clear()
+
+
+autocomplete = Autocomplete()
+
+
+# Session hooks: collect changes to indexed models at flush time, while their
+# attributes are loaded, and apply them once the transaction commits.
+
+def _fields(obj):
+    return {field: getattr(obj, field) for field in INDEXED_FIELDS[type(obj)]}
+
+
+def _change(obj, deleted=False):
+    model = {Products: 'product', Users: 'user', Hashtag: 'hashtag'}[type(obj)]
+    return (model, obj.id), (None if deleted else _fields(obj))
+
+
+def _after_flush(session, flush_context):
+    pending = session.info.setdefault('autocomplete_changes', {})
+    for obj in session.new:
+        if type(obj) in INDEXED_FIELDS:
+            key, fields = _change(obj)
+            pending[key] = fields
+    for obj in session.dirty:
+        if type(obj) in INDEXED_FIELDS:
+            state = inspect(obj)
+            if any(state.attrs[field].history.has_changes() for field in INDEXED_FIELDS[type(obj)]):
+                key, fields = _change(obj)
+                pending[key] = fields
+    for obj in session.deleted:
+        if type(obj) in INDEXED_FIELDS:
+            key, fields = _change(obj, deleted=True)
+            pending[key] = fields
+
+
+def _after_commit(session):
+    pending = session.info.pop('autocomplete_changes', None)
+    if pending:
+        autocomplete.changed([(model, key, fields) for (model, key), fields in pending.items()])
+
+
+def _after_rollback(session):
+    session.info.pop('autocomplete_changes', None)
+
+
+event.listen(Session, 'after_flush', _after_flush)
+event.listen(Session, 'after_commit', _after_commit)
+event.listen(Session, 'after_rollback', _after_rollback)
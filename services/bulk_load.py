@@ -0,0 +1,238 @@
+import csv
+from datetime import date, datetime
+import io
+import json
+import os
+import time
+from sqlalchemy import insert, text
+from sqlalchemy.types import Boolean, Date, DateTime, Float, Integer, Numeric, String
+from models import db
+
+BATCH_SIZE = int(os.getenv('BULK_LOAD_BATCH_SIZE', 5000))
+FIXTURE_FORMATS = ('.json', '.jsonl', '.csv')
+
+
+def _table(source):
+    """Accept a model class or a Table."""
+    return getattr(source, '__table__', source)
+
+
+def _python_defaults(table, present):
+    """Columns missing from the rows that have a Python-side default, e.g. cuid ids and utcnow stamps."""
+    defaults = []
+    for column in table.columns:
+        default = column.default
+        if column.key in present or default is None:
+            continue
+        if default.is_scalar:
+            defaults.append((column.key, False, default.arg))
+        elif default.is_callable:
+            defaults.append((column.key, True, default.arg))
+    return defaults
+
+
+def _complete(rows, table):
+    """
+    Yield (columns, row tuple) with every row carrying the same columns.
+
+    Defaults are filled in here rather than by the database, so string
+    primary keys are assigned before the insert and children in the same
+    load can refer to them.
+    """
+    rows = iter(rows)
+    first = next(rows, None)
+    if first is None:
+        return
+    unknown = set(first) - set(table.columns.keys())
+    if unknown:
+        raise ValueError(f"{table.name} has no column(s) {', '.join(sorted(unknown))}")
+
+    defaults = _python_defaults(table, first)
+    columns = list(first) + [key for key, _, _ in defaults]
+    yield columns
+
+    def complete(row):
+        values = [row.get(key) for key in first]
+        for _, is_callable, value in defaults:
+            values.append(value(None) if is_callable else value)
+        return tuple(values)
+
+    yield complete(first)
+    for row in rows:
+        yield complete(row)
+
+
+def _batched(rows, batch_size):
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def _copy_value(value):
+    # COPY text format: \N for NULL; backslash, tab and newlines escaped
+    if value is None:
+        return '\\N'
+    if isinstance(value, bool):
+        return 't' if value else 'f'
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    return str(value).replace('\\', '\\\\').replace('\t', '\\t').replace('\n', '\\n').replace('\r', '\\r')
+
+
+def _copy_batch(connection, table, columns, batch):
+    buffer = io.StringIO()
+    for row in batch:
+        buffer.write('\t'.join(_copy_value(value) for value in row))
+        buffer.write('\n')
+    buffer.seek(0)
+    quoted = ', '.join(connection.dialect.identifier_preparer.quote(column) for column in columns)
+    name = connection.dialect.identifier_preparer.format_table(table)
+    cursor = connection.connection.dbapi_connection.cursor()
+    try:
+        cursor.copy_expert(f'COPY {name} ({quoted}) FROM STDIN', buffer)
+    finally:
+        cursor.close()
+
+
+def _reset_sequence(connection, table, columns):
+    # COPY with explicit ids leaves the serial sequence behind them
+    column = table.autoincrement_column
+    if column is None or column.key not in columns:
+        return
+    connection.execute(
+        text(f"SELECT setval(pg_get_serial_sequence(:table, :column), COALESCE(MAX({column.name}), 0) + 1, false) FROM {table.name}"),
+        {'table': table.name, 'column': column.name}
+    )
+
+
+def bulk_load(source, rows, batch_size=BATCH_SIZE):
+    """
+    Stream dict rows into a table in batches, committing after each one.
+
+    PostgreSQL loads through COPY; other databases through executemany
+    inserts. Returns the number of rows loaded.
+    """
+    table = _table(source)
+    rows = _complete(rows, table)
+    columns = next(rows, None)
+    if columns is None:
+        return 0
+
+    use_copy = db.engine.dialect.name == 'postgresql' and db.engine.dialect.driver == 'psycopg2'
+    statement = insert(table)
+    total = 0
+    for batch in _batched(rows, batch_size):
+        with db.engine.begin() as connection:
+            if use_copy:
+                _copy_batch(connection, table, columns, batch)
+            else:
+                connection.execute(statement, [dict(zip(columns, row)) for row in batch])
+        total += len(batch)
+    if use_copy:
+        with db.engine.begin() as connection:
+            _reset_sequence(connection, table, columns)
+    return total
+
+
+def load_tables(sources, batch_size=BATCH_SIZE, report=print):
+    """
+    bulk_load each (model or table, rows) pair in order, reporting rows/sec.
+
+    Returns {table name: rows loaded}.
+    """
+    loaded = {}
+    for source, rows in sources:
+        table = _table(source)
+        start = time.perf_counter()
+        total = bulk_load(table, rows, batch_size)
+        elapsed = time.perf_counter() - start
+        loaded[table.name] = loaded.get(table.name, 0) + total
+        if report:
+            report(f"{table.name:>20} {total:>10} rows {elapsed:>8.1f}s {total / max(elapsed, 1e-9):>10.0f} rows/s")
+    return loaded
+
+
+# Fixtures
+
+def _parse_bool(value):
+    return value.strip().lower() in ('1', 'true', 't', 'yes', 'y')
+
+
+def _converters(table):
+    """Column key -> function turning a fixture string into the column's Python type."""
+    converters = {}
+    for column in table.columns:
+        column_type = column.type
+        if isinstance(column_type, DateTime):
+            converters[column.key] = datetime.fromisoformat
+        elif isinstance(column_type, Date):
+            converters[column.key] = date.fromisoformat
+        elif isinstance(column_type, Boolean):
+            converters[column.key] = _parse_bool
+        elif isinstance(column_type, Integer):
+            converters[column.key] = int
+        elif isinstance(column_type, (Float, Numeric)):
+            converters[column.key] = float
+    return converters
+
+
+def _coerce(rows, table, empty_is_null):
+    converters = _converters(table)
+    string_columns = {column.key for column in table.columns if isinstance(column.type, String)}
+    for row in rows:
+        for key, value in row.items():
+            if not isinstance(value, str):
+                continue
+            if value == '' and empty_is_null and key not in string_columns:
+                row[key] = None
+            elif key in converters:
+                row[key] = converters[key](value)
+        yield row
+
+
+def read_fixture(path, source):
+    """
+    Stream rows from a .json (array of objects), .jsonl or .csv fixture,
+    converting strings such as timestamps to the table's column types.
+    """
+    table = _table(source)
+    extension = os.path.splitext(path)[1].lower()
+    if extension == '.json':
+        with open(path) as fixture:
+            yield from _coerce(json.load(fixture), table, empty_is_null=False)
+    elif extension == '.jsonl':
+        with open(path) as fixture:
+            yield from _coerce((json.loads(line) for line in fixture if line.strip()), table, empty_is_null=False)
+    elif extension == '.csv':
+        with open(path, newline='') as fixture:
+            # CSV cannot tell NULL from an empty string; empty non-text cells are NULL
+            yield from _coerce(csv.DictReader(fixture), table, empty_is_null=True)
+    else:
+        raise ValueError(f"Unsupported fixture format: {path}")
+
+
+def fixture_sources(directory):
+    """
+    (table, rows) for every fixture in a directory, parents before children.
+
+    Fixtures are named after their table, e.g. products.csv or
+    product_images.jsonl.
+    """
+    tables = {table.name: table for table in db.metadata.sorted_tables}
+    fixtures = {}
+    for filename in sorted(os.listdir(directory)):
+        name, extension = os.path.splitext(filename)
+        if extension.lower() not in FIXTURE_FORMATS:
+            continue
+        if name not in tables:
+            raise ValueError(f"Fixture {filename} does not match a table")
+        fixtures.setdefault(name, []).append(os.path.join(directory, filename))
+
+    for table in db.metadata.sorted_tables:
+        for path in fixtures.get(table.name, ()):
+            yield table, read_fixture(path, table)
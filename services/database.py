@@ -0,0 +1,57 @@
+import os
+from sqlalchemy import event
+from sqlalchemy.engine import make_url
+
+DEFAULT_DATABASE_URL = 'sqlite:///test.db'
+
+POOL_SIZE = int(os.getenv('DB_POOL_SIZE', 10))
+MAX_OVERFLOW = int(os.getenv('DB_MAX_OVERFLOW', 20))
+# Recycle connections before the server or a proxy drops them as idle
+POOL_RECYCLE = int(os.getenv('DB_POOL_RECYCLE', 1800))
+POOL_PRE_PING = os.getenv('DB_POOL_PRE_PING', 'true').lower() == 'true'
+# Server-side cap on a single statement; 0 turns it off (e.g. for long migrations)
+STATEMENT_TIMEOUT_MS = int(os.getenv('DB_STATEMENT_TIMEOUT_MS', 30_000))
+# How long a SQLite writer waits for the lock before "database is locked"
+SQLITE_BUSY_TIMEOUT_MS = int(os.getenv('SQLITE_BUSY_TIMEOUT_MS', 5000))
+
+
+def database_url():
+    """DATABASE_URL from the environment, normalised for SQLAlchemy."""
+    url = os.getenv('DATABASE_URL', DEFAULT_DATABASE_URL)
+    # Heroku-style URLs use the scheme SQLAlchemy 1.4 dropped
+    if url.startswith('postgres://'):
+        url = 'postgresql://' + url[len('postgres://'):]
+    return url
+
+
+def engine_options(url):
+    """SQLALCHEMY_ENGINE_OPTIONS for the given database URL."""
+    backend = make_url(url).get_backend_name()
+    if backend == 'sqlite':
+        # busy_timeout is also set as a pragma on connect, see configure_engine
+        return {'connect_args': {'timeout': SQLITE_BUSY_TIMEOUT_MS / 1000}}
+
+    options = {
+        'pool_size': POOL_SIZE,
+        'max_overflow': MAX_OVERFLOW,
+        'pool_recycle': POOL_RECYCLE,
+        'pool_pre_ping': POOL_PRE_PING,
+    }
+    if backend == 'postgresql' and STATEMENT_TIMEOUT_MS:
+        options['connect_args'] = {'options': f'-c statement_timeout={STATEMENT_TIMEOUT_MS}'}
+    return options
+
+
+def _set_sqlite_pragmas(dbapi_connection, connection_record):
+    cursor = dbapi_connection.cursor()
+    # WAL lets readers run alongside the single writer
+    cursor.execute('PRAGMA journal_mode=WAL')
+    cursor.execute('PRAGMA synchronous=NORMAL')
+    cursor.execute(f'PRAGMA busy_timeout={SQLITE_BUSY_TIMEOUT_MS}')
+    cursor.close()
+
+
+def configure_engine(engine):
+    """Per-connection setup that engine options cannot express."""
+    if engine.dialect.name == 'sqlite' and engine.url.database not in (None, '', ':memory:'):
+        event.listen(engine, 'connect', _set_sqlite_pragmas)
@@ -0,0 +1,257 @@
+from collections import Counter, OrderedDict
+import json
+import os
+import threading
+import time
+from redis.exceptions import RedisError
+from sqlalchemy import select, union_all, case, func, desc, or_
+from models import db, Friendship
+from . import get_redis
+
+VERSION_KEY = 'friend_graph:version'
+# Rebuild at least this often when Redis is unreachable, so workers that
+# cannot see each other's version bumps still converge.
+MAX_AGE_SECONDS = int(os.getenv('FRIEND_GRAPH_MAX_AGE', 300))
+
+RECOMMENDATIONS_KEY = 'friend_recs:{user_id}'
+RECOMMENDATIONS_TOP_K = 50
+RECOMMENDATIONS_TTL = int(os.getenv('FRIEND_RECOMMENDATIONS_TTL', 600))
+# Per-process fallback when Redis is unavailable
+LOCAL_RECOMMENDATIONS_SIZE = 1000
+
+
+class FriendGraph:
+    """
+    In-memory adjacency sets of accepted friendships.
+
+    The graph is built with a single query the first time it is needed and is
+    then updated in place by the friendship views. Every change bumps a version
+    counter in Redis so the other workers notice and rebuild on their next read.
+    """
+
+    def __init__(self):
+        self._adjacency = None
+        self._version = None
+        self._loaded_at = 0.0
+        self._lock = threading.RLock()
+
+    # Loading and versioning
+
+    def _remote_version(self):
+        redis_client = get_redis()
+        if redis_client is None:
+            return None
+        try:
+            version = redis_client.get(VERSION_KEY)
+        except RedisError:
+            return None
+        return int(version) if version is not None else 0
+
+    def _bump_remote_version(self):
+        redis_client = get_redis()
+        if redis_client is None:
+            return None
+        try:
+            return redis_client.incr(VERSION_KEY)
+        except RedisError:
+            return None
+
+    def _load(self):
+        adjacency = {}
+        rows = db.session.query(Friendship.user_id, Friendship.friend_id).filter(
+            Friendship.status == 'accepted'
+        ).all()
+        for user_id, friend_id in rows:
+            adjacency.setdefault(user_id, set()).add(friend_id)
+            adjacency.setdefault(friend_id, set()).add(user_id)
+        return adjacency
+
+    def _graph(self):
+        remote_version = self._remote_version()
+        with self._lock:
+            stale = (
+                self._adjacency is None
+                or (remote_version is not None and remote_version != self._version)
+                or (remote_version is None and time.monotonic() - self._loaded_at > MAX_AGE_SECONDS)
+            )
+            if stale:
+                self._adjacency = self._load()
+                self._version = remote_version
+                self._loaded_at = time.monotonic()
+            return self._adjacency
+
+    def version(self):
+        """Current graph version in Redis, or None when Redis is unavailable."""
+        return self._remote_version()
+
+    def invalidate(self):
+        with self._lock:
+            self._adjacency = None
+        self._bump_remote_version()
+
+    # Incremental updates, called after the friendship change is committed
+
+    def _changed(self):
+        with _local_recommendations_lock:
+            _local_recommendations.clear()
+
+        previous = self._version
+        version = self._bump_remote_version()
+        # Only claim the new version if nobody else changed the graph in between,
+        # otherwise leave it mismatched so the next read rebuilds.
+        if version is not None and previous is not None and version == previous + 1:
+            self._version = version
+
+    def add_friendship(self, user_id, friend_id):
+        user_id, friend_id = int(user_id), int(friend_id)
+        with self._lock:
+            if self._adjacency is not None:
+                self._adjacency.setdefault(user_id, set()).add(friend_id)
+                self._adjacency.setdefault(friend_id, set()).add(user_id)
+            self._changed()
+
+    def remove_friendship(self, user_id, friend_id):
+        user_id, friend_id = int(user_id), int(friend_id)
+        with self._lock:
+            if self._adjacency is not None:
+                self._adjacency.get(user_id, set()).discard(friend_id)
+                self._adjacency.get(friend_id, set()).discard(user_id)
+            self._changed()
+
+    def remove_user(self, user_id):
+        user_id = int(user_id)
+        with self._lock:
+            if self._adjacency is not None:
+                for friend_id in self._adjacency.pop(user_id, set()):
+                    self._adjacency.get(friend_id, set()).discard(user_id)
+            self._changed()
+
+    # Queries
+
+    def friend_ids(self, user_id):
+        with self._lock:
+            return frozenset(self._graph().get(int(user_id), ()))
+
+    def mutual_counts(self, user_id, candidate_ids=None):
+        """
+        Number of mutual friends between user_id and other users.
+
+        With candidate_ids, returns a count for every candidate (including
+        zeros). Without, walks friends-of-friends once and returns only the
+        users that share at least one friend.
+        """
+        with self._lock:
+            adjacency = self._graph()
+            mine = adjacency.get(int(user_id), set())
+            if candidate_ids is not None:
+                return {candidate: len(mine & adjacency.get(candidate, set())) for candidate in candidate_ids}
+
+            counts = Counter()
+            for friend_id in mine:
+                counts.update(adjacency.get(friend_id, ()))
+        counts.pop(int(user_id), None)
+        return dict(counts)
+
+
+friend_graph = FriendGraph()
+
+
+_local_recommendations = OrderedDict()
+_local_recommendations_lock = threading.Lock()
+
+
+def _rank_friends_of_friends(user_id, limit):
+    """
+    Friends-of-friends ranked by mutual friend count, computed in one query.
+
+    Accepted friendships are expanded into directed edges and self-joined on
+    the middle user. Anyone with an existing friendship row with user_id
+    (accepted, pending or blocked, in either direction) is excluded.
+    """
+    accepted = Friendship.status == 'accepted'
+    edges = union_all(
+        select(Friendship.user_id.label('src'), Friendship.friend_id.label('dst')).where(accepted),
+        select(Friendship.friend_id.label('src'), Friendship.user_id.label('dst')).where(accepted),
+    ).subquery()
+    first_hop = edges.alias('first_hop')
+    second_hop = edges.alias('second_hop')
+
+    linked = select(
+        case((Friendship.user_id == user_id, Friendship.friend_id), else_=Friendship.user_id)
+    ).where(or_(Friendship.user_id == user_id, Friendship.friend_id == user_id))
+
+    mutual = func.count().label('mutual')
+    rows = db.session.execute(
+        select(second_hop.c.dst, mutual)
+        .select_from(first_hop.join(second_hop, second_hop.c.src == first_hop.c.dst))
+        .where(
+            first_hop.c.src == user_id,
+            second_hop.c.dst != user_id,
+            second_hop.c.dst.not_in(linked),
+        )
+        .group_by(second_hop.c.dst)
+        .order_by(desc(mutual), second_hop.c.dst)
+        .limit(limit)
+    ).all()
+    return [(candidate, count) for candidate, count in rows]
+
+
+def recommend_friends(user_id, limit=RECOMMENDATIONS_TOP_K):
+    """
+    Top friend recommendations for user_id as (user_id, mutual_count) pairs.
+
+    The top RECOMMENDATIONS_TOP_K are cached in Redis, stamped with the friend
+    graph version so any accepted/removed friendship invalidates every entry.
+    Pending and blocked changes only affect the two users involved and are
+    invalidated with invalidate_recommendations.
+    """
+    user_id = int(user_id)
+    version = friend_graph.version()
+    redis_client = get_redis()
+    key = RECOMMENDATIONS_KEY.format(user_id=user_id)
+
+    if version is not None:
+        try:
+            cached = redis_client.get(key)
+        except RedisError:
+            cached = None
+        if cached is not None:
+            cached = json.loads(cached)
+            if cached['version'] == version:
+                return [tuple(item) for item in cached['items'][:limit]]
+    else:
+        with _local_recommendations_lock:
+            cached = _local_recommendations.get(user_id)
+            if cached is not None and time.monotonic() - cached[0] < RECOMMENDATIONS_TTL:
+                _local_recommendations.move_to_end(user_id)
+                return cached[1][:limit]
+
+    ranked = _rank_friends_of_friends(user_id, RECOMMENDATIONS_TOP_K)
+
+    if version is not None:
+        try:
+            redis_client.set(key, json.dumps({'version': version, 'items': ranked}), ex=RECOMMENDATIONS_TTL)
+        except RedisError:
+            pass
+    else:
+        with _local_recommendations_lock:
+            _local_recommendations[user_id] = (time.monotonic(), ranked)
+            _local_recommendations.move_to_end(user_id)
+            while len(_local_recommendations) > LOCAL_RECOMMENDATIONS_SIZE:
+                _local_recommendations.popitem(last=False)
+
+    return ranked[:limit]
+
+
+def invalidate_recommendations(*user_ids):
+    with _local_recommendations_lock:
+        for user_id in user_ids:
+            _local_recommendations.pop(int(user_id), None)
+
+    redis_client = get_redis()
+    if redis_client is None:
+        return
+    try:
+        redis_client.delete(*[RECOMMENDATIONS_KEY.format(user_id=int(user_id)) for user_id in user_ids])
+    except RedisError:
+        pass
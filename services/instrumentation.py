@@ -0,0 +1,222 @@
+from collections import defaultdict
+import json
+import os
+import threading
+import time
+from flask import g, request, has_request_context
+from flask.json.provider import DefaultJSONProvider
+from redis.exceptions import RedisError
+from sqlalchemy import event
+from . import get_redis
+
+METRICS_ENABLED = os.getenv('METRICS_ENABLED', 'true').lower() == 'true'
+SERVER_TIMING_ENABLED = os.getenv('SERVER_TIMING_ENABLED', 'true').lower() == 'true'
+# Each worker adds its counters to a shared Redis hash this often, so /metrics
+# reports the whole deployment whichever worker answers the scrape.
+FLUSH_SECONDS = float(os.getenv('METRICS_FLUSH_SECONDS', 5))
+METRICS_KEY = 'metrics:requests'
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+ENDPOINT_COUNTERS = {
+    'db_statements_total': 'SQL statements executed while handling requests.',
+    'db_duration_seconds_total': 'Time spent executing SQL statements.',
+    'serialization_duration_seconds_total': 'Time spent encoding JSON responses.',
+}
+
+
+class MetricsRegistry:
+    """
+    Per-endpoint request counters.
+
+    Requests update local counters; every FLUSH_SECONDS the accumulated
+    deltas are added to a Redis hash. Without Redis the local totals are
+    reported instead, so each worker only sees its own requests.
+    """
+
+    def __init__(self):
+        self._totals = defaultdict(float)  # (metric, labels) -> value since start
+        self._pending = defaultdict(float)  # (metric, labels) -> value not yet flushed
+        self._flushed_at = time.monotonic()
+        self._lock = threading.Lock()
+
+    def observe(self, endpoint, method, status, duration, statements, db_time, serialize_time):
+        series = [
+            (('requests_total', (endpoint, method, str(status))), 1),
+            (('request_duration_seconds_count', (endpoint,)), 1),
+            (('request_duration_seconds_sum', (endpoint,)), duration),
+            (('db_statements_total', (endpoint,)), statements),
+            (('db_duration_seconds_total', (endpoint,)), db_time),
+            (('serialization_duration_seconds_total', (endpoint,)), serialize_time),
+        ]
+        series.extend(
+            (('request_duration_seconds_bucket', (endpoint, str(bound))), 1)
+            for bound in LATENCY_BUCKETS if duration <= bound
+        )
+        with self._lock:
+            for key, value in series:
+                self._totals[key] += value
+                self._pending[key] += value
+        if time.monotonic() - self._flushed_at >= FLUSH_SECONDS:
+            self.flush()
+
+    def flush(self):
+        redis_client = get_redis()
+        if redis_client is None:
+            return
+        with self._lock:
+            pending, self._pending = self._pending, defaultdict(float)
+            self._flushed_at = time.monotonic()
+        try:
+            pipe = redis_client.pipeline(transaction=False)
+            for (metric, labels), value in pending.items():
+                pipe.hincrbyfloat(METRICS_KEY, json.dumps([metric, labels]), value)
+            pipe.execute()
+        except RedisError:
+            # Keep the deltas for the next attempt
+            with self._lock:
+                for key, value in pending.items():
+                    self._pending[key] += value
+
+    def snapshot(self):
+        """Current totals as {(metric, labels): value}."""
+        redis_client = get_redis()
+        if redis_client is not None:
+            self.flush()
+            try:
+                stored = redis_client.hgetall(METRICS_KEY)
+            except RedisError:
+                stored = None
+            if stored is not None:
+                totals = {}
+                for field, value in stored.items():
+                    metric, labels = json.loads(field)
+                    totals[(metric, tuple(labels))] = float(value)
+                return totals
+        with self._lock:
+            return dict(self._totals)
+
+
+metrics = MetricsRegistry()
+
+
+def _escape(value):
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def render_prometheus(totals):
+    """Prometheus text exposition of a snapshot."""
+    by_metric = defaultdict(list)
+    for (metric, labels), value in totals.items():
+        by_metric[metric].append((labels, value))
+
+    lines = []
+
+    def emit(name, labels, value):
+        rendered = ','.join(f'{key}="{_escape(val)}"' for key, val in labels)
+        lines.append(f'camposocial_{name}{{{rendered}}} {value:g}')
+
+    lines.append('# HELP camposocial_requests_total Requests handled, by endpoint, method and status.')
+    lines.append('# TYPE camposocial_requests_total counter')
+    for (endpoint, method, status), value in sorted(by_metric['requests_total']):
+        emit('requests_total', [('endpoint', endpoint), ('method', method), ('status', status)], value)
+
+    lines.append('# HELP camposocial_request_duration_seconds Total request latency.')
+    lines.append('# TYPE camposocial_request_duration_seconds histogram')
+    buckets = defaultdict(dict)
+    for (endpoint, bound), value in by_metric['request_duration_seconds_bucket']:
+        buckets[endpoint][float(bound)] = value
+    for (endpoint,), count in sorted(by_metric['request_duration_seconds_count']):
+        for bound in LATENCY_BUCKETS:
+            emit('request_duration_seconds_bucket', [('endpoint', endpoint), ('le', f'{bound:g}')], buckets[endpoint].get(bound, 0))
+        emit('request_duration_seconds_bucket', [('endpoint', endpoint), ('le', '+Inf')], count)
+        emit('request_duration_seconds_count', [('endpoint', endpoint)], count)
+    for (endpoint,), value in sorted(by_metric['request_duration_seconds_sum']):
+        emit('request_duration_seconds_sum', [('endpoint', endpoint)], value)
+
+    for metric, description in ENDPOINT_COUNTERS.items():
+        lines.append(f'# HELP camposocial_{metric} {description}')
+        lines.append(f'# TYPE camposocial_{metric} counter')
+        for (endpoint,), value in sorted(by_metric[metric]):
+            emit(metric, [('endpoint', endpoint)], value)
+
+    return '\n'.join(lines) + '\n'
+
+
+# Request-scoped collection
+
+def _request_stats():
+    if not has_request_context():
+        return None
+    return g.get('_request_stats')
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault('query_start_time', []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    started = conn.info['query_start_time'].pop()
+    stats = _request_stats()
+    if stats is not None:
+        stats['statements'] += 1
+        stats['db_time'] += time.perf_counter() - started
+
+
+def _handle_error(context):
+    # Keep the start-time stack balanced when a statement fails
+    starts = context.connection.info.get('query_start_time') if context.connection is not None else None
+    if starts:
+        starts.pop()
+
+
+class TimedJSONProvider(DefaultJSONProvider):
+    """Flask's JSON provider, timing how long responses take to encode."""
+
+    def response(self, *args, **kwargs):
+        started = time.perf_counter()
+        try:
+            return super().response(*args, **kwargs)
+        finally:
+            stats = _request_stats()
+            if stats is not None:
+                stats['serialize_time'] += time.perf_counter() - started
+
+
+def _start_request():
+    g._request_stats = {'started': time.perf_counter(), 'statements': 0, 'db_time': 0.0, 'serialize_time': 0.0}
+
+
+def _finish_request(response):
+    stats = g.pop('_request_stats', None)
+    if stats is None:
+        return response
+    duration = time.perf_counter() - stats['started']
+
+    if SERVER_TIMING_ENABLED:
+        response.headers.add(
+            'Server-Timing',
+            f'db;dur={stats["db_time"] * 1000:.1f};desc="{stats["statements"]} queries", '
+            f'serialize;dur={stats["serialize_time"] * 1000:.1f}, '
+            f'total;dur={duration * 1000:.1f}'
+        )
+
+    # Route templates rather than raw paths keep the label set bounded
+    endpoint = request.url_rule.rule if request.url_rule is not None else 'unmatched'
+    metrics.observe(
+        endpoint, request.method, response.status_code, duration,
+        stats['statements'], stats['db_time'], stats['serialize_time']
+    )
+    return response
+
+
+def init_instrumentation(app, engine):
+    """Attach per-request SQL, serialization and latency tracking to the app."""
+    if not METRICS_ENABLED:
+        return
+    app.json = TimedJSONProvider(app)
+    event.listen(engine, 'before_cursor_execute', _before_cursor_execute)
+    event.listen(engine, 'after_cursor_execute', _after_cursor_execute)
+    event.listen(engine, 'handle_error', _handle_error)
+    app.before_request(_start_request)
+    app.after_request(_finish_request)
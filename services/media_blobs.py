@@ -0,0 +1,186 @@
+from datetime import datetime, timedelta
+import os
+from sqlalchemy.exc import IntegrityError
+from models import db, MediaBlob, MediaVariant, MEDIA_URL_COLUMNS
+from .storage import get_storage, MediaUploadError
+
+# Unreferenced blobs younger than this are kept: their rows may still be being created
+GC_GRACE_HOURS = int(os.getenv('MEDIA_GC_GRACE_HOURS', 24))
+
+
+def _touch(key, now):
+    blobs = MediaBlob.__table__
+    with db.engine.begin() as connection:
+        return connection.execute(
+            blobs.update().where(blobs.c.key == key).values(last_uploaded_at=now)
+        ).rowcount > 0
+
+
+def _claim(key):
+    """
+    Whether the blob is already stored, renewing its grace period if so.
+
+    Used instead of a HEAD request to deduplicate: a blob row only exists
+    while its object does, and once touched neither collect_garbage nor a
+    failed batch's cleanup will delete it.
+    """
+    return _touch(key, datetime.utcnow())
+
+
+def _register(results, content_types, now):
+    """
+    Record stored blobs, each in its own short transaction, and return the
+    keys whose rows this call created.
+
+    Committed separately from the request so concurrent uploads of the same
+    content do not conflict; a blob whose referencing row is never created
+    stays at ref_count 0 and is collected after the grace period.
+    """
+    blobs = MediaBlob.__table__
+    created = []
+    for result, content_type in zip(results, content_types):
+        if _touch(result['key'], now):
+            continue
+        try:
+            with db.engine.begin() as connection:
+                connection.execute(blobs.insert().values(
+                    key=result['key'],
+                    sha256=result['sha256'],
+                    size=result['size'],
+                    content_type=content_type,
+                    ref_count=0,
+                    created_at=now,
+                    last_uploaded_at=now
+                ))
+            created.append(result['key'])
+        except IntegrityError:
+            # Another request registered the same content first; touch it so
+            # a cleanup of that request's failed batch leaves it alone
+            _touch(result['key'], now)
+    return created
+
+
+def _discard(keys, registered_at):
+    """
+    Delete blobs a failed batch registered, with their objects, unless they
+    were referenced or claimed by another upload since.
+
+    The object is deleted before the row's DELETE commits, so a concurrent
+    claim of the same key waits and then uploads the file again.
+    """
+    storage = get_storage()
+    blobs = MediaBlob.__table__
+    for key in keys:
+        try:
+            with db.engine.begin() as connection:
+                removed = connection.execute(blobs.delete().where(
+                    blobs.c.key == key,
+                    blobs.c.ref_count <= 0,
+                    blobs.c.last_uploaded_at == registered_at
+                )).rowcount
+                if removed:
+                    storage.delete_many([key])
+        except Exception:
+            # Left for collect_garbage
+            pass
+
+
+def store(fileobj, filename, content_type=None, public=False):
+    """Store one file content-addressed and return its public URL."""
+    storage = get_storage()
+    result = storage.put_content_addressed(fileobj, filename, content_type=content_type, public=public, exists=_claim)
+    _register([result], [content_type], datetime.utcnow())
+    return storage.url(result['key'])
+
+
+def store_many(uploads):
+    """
+    Store files content-addressed and in parallel (see MediaStorage.put_many).
+
+    uploads is a list of dicts with 'fileobj', 'filename' and optional
+    'content_type' and 'public'; each dict gets the stored 'key' and 'url'.
+    Returns the per-file results, with 'uploaded' False for deduplicated files.
+    If one fails, the blobs this call created are deleted again before
+    MediaUploadError is raised; blobs shared with other uploads are kept.
+    """
+    storage = get_storage()
+    try:
+        results = storage.put_many([
+            {key: upload[key] for key in ('fileobj', 'filename', 'content_type', 'public') if key in upload}
+            for upload in uploads
+        ], exists=_claim)
+    except MediaUploadError as e:
+        now = datetime.utcnow()
+        created = _register(
+            [result for _, result in e.stored],
+            [upload.get('content_type') for upload, _ in e.stored],
+            now
+        )
+        _discard(created, now)
+        raise
+    _register(results, [upload.get('content_type') for upload in uploads], datetime.utcnow())
+    for upload, result in zip(uploads, results):
+        upload['key'] = result['key']
+        upload['url'] = storage.url(result['key'])
+    return results
+
+
+def recount_references():
+    """Recompute every blob's ref_count from the rows that store media URLs. Returns the number of blobs."""
+    storage = get_storage()
+    counts = {}
+    for model, column in MEDIA_URL_COLUMNS:
+        for (url,) in db.session.query(getattr(model, column)).filter(getattr(model, column).isnot(None)):
+            key = storage.key_for_url(url)
+            if key:
+                counts[key] = counts.get(key, 0) + 1
+
+    blobs = MediaBlob.query.all()
+    for blob in blobs:
+        blob.ref_count = counts.get(blob.key, 0)
+    db.session.commit()
+    return len(blobs)
+
+
+def collect_garbage(grace_hours=GC_GRACE_HOURS):
+    """
+    Delete unreferenced blobs, with their objects and resized variants.
+
+    Each blob row is deleted with a conditional DELETE first, so a blob that
+    was re-uploaded or referenced since it was selected is left alone. The
+    objects are deleted before that DELETE commits: an upload claiming the
+    same content meanwhile waits on the row, then finds it gone and uploads
+    the file again. Returns the number of blobs deleted.
+    """
+    storage = get_storage()
+    cutoff = datetime.utcnow() - timedelta(hours=grace_hours)
+    candidates = [
+        key for (key,) in db.session.query(MediaBlob.key).filter(
+            MediaBlob.ref_count <= 0,
+            MediaBlob.last_uploaded_at < cutoff
+        )
+    ]
+
+    deleted = 0
+    for key in candidates:
+        removed = MediaBlob.query.filter(
+            MediaBlob.key == key,
+            MediaBlob.ref_count <= 0,
+            MediaBlob.last_uploaded_at < cutoff
+        ).delete(synchronize_session=False)
+        if not removed:
+            continue
+
+        url = storage.url(key)
+        variants = MediaVariant.query.filter_by(source_url=url).all()
+        variant_keys = [storage.key_for_url(variant.url) for variant in variants]
+        for variant in variants:
+            db.session.delete(variant)
+        try:
+            storage.delete_many([key] + [variant_key for variant_key in variant_keys if variant_key])
+        except Exception:
+            db.session.rollback()
+            raise
+        db.session.commit()
+        deleted += 1
+    return deleted
@@ -0,0 +1,202 @@
+import io
+import json
+import os
+import time
+from flask import current_app, request
+from PIL import Image, ImageOps, features
+from redis.exceptions import RedisError
+from models import db, MediaVariant, YapMedia, ProductImages, Users, Events, Seller
+from . import get_redis
+from .storage import get_storage
+
+QUEUE_KEY = 'media:variants'
+
+VARIANT_WIDTHS = tuple(sorted(int(width) for width in os.getenv('MEDIA_VARIANT_WIDTHS', '160,320,640,1280').split(',')))
+VARIANT_QUALITY = int(os.getenv('MEDIA_VARIANT_QUALITY', 80))
+# AVIF needs a Pillow built with libavif; WebP is always produced
+VARIANT_FORMATS = ('webp', 'avif') if features.check('avif') else ('webp',)
+DEFAULT_FORMAT = 'webp'
+
+# Refuse to decode anything larger (decompression bombs, huge camera RAW exports)
+MAX_SOURCE_PIXELS = int(os.getenv('MEDIA_MAX_SOURCE_PIXELS', 50_000_000))
+IMAGE_EXTENSIONS = {'jpg', 'jpeg', 'png', 'gif', 'webp', 'avif'}
+
+
+def _is_image(url):
+    return bool(url) and url.rsplit('.', 1)[-1].lower() in IMAGE_EXTENSIONS
+
+
+def enqueue_variants(*urls):
+    """
+    Queue variant generation for newly stored images; call after commit.
+
+    URLs that are not images or not in our storage (e.g. external avatar
+    URLs) are ignored. Failures are swallowed: `flask media-worker --backfill`
+    picks up anything that was never queued.
+    """
+    storage = get_storage()
+    jobs = [json.dumps({'url': url}) for url in urls if _is_image(url) and storage.key_for_url(url)]
+    redis_client = get_redis()
+    if not jobs or redis_client is None:
+        return
+    try:
+        redis_client.lpush(QUEUE_KEY, *jobs)
+    except RedisError:
+        pass
+
+
+def _encode(image, fmt):
+    buffer = io.BytesIO()
+    if fmt == 'avif':
+        image.save(buffer, format='AVIF', quality=VARIANT_QUALITY)
+    else:
+        image.save(buffer, format='WEBP', quality=VARIANT_QUALITY, method=4)
+    return buffer.getvalue()
+
+
+def generate_variants(url):
+    """
+    Create the missing variants of one stored image and return how many were made.
+
+    Every width in VARIANT_WIDTHS below the original's width is produced in
+    each of VARIANT_FORMATS; images are never upscaled. Variants are stored
+    next to the original under variants/<original key>/.
+    """
+    storage = get_storage()
+    key = storage.key_for_url(url)
+    if key is None or not _is_image(url):
+        return 0
+
+    existing = {
+        (variant.width, variant.format)
+        for variant in MediaVariant.query.filter_by(source_url=url)
+    }
+
+    with Image.open(io.BytesIO(storage.get(key))) as original:
+        if original.width * original.height > MAX_SOURCE_PIXELS:
+            raise ValueError(f"Image too large to process: {original.width}x{original.height}")
+        image = ImageOps.exif_transpose(original)
+        image = image.convert('RGBA' if 'A' in image.getbands() else 'RGB')
+
+    created = 0
+    for width in VARIANT_WIDTHS:
+        if width >= image.width:
+            break
+        height = round(image.height * width / image.width)
+        resized = None
+        for fmt in VARIANT_FORMATS:
+            if (width, fmt) in existing:
+                continue
+            if resized is None:
+                resized = image.resize((width, height), Image.LANCZOS)
+            data = _encode(resized, fmt)
+            variant_key = f"variants/{key}/{width}.{fmt}"
+            variant_url = storage.put(variant_key, io.BytesIO(data), content_type=f"image/{fmt}", public=True)
+            db.session.add(MediaVariant(
+                source_url=url,
+                url=variant_url,
+                width=width,
+                height=height,
+                format=fmt,
+                size=len(data)
+            ))
+            created += 1
+
+    db.session.commit()
+    return created
+
+
+def run_worker(block_timeout=5, max_jobs=None):
+    """
+    Process queued images until interrupted (or max_jobs jobs were handled).
+
+    Jobs are popped with BRPOP, so several workers can share the queue. A job
+    that fails is logged and dropped; re-run with --backfill to retry.
+    """
+    redis_client = get_redis()
+    if redis_client is None:
+        raise RuntimeError('Redis is not configured')
+
+    handled = 0
+    while max_jobs is None or handled < max_jobs:
+        try:
+            job = redis_client.brpop(QUEUE_KEY, timeout=block_timeout)
+        except RedisError:
+            current_app.logger.exception('Media queue unavailable')
+            time.sleep(block_timeout)
+            continue
+        if job is None:
+            continue
+
+        url = json.loads(job[1])['url']
+        try:
+            generate_variants(url)
+        except Exception:
+            db.session.rollback()
+            current_app.logger.exception('Failed to generate variants for %s', url)
+        handled += 1
+    return handled
+
+
+def backfill_variants():
+    """Generate variants for every stored image that has none yet. Returns the number of images processed."""
+    sources = set()
+    sources.update(row.media_url for row in db.session.query(YapMedia.media_url).filter(YapMedia.media_type == 'image'))
+    sources.update(row.image_url for row in db.session.query(ProductImages.image_url))
+    sources.update(row.image_url for row in db.session.query(Events.image_url).filter(Events.image_url.isnot(None)))
+    sources.update(row.avatar for row in db.session.query(Users.avatar).filter(Users.avatar.isnot(None)))
+    sources.update(row.avatar for row in db.session.query(Seller.avatar).filter(Seller.avatar.isnot(None)))
+    sources -= {row.source_url for row in db.session.query(MediaVariant.source_url).distinct()}
+
+    processed = 0
+    for url in sorted(sources):
+        try:
+            generate_variants(url)
+            processed += 1
+        except Exception:
+            db.session.rollback()
+            current_app.logger.exception('Failed to generate variants for %s', url)
+    return processed
+
+
+class VariantPicker:
+    """
+    Maps original image URLs to the smallest variant at least `width` pixels wide.
+
+    Variants for all URLs are loaded with one query. Falls back to the
+    original when no variant is wide enough (variants are only ever smaller
+    than it) or when there are none (videos, external URLs, images still in
+    the queue).
+    """
+
+    def __init__(self, urls, width=None, fmt=DEFAULT_FORMAT):
+        self.width = width
+        self._variants = {}
+        urls = {url for url in urls if _is_image(url)}
+        if width is None or not urls:
+            return
+
+        variants = MediaVariant.query.filter(
+            MediaVariant.source_url.in_(urls),
+            MediaVariant.format == fmt
+        ).order_by(MediaVariant.width)
+        for variant in variants:
+            self._variants.setdefault(variant.source_url, []).append(variant)
+
+    def __call__(self, url):
+        variants = self._variants.get(url)
+        if not variants:
+            return url
+        for variant in variants:
+            if variant.width >= self.width:
+                return variant.url
+        return url
+
+
+def variant_picker(urls):
+    """VariantPicker for the current request's `w` (display width in pixels) and `format` args."""
+    width = request.args.get('w', type=int)
+    fmt = request.args.get('format', DEFAULT_FORMAT)
+    if fmt not in VARIANT_FORMATS:
+        fmt = DEFAULT_FORMAT
+    return VariantPicker(urls, width if width and width > 0 else None, fmt)
@@ -0,0 +1,85 @@
+from concurrent.futures import ThreadPoolExecutor, TimeoutError
+import base64
+import hashlib
+import os
+import threading
+import bcrypt
+from werkzeug.security import check_password_hash
+
+BCRYPT_ROUNDS = int(os.getenv('BCRYPT_ROUNDS', 12))
+# bcrypt releases the GIL, so these threads use real cores; capping them caps
+# the CPU that logins can take away from every other request.
+HASH_WORKERS = int(os.getenv('PASSWORD_HASH_WORKERS', max(1, (os.cpu_count() or 2) // 2)))
+# Hashes allowed to wait for a worker before new ones are refused
+HASH_QUEUE_SIZE = int(os.getenv('PASSWORD_HASH_QUEUE_SIZE', HASH_WORKERS * 8))
+HASH_TIMEOUT_SECONDS = float(os.getenv('PASSWORD_HASH_TIMEOUT', 10))
+
+_executor = ThreadPoolExecutor(max_workers=HASH_WORKERS, thread_name_prefix='password-hash')
+_slots = threading.BoundedSemaphore(HASH_WORKERS + HASH_QUEUE_SIZE)
+
+
+class PasswordHasherBusy(Exception):
+    """Too many hashes are queued; the caller should answer 503 and let the client retry."""
+
+
+def _prepare(password):
+    # bcrypt only reads the first 72 bytes; pre-hashing keeps long passphrases
+    # fully significant and removes NUL bytes
+    return base64.b64encode(hashlib.sha256(password.encode('utf-8')).digest())
+
+
+def _rounds(stored_hash):
+    # $2b$12$<salt+hash>
+    try:
+        return int(stored_hash.split('$')[2])
+    except (IndexError, ValueError):
+        return 0
+
+
+def _hash(password, rounds):
+    return bcrypt.hashpw(_prepare(password), bcrypt.gensalt(rounds=rounds)).decode('ascii')
+
+
+def _verify(password, stored_hash, rounds):
+    if stored_hash.startswith('$2'):
+        if not bcrypt.checkpw(_prepare(password), stored_hash.encode('ascii')):
+            return False, None
+        return True, (_hash(password, rounds) if _rounds(stored_hash) < rounds else None)
+
+    # Legacy werkzeug (pbkdf2/scrypt) hash: upgrade it while we have the password
+    if not check_password_hash(stored_hash, password):
+        return False, None
+    return True, _hash(password, rounds)
+
+
+def _run(fn, *args):
+    if not _slots.acquire(blocking=False):
+        raise PasswordHasherBusy()
+    try:
+        future = _executor.submit(fn, *args)
+    except BaseException:
+        _slots.release()
+        raise
+    future.add_done_callback(lambda _: _slots.release())
+    try:
+        return future.result(timeout=HASH_TIMEOUT_SECONDS)
+    except TimeoutError:
+        raise PasswordHasherBusy()
+
+
+def hash_password(password, rounds=None):
+    """bcrypt hash of password at BCRYPT_ROUNDS, computed on the bounded hashing pool."""
+    return _run(_hash, password, rounds or BCRYPT_ROUNDS)
+
+
+def verify_password(password, stored_hash, rounds=None):
+    """
+    Check password against a stored hash on the bounded hashing pool.
+
+    Returns (valid, new_hash). new_hash is set when the stored hash should be
+    replaced: a legacy werkzeug hash, or bcrypt below the current cost.
+    Raises PasswordHasherBusy when the pool's queue is full.
+    """
+    if not password or not stored_hash:
+        return False, None
+    return _run(_verify, password, stored_hash, rounds or BCRYPT_ROUNDS)
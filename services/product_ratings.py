@@ -0,0 +1,33 @@
+from sqlalchemy import select, func
+from models import db, Products, Seller, Reviews
+
+
+def reconcile_product_ratings():
+    """
+    Recompute rating_sum and rating_count for every product from its
+    reviews, then for every seller from its products, in two UPDATEs.
+
+    Repairs drift from bulk loads or deletes that bypass the ORM listeners.
+    Returns (products updated, sellers updated).
+    """
+    products = Products.__table__
+    sellers = Seller.__table__
+
+    product_result = db.session.execute(
+        products.update().values(
+            rating_sum=select(func.coalesce(func.sum(Reviews.rating), 0)).where(Reviews.product_id == products.c.id).scalar_subquery(),
+            rating_count=select(func.count(Reviews.rating)).where(Reviews.product_id == products.c.id).scalar_subquery(),
+            updated_at=products.c.updated_at,
+        )
+    )
+    seller_products = products.alias('seller_products')
+    seller_result = db.session.execute(
+        sellers.update().values(
+            rating_sum=select(func.coalesce(func.sum(seller_products.c.rating_sum), 0))
+            .where(seller_products.c.seller_id == sellers.c.id).scalar_subquery(),
+            rating_count=select(func.coalesce(func.sum(seller_products.c.rating_count), 0))
+            .where(seller_products.c.seller_id == sellers.c.id).scalar_subquery(),
+        )
+    )
+    db.session.commit()
+    return product_result.rowcount, seller_result.rowcount
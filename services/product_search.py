@@ -0,0 +1,201 @@
+import re
+from sqlalchemy import case, column, desc, event, func, literal_column, select, table
+from models import db, Products
+
+SEARCH_PAGE_SIZE = 20
+SEARCH_MAX_PAGE_SIZE = 100
+# Postgres text search configuration used for the stored vector and for queries
+SEARCH_CONFIG = 'english'
+# (low, high) price ranges for the price facet; high None is open-ended
+PRICE_BUCKETS = [(0, 50), (50, 100), (100, 250), (250, 500), (500, None)]
+
+# The index is kept in sync by the database itself, so bulk loads, raw SQL
+# and ORM writes are all covered.
+#
+# SQLite: an FTS5 table with a trigger per write. Rows are found again by
+# matching the indexed product_id column, since products has no stable
+# integer rowid to use as external content. Category and price are copied
+# in unindexed, so filters and facets never look up the products table.
+SQLITE_DDL = [
+    "CREATE VIRTUAL TABLE IF NOT EXISTS products_fts USING fts5("
+    "title, brand, description, product_id, category UNINDEXED, price UNINDEXED, "
+    "tokenize='unicode61 remove_diacritics 2')",
+    "CREATE TRIGGER IF NOT EXISTS products_fts_insert AFTER INSERT ON products BEGIN "
+    "INSERT INTO products_fts (title, brand, description, product_id, category, price) "
+    "VALUES (new.title, new.brand, new.description, new.id, new.category, new.price); "
+    "END",
+    "CREATE TRIGGER IF NOT EXISTS products_fts_delete AFTER DELETE ON products BEGIN "
+    "DELETE FROM products_fts WHERE products_fts MATCH 'product_id:\"' || old.id || '\"'; "
+    "END",
+    "CREATE TRIGGER IF NOT EXISTS products_fts_update AFTER UPDATE OF id, title, brand, description, category, price ON products BEGIN "
+    "DELETE FROM products_fts WHERE products_fts MATCH 'product_id:\"' || old.id || '\"'; "
+    "INSERT INTO products_fts (title, brand, description, product_id, category, price) "
+    "VALUES (new.title, new.brand, new.description, new.id, new.category, new.price); "
+    "END",
+]
+SQLITE_DROP = [
+    "DROP TRIGGER IF EXISTS products_fts_insert",
+    "DROP TRIGGER IF EXISTS products_fts_delete",
+    "DROP TRIGGER IF EXISTS products_fts_update",
+    "DROP TABLE IF EXISTS products_fts",
+]
+# PostgreSQL: a generated tsvector column, title weighted above brand above description
+POSTGRESQL_DDL = [
+    "ALTER TABLE products ADD COLUMN IF NOT EXISTS search_vector tsvector GENERATED ALWAYS AS ("
+    f"setweight(to_tsvector('{SEARCH_CONFIG}', coalesce(title, '')), 'A') || "
+    f"setweight(to_tsvector('{SEARCH_CONFIG}', coalesce(brand, '')), 'B') || "
+    f"setweight(to_tsvector('{SEARCH_CONFIG}', coalesce(description, '')), 'C')) STORED",
+    "CREATE INDEX IF NOT EXISTS ix_products_search_vector ON products USING gin (search_vector)",
+]
+SEARCH_DDL = {'sqlite': SQLITE_DDL, 'postgresql': POSTGRESQL_DDL}
+
+# bm25 weights for title, brand, description, product_id
+SQLITE_WEIGHTS = (10.0, 5.0, 1.0, 0.0)
+
+products_fts = table('products_fts', column('product_id'), column('category'), column('price'))
+
+
+def _create_search_index(target, connection, **kw):
+    for statement in SEARCH_DDL.get(connection.dialect.name, ()):
+        connection.exec_driver_sql(statement)
+
+
+def _drop_search_index(target, connection, **kw):
+    if connection.dialect.name == 'sqlite':
+        for statement in SQLITE_DROP:
+            connection.exec_driver_sql(statement)
+
+
+# db.create_all() and drop_all() manage the index along with the products table
+event.listen(Products.__table__, 'after_create', _create_search_index)
+event.listen(Products.__table__, 'before_drop', _drop_search_index)
+
+
+def rebuild_search_index():
+    """
+    Recreate the search index from the products table, e.g. on a database
+    made before the index existed. Returns the number of products.
+    """
+    connection = db.session.connection()
+    if db.engine.dialect.name == 'sqlite':
+        _drop_search_index(Products.__table__, connection)
+        _create_search_index(Products.__table__, connection)
+        connection.exec_driver_sql(
+            'INSERT INTO products_fts (title, brand, description, product_id, category, price) '
+            'SELECT title, brand, description, id, category, price FROM products'
+        )
+    elif db.engine.dialect.name == 'postgresql':
+        _create_search_index(Products.__table__, connection)
+        # The generated column is always current; rebuilding only compacts the index
+        connection.exec_driver_sql('REINDEX INDEX ix_products_search_vector')
+    db.session.commit()
+    return db.session.query(func.count(Products.id)).scalar()
+
+
+def search_terms(q):
+    """Lowercased word tokens of a user's query; punctuation and operators are dropped."""
+    return re.findall(r'\w+', (q or '').lower())
+
+
+def _matches(terms):
+    """
+    Subquery of the products matching the terms, with product_id, category,
+    price and rank columns, and the ORDER BY for it. Without terms every
+    product matches, newest first.
+    """
+    if not terms:
+        matches = select(
+            Products.id.label('product_id'), Products.category, Products.price,
+            literal_column('NULL').label('rank'), Products.created_at
+        ).subquery('matches')
+        return matches, [desc(matches.c.created_at), desc(matches.c.product_id)]
+
+    dialect = db.engine.dialect.name
+    if dialect == 'sqlite':
+        # Every term must match, the last one (still being typed) as a prefix
+        expression = ' AND '.join([f'"{term}"' for term in terms[:-1]] + [f'"{terms[-1]}"*'])
+        fts = literal_column('products_fts')
+        matches = select(
+            products_fts.c.product_id, products_fts.c.category, products_fts.c.price,
+            func.bm25(fts, *SQLITE_WEIGHTS).label('rank')
+        ).where(fts.op('MATCH')(f'{{title brand description}} : ({expression})')).subquery('matches')
+        # bm25 scores are negative; lower is more relevant
+        return matches, [matches.c.rank.asc(), desc(matches.c.product_id)]
+    if dialect == 'postgresql':
+        query = func.to_tsquery(SEARCH_CONFIG, ' & '.join(f'{term}:*' for term in terms))
+        vector = literal_column('products.search_vector')
+        matches = select(
+            Products.id.label('product_id'), Products.category, Products.price,
+            func.ts_rank_cd(vector, query).label('rank')
+        ).where(vector.op('@@')(query)).subquery('matches')
+        return matches, [desc(matches.c.rank), desc(matches.c.product_id)]
+    raise RuntimeError(f"Product search is not supported on {dialect}")
+
+
+def _price_bucket(price):
+    return case(
+        *[
+            ((price >= low) & (price < high) if high is not None else price >= low, str(index))
+            for index, (low, high) in enumerate(PRICE_BUCKETS)
+        ],
+        else_=None
+    )
+
+
+def search_products(q='', category=None, min_price=None, max_price=None, page=1, per_page=SEARCH_PAGE_SIZE, options=()):
+    """
+    Ranked product search with category and price facets.
+
+    Returns {'products': [(product, rank)], 'total', 'facets'}. Products
+    are ranked by relevance when q has terms, newest first otherwise. Each
+    facet counts the products matching every filter except its own, so a
+    client can show the alternatives to the current selection. options are
+    loader options for the Products query, e.g. selectinload(Products.images).
+    """
+    matches, order = _matches(search_terms(q))
+
+    category_filters = [matches.c.category == category] if category else []
+    price_filters = []
+    if min_price is not None:
+        price_filters.append(matches.c.price >= min_price)
+    if max_price is not None:
+        price_filters.append(matches.c.price <= max_price)
+    filters = category_filters + price_filters
+
+    # Rank and cut the page from the matches alone, then load just those products
+    ranked = dict(db.session.execute(
+        select(matches.c.product_id, matches.c.rank).where(*filters)
+        .order_by(*order).limit(per_page).offset((page - 1) * per_page)
+    ).all())
+    products = {
+        product.id: product
+        for product in db.session.execute(
+            select(Products).where(Products.id.in_(list(ranked))).options(*options)
+        ).scalars()
+    } if ranked else {}
+
+    total = db.session.execute(select(func.count()).select_from(matches).where(*filters)).scalar()
+
+    categories = db.session.execute(
+        select(matches.c.category, func.count())
+        .where(*price_filters)
+        .group_by(matches.c.category)
+        .order_by(desc(func.count()))
+    ).all()
+
+    bucket = _price_bucket(matches.c.price).label('bucket')
+    bucket_counts = dict(db.session.execute(
+        select(bucket, func.count()).where(*category_filters).group_by(bucket)
+    ).all())
+
+    return {
+        'products': [(products[product_id], rank) for product_id, rank in ranked.items() if product_id in products],
+        'total': total,
+        'facets': {
+            'category': [{'value': value, 'count': count} for value, count in categories if value is not None],
+            'price': [
+                {'min': low, 'max': high, 'count': bucket_counts.get(str(index), 0)}
+                for index, (low, high) in enumerate(PRICE_BUCKETS)
+            ],
+        },
+    }
@@ -0,0 +1,79 @@
+import os
+import threading
+import time
+from redis.exceptions import RedisError
+from . import get_redis
+
+RECONNECT_DELAY_SECONDS = 1
+MAX_RECONNECT_DELAY_SECONDS = 30
+
+
+def publish(channel, message):
+    """Publish to a Redis channel; returns False if Redis is unavailable."""
+    redis_client = get_redis()
+    if redis_client is None:
+        return False
+    try:
+        redis_client.publish(channel, message)
+    except RedisError:
+        return False
+    return True
+
+
+class Subscriber:
+    """
+    Background thread delivering messages on a Redis channel to a handler.
+
+    One thread per process; started lazily so gunicorn workers forked from a
+    preloaded app each subscribe on their own connection. on_subscribe is
+    called after every (re)subscription so callers can catch up on messages
+    they missed while disconnected. Handlers run on the subscriber thread and
+    must not touch the database session.
+    """
+
+    def __init__(self, channel, handler, on_subscribe=None):
+        self.channel = channel
+        self.handler = handler
+        self.on_subscribe = on_subscribe
+        self.subscribed = False
+        self._thread = None
+        self._pid = None
+        self._lock = threading.Lock()
+
+    def ensure_started(self, redis_client):
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive() and self._pid == os.getpid():
+                return
+            self.subscribed = False
+            self._pid = os.getpid()
+            self._thread = threading.Thread(
+                target=self._run,
+                args=(redis_client,),
+                name=f'subscriber:{self.channel}',
+                daemon=True
+            )
+            self._thread.start()
+
+    def _run(self, redis_client):
+        delay = RECONNECT_DELAY_SECONDS
+        while True:
+            pubsub = redis_client.pubsub(ignore_subscribe_messages=True)
+            try:
+                pubsub.subscribe(self.channel)
+                self.subscribed = True
+                delay = RECONNECT_DELAY_SECONDS
+                if self.on_subscribe:
+                    self.on_subscribe()
+                for message in pubsub.listen():
+                    if message['type'] == 'message':
+                        self.handler(message['data'])
+            except RedisError:
+                pass
+            finally:
+                self.subscribed = False
+                try:
+                    pubsub.close()
+                except RedisError:
+                    pass
+            time.sleep(delay)
+            delay = min(delay * 2, MAX_RECONNECT_DELAY_SECONDS)
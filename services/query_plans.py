@@ -0,0 +1,110 @@
+from datetime import datetime
+import json
+import re
+from sqlalchemy import select, desc, tuple_
+from models import (
+    db, Yap, YapMedia, Like, Reply, Follow, Notification, Friendship, Message,
+    Products, ProductImages, ProductVariation, Reviews, Cart, CartItem, Order,
+    Events, Comment_events, TokenBlocklist
+)
+
+# A full table scan in SQLite's EXPLAIN QUERY PLAN ("SCAN t", but not "SCAN t USING INDEX ...")
+SQLITE_FULL_SCAN = re.compile(r'^SCAN (\w+)\b(?! USING)')
+
+
+def hot_queries():
+    """
+    (name, statement) pairs mirroring the filters and sort orders of the hot views.
+
+    Parameter values are placeholders; only the shape of each query matters.
+    """
+    now = datetime.utcnow()
+    return [
+        ('GET /yaps', select(Yap).order_by(desc(Yap.created_at)).limit(10)),
+        ('GET /yaps?cursor=', select(Yap).where(tuple_(Yap.created_at, Yap.id) < (now, 'x'))
+            .order_by(desc(Yap.created_at), desc(Yap.id)).limit(11)),
+        ('GET /api/users/<id>/yaps', select(Yap).where(Yap.user_id == 1).order_by(desc(Yap.created_at))),
+        ('yap media (selectin)', select(YapMedia).where(YapMedia.yap_id.in_(['a', 'b']))),
+        ('likes on a yap', select(Like).where(Like.yap_id == 'a', Like.user_id == 1)),
+        ('replies to a yap', select(Reply).where(Reply.yap_id == 'a').order_by(Reply.created_at)),
+        ('timeline fan-out', select(Follow.follower_id).where(Follow.following_id == 1)),
+        ('unread notifications', select(Notification).where(Notification.recipient_id == 1, Notification.is_read.is_(False))
+            .order_by(desc(Notification.created_at))),
+        ('GET /friends/pending', select(Friendship).where(Friendship.friend_id == 1, Friendship.status == 'pending')),
+        ('chat history', select(Message).where(Message.user_id == 1).order_by(desc(Message.timestamp)).limit(10)),
+        ('GET /products?cursor=', select(Products).where(tuple_(Products.created_at, Products.id) < (now, 'x'))
+            .order_by(desc(Products.created_at), desc(Products.id)).limit(21)),
+        ('GET /marketplace/search?category=', select(Products).where(Products.category == 'Books')
+            .order_by(desc(Products.created_at))),
+        ('seller products', select(Products).where(Products.seller_id == 'a')),
+        ('product images (selectin)', select(ProductImages).where(ProductImages.product_id.in_(['a', 'b']))),
+        ('product variations (selectin)', select(ProductVariation).where(ProductVariation.product_id.in_(['a', 'b']))),
+        ('product reviews', select(Reviews).where(Reviews.product_id == 'a')),
+        ('GET /cart/<user_id>', select(Cart).where(Cart.user_id == 1)),
+        ('cart items', select(CartItem).where(CartItem.cart_id == 'a', CartItem.product_id == 'b')),
+        ('GET /get_latest_order_id', select(Order).where(Order.user_id == 1).order_by(desc(Order.created_at)).limit(1)),
+        ('GET /events/category/<category>', select(Events).where(Events.category == 'Music')
+            .order_by(Events.date_of_event)),
+        ('upcoming events', select(Events).where(Events.date_of_event >= now).order_by(Events.date_of_event)),
+        ('GET /user-events', select(Events).where(Events.user_id == 1)),
+        ('event comments (selectin)', select(Comment_events).where(Comment_events.event_id.in_(['a', 'b']))),
+        ('token_in_blocklist_loader', select(TokenBlocklist.id).where(TokenBlocklist.jti == 'a').limit(1)),
+    ]
+
+
+def _compile(statement, dialect):
+    compiled = statement.compile(dialect=dialect, compile_kwargs={'render_postcompile': True})
+    params = compiled.construct_params()
+    if compiled.positional:
+        params = tuple(params[name] for name in compiled.positiontup)
+    return str(compiled), params
+
+
+def _sqlite_problems(connection, sql, params):
+    plan = [row[3] for row in connection.exec_driver_sql(f'EXPLAIN QUERY PLAN {sql}', params)]
+    problems = []
+    for detail in plan:
+        match = SQLITE_FULL_SCAN.match(detail)
+        if match:
+            problems.append(f'full scan of {match.group(1)}')
+        elif detail.startswith('USE TEMP B-TREE'):
+            problems.append(detail.lower())
+    return plan, problems
+
+
+def _postgresql_problems(connection, sql, params):
+    # Without seq scans as an option the planner only picks one where no index applies
+    connection.exec_driver_sql('SET LOCAL enable_seqscan = off')
+    result = connection.exec_driver_sql(f'EXPLAIN (FORMAT JSON) {sql}', params).scalar()
+    plan = result if isinstance(result, list) else json.loads(result)
+
+    problems, lines = [], []
+    nodes = [(plan[0]['Plan'], 0)]
+    while nodes:
+        node, depth = nodes.pop()
+        lines.append('  ' * depth + node['Node Type'] + (f" on {node['Relation Name']}" if 'Relation Name' in node else ''))
+        if node['Node Type'] == 'Seq Scan':
+            problems.append(f"full scan of {node['Relation Name']}")
+        nodes.extend((child, depth + 1) for child in reversed(node.get('Plans', [])))
+    return lines, problems
+
+
+def check_query_plans():
+    """
+    EXPLAIN every hot query on the current database.
+
+    Returns (name, plan lines, problems) per query; problems is empty when
+    the query is answered from an index.
+    """
+    dialect = db.engine.dialect
+    explain = {'sqlite': _sqlite_problems, 'postgresql': _postgresql_problems}.get(dialect.name)
+    if explain is None:
+        raise RuntimeError(f"Query plan checks are not supported on {dialect.name}")
+    results = []
+    with db.engine.connect() as connection:
+        for name, statement in hot_queries():
+            sql, params = _compile(statement, dialect)
+            with connection.begin():
+                plan, problems = explain(connection, sql, params)
+            results.append((name, plan, problems))
+    return results
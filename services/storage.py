@@ -0,0 +1,342 @@
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_EXCEPTION
+import hashlib
+import mimetypes
+import os
+import shutil
+import threading
+import time
+import boto3
+from boto3.s3.transfer import TransferConfig
+from botocore.config import Config
+from botocore.exceptions import ClientError
+from dotenv import load_dotenv
+load_dotenv()
+
+UPLOAD_WORKERS = int(os.getenv('MEDIA_UPLOAD_WORKERS', 8))
+MULTIPART_THRESHOLD = int(os.getenv('MEDIA_MULTIPART_THRESHOLD', 8 * 1024 * 1024))
+MULTIPART_CHUNKSIZE = int(os.getenv('MEDIA_MULTIPART_CHUNKSIZE', 8 * 1024 * 1024))
+MULTIPART_CONCURRENCY = int(os.getenv('MEDIA_MULTIPART_CONCURRENCY', 4))
+HASH_CHUNK_SIZE = 1024 * 1024
+
+# Files above the threshold are sent as multipart uploads with parts in parallel;
+# s3transfer aborts the multipart upload itself if a part fails.
+TRANSFER_CONFIG = TransferConfig(
+    multipart_threshold=MULTIPART_THRESHOLD,
+    multipart_chunksize=MULTIPART_CHUNKSIZE,
+    max_concurrency=MULTIPART_CONCURRENCY,
+)
+
+# Shared by every request, so concurrent posts cannot open unbounded uploads
+_executor = ThreadPoolExecutor(max_workers=UPLOAD_WORKERS, thread_name_prefix='media-upload')
+
+
+class MediaUploadError(Exception):
+    def __init__(self, key, cause, stored=()):
+        super().__init__(f"Error uploading {key}: {cause}")
+        self.key = key
+        self.cause = cause
+        # (upload, result) for content-addressed files the batch did store
+        self.stored = list(stored)
+
+
+class S3Backend:
+    """
+    R2/S3 bucket behind one connection-pooled client.
+
+    The pool must be at least as large as the number of threads that upload
+    at once (upload pool x multipart concurrency), otherwise requests queue
+    for a connection.
+    """
+
+    def __init__(self, bucket, endpoint_url=None, access_key_id=None, secret_access_key=None,
+                 max_pool_connections=50, max_attempts=5, connect_timeout=5, read_timeout=60):
+        self.bucket = bucket
+        self.client = boto3.client(
+            's3',
+            endpoint_url=endpoint_url,
+            aws_access_key_id=access_key_id,
+            aws_secret_access_key=secret_access_key,
+            config=Config(
+                max_pool_connections=max_pool_connections,
+                retries={'mode': 'adaptive', 'max_attempts': max_attempts},
+                connect_timeout=connect_timeout,
+                read_timeout=read_timeout,
+                tcp_keepalive=True,
+            )
+        )
+
+    def put(self, key, fileobj, content_type=None, public=False):
+        extra_args = {}
+        if content_type:
+            extra_args['ContentType'] = content_type
+        if public:
+            extra_args['ACL'] = 'public-read'
+        self.client.upload_fileobj(fileobj, self.bucket, key, ExtraArgs=extra_args or None, Config=TRANSFER_CONFIG)
+
+    def get(self, key):
+        return self.client.get_object(Bucket=self.bucket, Key=key)['Body'].read()
+
+    def delete_many(self, keys):
+        # DeleteObjects accepts at most 1000 keys per call
+        for start in range(0, len(keys), 1000):
+            self.client.delete_objects(
+                Bucket=self.bucket,
+                Delete={'Objects': [{'Key': key} for key in keys[start:start + 1000]], 'Quiet': True}
+            )
+
+    def presign(self, key, expires_in=3600):
+        return self.client.generate_presigned_url(
+            'get_object',
+            Params={'Bucket': self.bucket, 'Key': key},
+            ExpiresIn=expires_in
+        )
+
+    def presign_put(self, key, content_type, expires_in=900):
+        # Content-Type is part of the signature, so the client must send the declared type.
+        # R2 has no presigned POST, so size is checked with head() once the client confirms.
+        return self.client.generate_presigned_url(
+            'put_object',
+            Params={'Bucket': self.bucket, 'Key': key, 'ContentType': content_type},
+            ExpiresIn=expires_in
+        )
+
+    def head(self, key):
+        try:
+            response = self.client.head_object(Bucket=self.bucket, Key=key)
+        except ClientError as e:
+            if e.response.get('Error', {}).get('Code') in ('404', 'NoSuchKey', 'NotFound'):
+                return None
+            raise
+        return {'size': response['ContentLength'], 'content_type': response.get('ContentType')}
+
+
+class LocalBackend:
+    """Stores objects under a directory; for tests, benchmarks and offline development."""
+
+    def __init__(self, root, base_url):
+        self.root = root
+        self.base_url = base_url.rstrip('/')
+
+    def _path(self, key):
+        path = os.path.abspath(os.path.join(self.root, key))
+        if not path.startswith(os.path.abspath(self.root) + os.sep):
+            raise ValueError(f"Invalid key: {key}")
+        return path
+
+    def put(self, key, fileobj, content_type=None, public=False):
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'wb') as destination:
+            shutil.copyfileobj(fileobj, destination)
+
+    def get(self, key):
+        with open(self._path(key), 'rb') as source:
+            return source.read()
+
+    def delete_many(self, keys):
+        for key in keys:
+            try:
+                os.remove(self._path(key))
+            except FileNotFoundError:
+                pass
+
+    def presign(self, key, expires_in=3600):
+        return f"{self.base_url}/{key}"
+
+    def presign_put(self, key, content_type, expires_in=900):
+        # Nothing to sign locally; in development the file is written under root directly
+        return f"{self.base_url}/{key}"
+
+    def head(self, key):
+        try:
+            size = os.path.getsize(self._path(key))
+        except FileNotFoundError:
+            return None
+        return {'size': size, 'content_type': mimetypes.guess_type(key)[0]}
+
+
+class MediaStorage:
+    """
+    Media storage used by every upload path.
+
+    url() builds the public URL (IMAGE_PREFIX/key) that is stored on rows;
+    put_many() uploads several files concurrently and cleans up on failure;
+    presign_put() and head() back direct-to-bucket uploads.
+    """
+
+    def __init__(self, backend, public_prefix):
+        self.backend = backend
+        self.public_prefix = (public_prefix or '').rstrip('/')
+
+    def url(self, key):
+        return f"{self.public_prefix}/{key}"
+
+    def key_for_url(self, url):
+        """Inverse of url(); None for URLs that do not point into this storage."""
+        prefix = self.public_prefix + '/'
+        if not url or not url.startswith(prefix):
+            return None
+        return url[len(prefix):]
+
+    def put(self, key, fileobj, content_type=None, public=False):
+        """Upload one file and return its public URL."""
+        self.backend.put(key, fileobj, content_type=content_type, public=public)
+        return self.url(key)
+
+    def put_content_addressed(self, fileobj, filename, content_type=None, public=False, exists=None):
+        """
+        Store a file under a key derived from its SHA-256 and return its details.
+
+        The file is hashed in chunks and rewound, then uploaded only if no
+        object with that key exists yet, so identical files are stored once
+        whatever they are called. exists(key) decides that, by default with
+        a HEAD request. Returns a dict with 'key', 'sha256', 'size' and
+        'uploaded' (False when the PUT was skipped).
+        """
+        digest = hashlib.sha256()
+        size = 0
+        for chunk in iter(lambda: fileobj.read(HASH_CHUNK_SIZE), b''):
+            digest.update(chunk)
+            size += len(chunk)
+        fileobj.seek(0)
+
+        sha256 = digest.hexdigest()
+        extension = os.path.splitext(filename or '')[1].lower()
+        if not extension[1:].isalnum():
+            extension = ''
+        key = f"media/{sha256[:2]}/{sha256}{extension}"
+
+        uploaded = not (exists(key) if exists else self.backend.head(key) is not None)
+        if uploaded:
+            self.backend.put(key, fileobj, content_type=content_type, public=public)
+        return {'key': key, 'sha256': sha256, 'size': size, 'uploaded': uploaded}
+
+    def get(self, key):
+        """Contents of a stored object as bytes."""
+        return self.backend.get(key)
+
+    def _timed_put(self, upload, exists=None):
+        start = time.perf_counter()
+        if 'key' in upload:
+            self.backend.put(
+                upload['key'],
+                upload['fileobj'],
+                content_type=upload.get('content_type'),
+                public=upload.get('public', False)
+            )
+            result = {'key': upload['key']}
+        else:
+            result = self.put_content_addressed(
+                upload['fileobj'],
+                upload.get('filename'),
+                content_type=upload.get('content_type'),
+                public=upload.get('public', False),
+                exists=exists
+            )
+        result['ms'] = round((time.perf_counter() - start) * 1000, 1)
+        return result
+
+    def put_many(self, uploads, exists=None):
+        """
+        Upload files concurrently on the shared upload pool.
+
+        uploads is a list of dicts with 'fileobj', 'key' and optional
+        'content_type' and 'public'. Uploads given a 'filename' instead of a
+        'key' are stored content-addressed (see put_content_addressed, which
+        gets exists). Returns per-file results with the key and timing in
+        the same order.
+
+        If any upload fails, uploads that have not started are cancelled,
+        the keyed ones this call stored are deleted, and MediaUploadError is
+        raised. Content-addressed objects may already be shared with a
+        concurrent upload of the same file, so they are not deleted here;
+        they are listed in the error's stored for the caller to deal with.
+        """
+        futures = [_executor.submit(self._timed_put, upload, exists) for upload in uploads]
+        done, pending = wait(futures, return_when=FIRST_EXCEPTION)
+
+        failed = next((future for future in futures if future in done and future.exception()), None)
+        if failed is None:
+            return [future.result() for future in futures]
+
+        for future in pending:
+            future.cancel()
+        # Uploads already in flight cannot be interrupted; wait so they can be cleaned up too
+        wait(futures)
+
+        stored = [
+            (upload, future.result())
+            for upload, future in zip(uploads, futures)
+            if not future.cancelled() and future.exception() is None
+        ]
+        keyed = [result['key'] for upload, result in stored if 'key' in upload]
+        if keyed:
+            try:
+                self.backend.delete_many(keyed)
+            except Exception:
+                pass
+
+        failed_upload = uploads[futures.index(failed)]
+        raise MediaUploadError(
+            failed_upload.get('key', failed_upload.get('filename')),
+            failed.exception(),
+            stored=[(upload, result) for upload, result in stored if 'key' not in upload]
+        )
+
+    def delete_many(self, keys):
+        if keys:
+            self.backend.delete_many(list(keys))
+
+    def presign(self, key, expires_in=3600):
+        return self.backend.presign(key, expires_in=expires_in)
+
+    def presign_put(self, key, content_type, expires_in=900):
+        """URL the client PUTs the file to directly, bypassing the API workers."""
+        return self.backend.presign_put(key, content_type, expires_in=expires_in)
+
+    def head(self, key):
+        """Size and content type of a stored object, or None if it does not exist."""
+        return self.backend.head(key)
+
+
+def storage_from_env():
+    if os.getenv('MEDIA_STORAGE_BACKEND', 's3') == 'local':
+        base_url = os.getenv('MEDIA_LOCAL_URL', '/media')
+        return MediaStorage(LocalBackend(os.getenv('MEDIA_LOCAL_ROOT', 'media'), base_url), base_url)
+    else:
+        backend = S3Backend(
+            os.getenv('R2_BUCKET_NAME'),
+            endpoint_url=os.getenv('R2_ENDPOINT_URL'),
+            access_key_id=os.getenv('R2_ACCESS_KEY_ID'),
+            secret_access_key=os.getenv('R2_SECRET_ACCESS_KEY'),
+            max_pool_connections=int(os.getenv('S3_MAX_POOL_CONNECTIONS', 50)),
+            max_attempts=int(os.getenv('S3_MAX_ATTEMPTS', 5)),
+            connect_timeout=float(os.getenv('S3_CONNECT_TIMEOUT', 5)),
+            read_timeout=float(os.getenv('S3_READ_TIMEOUT', 60)),
+        )
+        return MediaStorage(backend, os.getenv('IMAGE_PREFIX'))
+
+
+_storage = None
+_storage_lock = threading.Lock()
+
+
+def get_storage():
+    """
+    The process-wide MediaStorage, created on first use.
+
+    Created lazily so gunicorn workers forked from a preloaded app each open
+    their own connection pool.
+    """
+    global _storage
+    if _storage is None:
+        with _storage_lock:
+            if _storage is None:
+                _storage = storage_from_env()
+    return _storage
+
+
+def set_storage(storage):
+    """Replace the process-wide storage (tests, benchmarks)."""
+    global _storage
+    _storage = storage
@@ -0,0 +1,188 @@
+from datetime import datetime, timezone
+import os
+from redis.exceptions import RedisError
+from sqlalchemy import desc, or_, tuple_
+from models import db, Follow, Yap
+from . import get_redis
+
+TIMELINE_KEY = 'timeline:{user_id}'
+# Authors whose yaps are merged in at read time instead of fanned out
+HIGH_FOLLOWER_KEY = 'timeline:high_follower_authors'
+
+TIMELINE_SIZE = int(os.getenv('TIMELINE_SIZE', 800))
+FANOUT_FOLLOWER_LIMIT = int(os.getenv('TIMELINE_FANOUT_FOLLOWER_LIMIT', 5000))
+PIPELINE_BATCH = 500
+
+
+def _to_score(created_at):
+    # created_at columns hold naive UTC datetimes
+    return created_at.replace(tzinfo=timezone.utc).timestamp()
+
+
+def _from_score(score):
+    return datetime.fromtimestamp(score, timezone.utc).replace(tzinfo=None)
+
+
+def _timeline_key(user_id):
+    return TIMELINE_KEY.format(user_id=user_id)
+
+
+def _push(redis_client, user_ids, entries):
+    """ZADD entries ({yap_id: score}) to each user's timeline and cap its length."""
+    pipe = redis_client.pipeline(transaction=False)
+    for index, user_id in enumerate(user_ids, 1):
+        key = _timeline_key(user_id)
+        pipe.zadd(key, entries)
+        pipe.zremrangebyrank(key, 0, -(TIMELINE_SIZE + 1))
+        if index % PIPELINE_BATCH == 0:
+            pipe.execute()
+    pipe.execute()
+
+
+def fan_out(yap):
+    """
+    Push a newly committed yap into the timelines of its author and followers.
+
+    Authors with more than FANOUT_FOLLOWER_LIMIT followers are skipped and
+    flagged instead; their yaps are merged in when a follower reads.
+    Failures are swallowed: posting must not depend on Redis.
+    """
+    redis_client = get_redis()
+    if redis_client is None:
+        return
+
+    follower_ids = [
+        row.follower_id
+        for row in db.session.query(Follow.follower_id)
+        .filter(Follow.following_id == yap.user_id)
+        .limit(FANOUT_FOLLOWER_LIMIT + 1)
+    ]
+
+    try:
+        if len(follower_ids) > FANOUT_FOLLOWER_LIMIT:
+            redis_client.sadd(HIGH_FOLLOWER_KEY, yap.user_id)
+            follower_ids = []
+        _push(redis_client, [yap.user_id] + follower_ids, {yap.id: _to_score(yap.created_at)})
+    except RedisError:
+        pass
+
+
+def _older_than(query, before):
+    """Keyset filter for yaps after the (score, yap_id) cursor in newest-first order."""
+    if before is None:
+        return query
+    score, yap_id = before
+    return query.filter(tuple_(Yap.created_at, Yap.id) < (_from_score(score), yap_id))
+
+
+def _newest_first(query, limit):
+    rows = query.order_by(desc(Yap.created_at), desc(Yap.id)).limit(limit)
+    return [(row.id, _to_score(row.created_at)) for row in rows]
+
+
+def _read_from_db(user_id, before, limit):
+    """Fan-out-on-read: the user's own yaps and those of everyone they follow."""
+    following = db.session.query(Follow.following_id).filter(Follow.follower_id == user_id)
+    query = db.session.query(Yap.id, Yap.created_at).filter(
+        or_(Yap.user_id == user_id, Yap.user_id.in_(following))
+    )
+    return _newest_first(_older_than(query, before), limit)
+
+
+def _read_high_follower_authors(author_ids, user_id, before, limit):
+    authors = [int(author_id) for author_id in author_ids]
+    if not authors:
+        return []
+
+    followed = db.session.query(Follow.following_id).filter(
+        Follow.follower_id == user_id,
+        Follow.following_id.in_(authors)
+    )
+    query = db.session.query(Yap.id, Yap.created_at).filter(Yap.user_id.in_(followed))
+    return _newest_first(_older_than(query, before), limit)
+
+
+def read_timeline(user_id, before=None, limit=20):
+    """
+    Yap ids for a user's home timeline, newest first, as (yap_id, score) pairs.
+
+    before is the (score, yap_id) of the last entry already seen, for
+    paging; entries are ordered by score, then yap id, so yaps posted in the
+    same instant are neither skipped nor repeated across pages. Reads the
+    user's Redis sorted set, merging in yaps from followed high-follower
+    authors. The set only keeps the newest TIMELINE_SIZE entries, so pages
+    past its end, and reads without Redis or the set, come from the database.
+    """
+    redis_client = get_redis()
+    if redis_client is None:
+        return _read_from_db(user_id, before, limit)
+
+    key = _timeline_key(user_id)
+    try:
+        # One round trip for the timeline page and the high-follower author set
+        pipe = redis_client.pipeline(transaction=False)
+        pipe.zcard(key)
+        if before is None:
+            pipe.zrevrangebyscore(key, '+inf', '-inf', start=0, num=limit, withscores=True)
+        else:
+            # Entries sharing the cursor's score (ties), then strictly older ones
+            pipe.zrevrangebyscore(key, before[0], before[0], withscores=True)
+            pipe.zrevrangebyscore(key, f'({before[0]}', '-inf', start=0, num=limit, withscores=True)
+        pipe.smembers(HIGH_FOLLOWER_KEY)
+        size, *pages, high_follower_authors = pipe.execute()
+    except RedisError:
+        return _read_from_db(user_id, before, limit)
+
+    if not size:
+        return _read_from_db(user_id, before, limit)
+
+    entries = [(yap_id.decode(), score) for page in pages for yap_id, score in page]
+    entries += _read_high_follower_authors(high_follower_authors, user_id, before, limit)
+
+    # High-follower yaps may also have been fanned out before the author crossed the limit
+    entries = list(dict(entries).items())
+    if before is not None:
+        entries = [(yap_id, score) for yap_id, score in entries if (score, yap_id) < tuple(before)]
+    entries.sort(key=lambda entry: (entry[1], entry[0]), reverse=True)
+    entries = entries[:limit]
+
+    # A full set may have had older entries trimmed off; continue from the database
+    if len(entries) < limit and size >= TIMELINE_SIZE:
+        last = (entries[-1][1], entries[-1][0]) if entries else before
+        entries += _read_from_db(user_id, last, limit - len(entries))
+    return entries
+
+
+def backfill_timelines(reset=False):
+    """
+    Rebuild every home timeline from existing Follow and Yap rows.
+
+    Works author by author: each author's latest TIMELINE_SIZE yaps are pushed
+    to the author and their followers, skipping high-follower authors the same
+    way fan_out does. Returns the number of authors processed.
+    """
+    redis_client = get_redis()
+    if redis_client is None:
+        raise RuntimeError('Redis is not configured')
+
+    if reset:
+        for key in redis_client.scan_iter(match=TIMELINE_KEY.format(user_id='*'), count=1000):
+            redis_client.delete(key)
+
+    author_ids = [row.user_id for row in db.session.query(Yap.user_id).distinct()]
+    for author_id in author_ids:
+        recent = db.session.query(Yap.id, Yap.created_at).filter(
+            Yap.user_id == author_id
+        ).order_by(desc(Yap.created_at)).limit(TIMELINE_SIZE).all()
+        entries = {row.id: _to_score(row.created_at) for row in recent}
+
+        follower_ids = [row.follower_id for row in db.session.query(Follow.follower_id).filter(Follow.following_id == author_id)]
+        if len(follower_ids) > FANOUT_FOLLOWER_LIMIT:
+            redis_client.sadd(HIGH_FOLLOWER_KEY, author_id)
+            follower_ids = []
+        else:
+            redis_client.srem(HIGH_FOLLOWER_KEY, author_id)
+
+        _push(redis_client, [author_id] + follower_ids, entries)
+
+    return len(author_ids)
@@ -0,0 +1,212 @@
+from collections import OrderedDict
+from datetime import datetime, timedelta
+import hashlib
+import math
+import os
+import threading
+import time
+from flask import current_app
+from models import db, TokenBlocklist
+from . import get_redis
+from .pubsub import Subscriber, publish
+
+REVOKED_CHANNEL = 'jwt:revoked'
+
+BLOOM_CAPACITY = int(os.getenv('JWT_BLOCKLIST_BLOOM_CAPACITY', 100_000))
+BLOOM_ERROR_RATE = float(os.getenv('JWT_BLOCKLIST_BLOOM_ERROR_RATE', 0.001))
+# How often to pull new revocations from the database. Pub/sub normally
+# delivers them instantly; the poll covers missed messages and runs without Redis.
+SYNC_SECONDS = int(os.getenv('JWT_BLOCKLIST_SYNC_SECONDS', 5))
+SUBSCRIBED_SYNC_SECONDS = int(os.getenv('JWT_BLOCKLIST_SUBSCRIBED_SYNC_SECONDS', 60))
+# Full rebuilds drop revocations of tokens that have expired since
+REBUILD_SECONDS = int(os.getenv('JWT_BLOCKLIST_REBUILD_SECONDS', 3600))
+
+RECENT_SIZE = 10_000
+# How long a Bloom false positive is remembered as "not revoked"
+NEGATIVE_TTL_SECONDS = 60
+
+
+class BloomFilter:
+    def __init__(self, capacity, error_rate):
+        self.capacity = capacity
+        self.size = max(64, int(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.hashes = max(1, round(self.size / capacity * math.log(2)))
+        self.bits = bytearray((self.size + 7) // 8)
+        self.count = 0
+
+    def _positions(self, item):
+        # Double hashing: k positions from two 64-bit halves of one digest
+        digest = hashlib.blake2b(item.encode(), digest_size=16).digest()
+        first = int.from_bytes(digest[:8], 'little')
+        second = int.from_bytes(digest[8:], 'little') | 1
+        return [(first + i * second) % self.size for i in range(self.hashes)]
+
+    def add(self, item):
+        for position in self._positions(item):
+            self.bits[position >> 3] |= 1 << (position & 7)
+        self.count += 1
+
+    def __contains__(self, item):
+        return all(self.bits[position >> 3] & (1 << (position & 7)) for position in self._positions(item))
+
+
+class RevocationCache:
+    """
+    Per-worker answer to "is this jti revoked?" for token_in_blocklist_loader.
+
+    A Bloom filter of every unexpired revoked jti answers the common case (a
+    valid token) without touching the database. Bloom hits are confirmed with
+    an indexed lookup and remembered in a small TTL set. New revocations
+    arrive over Redis pub/sub from /logout, with a periodic incremental poll
+    of the table as a fallback.
+    """
+
+    def __init__(self):
+        self._bloom = None
+        self._recent = OrderedDict()  # jti -> (revoked, expires_at)
+        self._last_id = 0
+        self._max_age = 0.0
+        self._built_at = 0.0
+        self._synced_at = 0.0
+        self._needs_sync = False
+        self._lock = threading.Lock()
+        self._subscriber = Subscriber(REVOKED_CHANNEL, self._on_revoked, on_subscribe=self._on_subscribe)
+
+    def _max_age_seconds(self):
+        # How long a revocation matters: tokens are rejected anyway once expired
+        expires = current_app.config['JWT_ACCESS_TOKEN_EXPIRES']
+        if expires is False:
+            return float('inf')
+        return expires.total_seconds() if isinstance(expires, timedelta) else float(expires)
+
+    def _remember(self, jti, revoked, expires_at):
+        self._recent[jti] = (revoked, expires_at)
+        self._recent.move_to_end(jti)
+        while len(self._recent) > RECENT_SIZE:
+            self._recent.popitem(last=False)
+
+    # Synchronisation
+
+    def _on_revoked(self, data):
+        # Runs on the subscriber thread
+        jti = data.decode() if isinstance(data, bytes) else data
+        with self._lock:
+            if self._bloom is not None:
+                self._bloom.add(jti)
+            self._remember(jti, True, time.time() + self._max_age)
+
+    def _on_subscribe(self):
+        # Anything published while we were not subscribed is picked up by the next poll
+        self._needs_sync = True
+
+    def _rebuild(self):
+        max_age = self._max_age_seconds()
+        # Bound the load by id so rows inserted meanwhile are left for the next sync
+        last_id = db.session.query(db.func.max(TokenBlocklist.id)).scalar() or 0
+        query = db.session.query(TokenBlocklist.id, TokenBlocklist.jti).filter(TokenBlocklist.id <= last_id)
+        if max_age != float('inf'):
+            query = query.filter(TokenBlocklist.created_at >= datetime.utcnow() - timedelta(seconds=max_age))
+        rows = query.all()
+
+        bloom = BloomFilter(max(BLOOM_CAPACITY, 2 * len(rows)), BLOOM_ERROR_RATE)
+        for row in rows:
+            if row.jti:
+                bloom.add(row.jti)
+
+        with self._lock:
+            # Revocations that arrived over pub/sub while loading went into the
+            # old filter; carry them over. Negative answers are dropped, since
+            # the new filter has different false positives.
+            now = time.time()
+            revoked = [(jti, expires_at) for jti, (is_revoked, expires_at) in self._recent.items()
+                       if is_revoked and expires_at > now]
+            for jti, _ in revoked:
+                bloom.add(jti)
+            self._bloom = bloom
+            self._last_id = last_id
+            self._max_age = max_age
+            self._recent = OrderedDict((jti, (True, expires_at)) for jti, expires_at in revoked)
+            self._built_at = self._synced_at = time.monotonic()
+
+    def _sync(self):
+        rows = db.session.query(TokenBlocklist.id, TokenBlocklist.jti).filter(
+            TokenBlocklist.id > self._last_id
+        ).order_by(TokenBlocklist.id).all()
+
+        expires_at = time.time() + self._max_age
+        with self._lock:
+            for row in rows:
+                if row.jti:
+                    self._bloom.add(row.jti)
+                    self._remember(row.jti, True, expires_at)
+                self._last_id = max(self._last_id, row.id)
+            self._synced_at = time.monotonic()
+        return self._bloom.count > self._bloom.capacity
+
+    def _sync_if_due(self):
+        redis_client = get_redis()
+        if redis_client is not None:
+            self._subscriber.ensure_started(redis_client)
+
+        now = time.monotonic()
+        if self._bloom is None or now - self._built_at > REBUILD_SECONDS:
+            self._rebuild()
+            return
+
+        interval = SUBSCRIBED_SYNC_SECONDS if self._subscriber.subscribed else SYNC_SECONDS
+        if self._needs_sync or now - self._synced_at > interval:
+            self._needs_sync = False
+            if self._sync():
+                # Past capacity the false positive rate climbs; rebuild larger
+                self._rebuild()
+
+    # Public API
+
+    def is_revoked(self, jti, exp=None):
+        self._sync_if_due()
+
+        now = time.time()
+        with self._lock:
+            cached = self._recent.get(jti)
+            if cached is not None and cached[1] > now:
+                return cached[0]
+            if jti not in self._bloom:
+                return False
+
+        # Bloom hit: either revoked or a false positive
+        revoked = db.session.query(TokenBlocklist.id).filter(TokenBlocklist.jti == jti).first() is not None
+        with self._lock:
+            if revoked:
+                self._remember(jti, True, exp if exp else now + self._max_age)
+            else:
+                self._remember(jti, False, now + NEGATIVE_TTL_SECONDS)
+        return revoked
+
+    def revoke(self, jti):
+        """Record a revocation committed to TokenBlocklist and tell the other workers."""
+        self._max_age = self._max_age_seconds()
+        self._on_revoked(jti)
+        publish(REVOKED_CHANNEL, jti)
+
+    def reset(self):
+        with self._lock:
+            self._bloom = None
+            self._recent.clear()
+            self._last_id = 0
+
+
+token_blocklist = RevocationCache()
+
+
+def prune_blocklist():
+    """Delete revocations of tokens that have expired anyway. Returns the number of rows deleted."""
+    expires = current_app.config['JWT_ACCESS_TOKEN_EXPIRES']
+    if expires is False:
+        return 0
+    if not isinstance(expires, timedelta):
+        expires = timedelta(seconds=expires)
+    deleted = TokenBlocklist.query.filter(
+        TokenBlocklist.created_at < datetime.utcnow() - expires
+    ).delete(synchronize_session=False)
+    db.session.commit()
+    return deleted
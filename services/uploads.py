@@ -0,0 +1,113 @@
+import os
+import uuid
+from flask import request
+from werkzeug.utils import secure_filename
+from .storage import get_storage
+
+# Direct uploads land under the uploader's prefix; a key outside it is never accepted
+UPLOAD_PREFIX = 'uploads/{user_id}/'
+UPLOAD_URL_EXPIRES = int(os.getenv('UPLOAD_URL_EXPIRES', 900))
+MAX_FILES_PER_REQUEST = 10
+
+IMAGE_TYPES = {'image/jpeg', 'image/png', 'image/gif', 'image/webp', 'image/avif'}
+VIDEO_TYPES = {'video/mp4', 'video/quicktime'}
+MAX_IMAGE_SIZE = int(os.getenv('MAX_IMAGE_UPLOAD_SIZE', 20 * 1024 * 1024))
+MAX_VIDEO_SIZE = int(os.getenv('MAX_VIDEO_UPLOAD_SIZE', 500 * 1024 * 1024))
+
+# Content types each kind of upload may use
+UPLOAD_PURPOSES = {
+    'yap': IMAGE_TYPES | VIDEO_TYPES,
+    'event': IMAGE_TYPES,
+    'product': IMAGE_TYPES,
+    'avatar': IMAGE_TYPES,
+}
+
+
+class UploadValidationError(Exception):
+    pass
+
+
+def _max_size(content_type):
+    return MAX_VIDEO_SIZE if content_type in VIDEO_TYPES else MAX_IMAGE_SIZE
+
+
+def _check(purpose, content_type, size):
+    allowed = UPLOAD_PURPOSES.get(purpose)
+    if allowed is None:
+        raise UploadValidationError(f"Invalid upload purpose: {purpose}")
+    if content_type not in allowed:
+        raise UploadValidationError(f"Invalid content type: {content_type}")
+    if size is not None and size > _max_size(content_type):
+        raise UploadValidationError(f"File too large: {size} bytes (max {_max_size(content_type)})")
+
+
+def create_upload(user_id, purpose, filename, content_type, size=None):
+    """
+    Reserve a key for a direct upload and return the presigned PUT for it.
+
+    The declared content type and size are checked up front so clients fail
+    fast; both are checked again against the stored object on confirmation.
+    """
+    _check(purpose, content_type, size)
+
+    filename = secure_filename(filename or '') or 'upload'
+    key = f"{UPLOAD_PREFIX.format(user_id=user_id)}{uuid.uuid4().hex}/{filename}"
+    return {
+        'key': key,
+        'url': get_storage().presign_put(key, content_type, expires_in=UPLOAD_URL_EXPIRES),
+        'method': 'PUT',
+        'headers': {'Content-Type': content_type},
+        'expires_in': UPLOAD_URL_EXPIRES
+    }
+
+
+def confirm_uploads(user_id, keys, purpose):
+    """
+    Validate directly uploaded objects before rows point at them.
+
+    Each key must be under the user's upload prefix and exist in storage with
+    an allowed content type and size (one HEAD request per key). Objects that
+    fail the size or type check are deleted. Returns dicts with 'key', 'url',
+    'content_type', 'media_type' and 'size' in the same order as keys.
+    """
+    if len(keys) > MAX_FILES_PER_REQUEST:
+        raise UploadValidationError(f"At most {MAX_FILES_PER_REQUEST} files per request")
+
+    storage = get_storage()
+    prefix = UPLOAD_PREFIX.format(user_id=user_id)
+    confirmed = []
+    for key in keys:
+        if not key.startswith(prefix) or '..' in key:
+            raise UploadValidationError(f"Invalid upload key: {key}")
+
+        stored = storage.head(key)
+        if stored is None:
+            raise UploadValidationError(f"Upload not found: {key}")
+
+        content_type = (stored['content_type'] or '').split(';')[0].strip()
+        try:
+            _check(purpose, content_type, stored['size'])
+        except UploadValidationError:
+            storage.delete_many([key])
+            raise
+
+        confirmed.append({
+            'key': key,
+            'url': storage.url(key),
+            'content_type': content_type,
+            'media_type': 'video' if content_type in VIDEO_TYPES else 'image',
+            'size': stored['size']
+        })
+    return confirmed
+
+
+def confirm_upload(user_id, key, purpose):
+    return confirm_uploads(user_id, [key], purpose)[0]
+
+
+def requested_keys(field):
+    """Upload keys sent in a JSON body (a list) or as repeated form fields."""
+    if request.is_json:
+        keys = (request.get_json(silent=True) or {}).get(field) or []
+        return [keys] if isinstance(keys, str) else list(keys)
+    return request.form.getlist(field)
@@ -0,0 +1,161 @@
+from collections import OrderedDict
+from datetime import datetime
+import json
+import os
+import threading
+import time
+from redis.exceptions import RedisError
+from models import db, Users
+from . import get_redis
+from .pubsub import Subscriber, publish
+
+PROFILE_KEY = 'user_profile:{user_id}'
+VERSION_KEY = 'user_profile_version:{user_id}'
+INVALIDATED_CHANNEL = 'user_profile:invalidated'
+
+PROFILE_TTL = int(os.getenv('USER_PROFILE_TTL', 3600))
+# Per-process LRU in front of Redis. Entries are dropped over pub/sub when a
+# profile changes; the TTL bounds staleness if a message is missed.
+LOCAL_PROFILE_SIZE = int(os.getenv('USER_PROFILE_LOCAL_SIZE', 10_000))
+LOCAL_PROFILE_TTL = int(os.getenv('USER_PROFILE_LOCAL_TTL', 30))
+
+PROFILE_FIELDS = (
+    'id', 'username', 'email', 'first_name', 'last_name', 'phone_no',
+    'category', 'avatar', 'display_name', 'bio', 'created_at'
+)
+
+
+class UserProfile:
+    """
+    Read-only snapshot of a user's profile fields.
+
+    Returned as flask_jwt_extended's current_user. Views that modify the user
+    still load the Users row themselves.
+    """
+
+    __slots__ = PROFILE_FIELDS
+
+    def __init__(self, data):
+        for field in PROFILE_FIELDS:
+            setattr(self, field, data.get(field))
+        if isinstance(self.created_at, str):
+            self.created_at = datetime.fromisoformat(self.created_at)
+
+    @classmethod
+    def from_user(cls, user):
+        return cls({field: getattr(user, field) for field in PROFILE_FIELDS})
+
+    def to_dict(self):
+        data = {field: getattr(self, field) for field in PROFILE_FIELDS}
+        if data['created_at'] is not None:
+            data['created_at'] = data['created_at'].isoformat()
+        return data
+
+
+class ProfileCache:
+    """
+    Profile lookups for authenticated requests without a database round trip.
+
+    Redis holds one JSON entry per user, stamped with the user's version
+    counter at the time it was read from the database. invalidate() bumps the
+    counter, so an entry written by a request that raced the change no longer
+    matches and is reloaded. Each worker keeps a small LRU in front of Redis.
+    """
+
+    def __init__(self):
+        self._local = OrderedDict()  # user_id -> (profile, cached_at)
+        self._lock = threading.Lock()
+        self._subscriber = Subscriber(INVALIDATED_CHANNEL, self._on_invalidated)
+
+    def _on_invalidated(self, data):
+        # Runs on the subscriber thread
+        self._drop_local(int(data))
+
+    def _drop_local(self, user_id):
+        with self._lock:
+            self._local.pop(user_id, None)
+
+    def _remember(self, user_id, profile):
+        with self._lock:
+            self._local[user_id] = (profile, time.monotonic())
+            self._local.move_to_end(user_id)
+            while len(self._local) > LOCAL_PROFILE_SIZE:
+                self._local.popitem(last=False)
+
+    def get(self, user_id):
+        """Profile of user_id, or None if the user does not exist."""
+        user_id = int(user_id)
+
+        with self._lock:
+            cached = self._local.get(user_id)
+            if cached is not None and time.monotonic() - cached[1] < LOCAL_PROFILE_TTL:
+                self._local.move_to_end(user_id)
+                return cached[0]
+
+        redis_client = get_redis()
+        version = None
+        if redis_client is not None:
+            self._subscriber.ensure_started(redis_client)
+            try:
+                version, cached = redis_client.mget(
+                    VERSION_KEY.format(user_id=user_id),
+                    PROFILE_KEY.format(user_id=user_id)
+                )
+                version = int(version) if version is not None else 0
+            except RedisError:
+                version = cached = None
+            if cached is not None:
+                cached = json.loads(cached)
+                if cached['version'] == version:
+                    profile = UserProfile(cached['profile'])
+                    self._remember(user_id, profile)
+                    return profile
+
+        user = db.session.get(Users, user_id)
+        if user is None:
+            return None
+        profile = UserProfile.from_user(user)
+
+        if version is not None:
+            try:
+                redis_client.set(
+                    PROFILE_KEY.format(user_id=user_id),
+                    json.dumps({'version': version, 'profile': profile.to_dict()}),
+                    ex=PROFILE_TTL
+                )
+            except RedisError:
+                pass
+        self._remember(user_id, profile)
+        return profile
+
+    def invalidate(self, user_id):
+        """Forget a user's cached profile, after the change is committed."""
+        user_id = int(user_id)
+        self._drop_local(user_id)
+
+        redis_client = get_redis()
+        if redis_client is None:
+            return
+        try:
+            pipe = redis_client.pipeline()
+            pipe.incr(VERSION_KEY.format(user_id=user_id))
+            pipe.delete(PROFILE_KEY.format(user_id=user_id))
+            pipe.execute()
+        except RedisError:
+            pass
+        publish(INVALIDATED_CHANNEL, user_id)
+
+    def reset(self):
+        with self._lock:
+            self._local.clear()
+
+
+profile_cache = ProfileCache()
+
+
+def get_user_profile(user_id):
+    return profile_cache.get(user_id)
+
+
+def invalidate_user_profile(user_id):
+    profile_cache.invalidate(user_id)
@@ -0,0 +1,25 @@
+from sqlalchemy import select, func
+from models import db, Yap, Like, Reply
+
+
+def reconcile_yap_counters():
+    """
+    Recompute like_count, reply_count and retweet_count for every yap from the
+    likes, replies and yaps.original_yap_id rows, in a single UPDATE.
+
+    Repairs drift from bulk deletes or imports that bypass the ORM listeners.
+    Returns the number of yaps updated.
+    """
+    yaps = Yap.__table__
+    retweets = Yap.__table__.alias('retweets')
+
+    result = db.session.execute(
+        yaps.update().values(
+            like_count=select(func.count(Like.id)).where(Like.yap_id == yaps.c.id).scalar_subquery(),
+            reply_count=select(func.count(Reply.id)).where(Reply.yap_id == yaps.c.id).scalar_subquery(),
+            retweet_count=select(func.count(retweets.c.id)).where(retweets.c.original_yap_id == yaps.c.id).scalar_subquery(),
+            updated_at=yaps.c.updated_at,
+        )
+    )
+    db.session.commit()
+    return result.rowcount
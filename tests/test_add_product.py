@@ -0,0 +1,43 @@
+import pytest
+from flask_jwt_extended import create_access_token
+from models import db, Users, Seller, Products
+
+
+@pytest.fixture
+def sellers(app):
+    users = [
+        Users(first_name=name, last_name='Seller', username=name.lower(), email=f'{name.lower()}@example.com',
+              password='x', category='test')
+        for name in ('Ada', 'Bo')
+    ]
+    db.session.add_all(users)
+    db.session.flush()
+    sellers = [Seller(display_name=user.first_name, user_id=user.id) for user in users]
+    db.session.add_all(sellers)
+    db.session.commit()
+    return [(user.id, seller.id) for user, seller in zip(users, sellers)]
+
+
+def headers(user_id):
+    return {'Authorization': f'Bearer {create_access_token(identity=user_id)}'}
+
+
+def test_requires_login(client, sellers):
+    _, seller_id = sellers[0]
+    response = client.post('/add-product', data={'title': 'Lamp', 'seller_id': seller_id})
+    assert response.status_code == 401
+
+
+def test_rejects_another_users_seller(client, sellers):
+    (_, seller_id), (other_user_id, _) = sellers
+    response = client.post('/add-product', data={'title': 'Lamp', 'seller_id': seller_id}, headers=headers(other_user_id))
+    assert response.status_code == 403
+    assert Products.query.count() == 0
+
+
+def test_lists_under_own_seller(client, sellers):
+    user_id, seller_id = sellers[0]
+    response = client.post('/add-product', data={'title': 'Lamp', 'price': '10', 'seller_id': seller_id},
+                           headers=headers(user_id))
+    assert response.status_code == 201
+    assert Products.query.one().seller_id == seller_id
@@ -0,0 +1,58 @@
+import threading
+import pytest
+from models import db, Hashtag
+from services.autocomplete import autocomplete
+
+
+@pytest.fixture
+def index(app):
+    db.session.add(Hashtag(name='#sunset'))
+    db.session.commit()
+    autocomplete.reset()
+    yield autocomplete
+    autocomplete.wait(10)
+    autocomplete.reset()
+
+
+@pytest.fixture
+def held_build(index, monkeypatch):
+    """(read, release): the build sets read once it has read the database, then waits for release."""
+    read, release = threading.Event(), threading.Event()
+    load = index._load
+
+    def held_load():
+        loaded = load()
+        read.set()
+        release.wait(10)
+        return loaded
+
+    monkeypatch.setattr(index, '_load', held_load)
+    yield read, release
+    release.set()
+
+
+def names(suggestions):
+    return sorted(item['name'] for item in suggestions['hashtags'])
+
+
+def test_suggestions_are_empty_until_the_first_build_is_in(index, held_build):
+    read, release = held_build
+    assert index.suggest('suns', ['hashtags']) == {'hashtags': []}
+    assert read.wait(10)
+    assert not index.wait(0.1)
+
+    release.set()
+    assert index.wait(10)
+    assert names(index.suggest('suns', ['hashtags'])) == ['#sunset']
+
+
+def test_changes_committed_during_the_first_build_are_kept(index, held_build):
+    read, release = held_build
+    index.start()
+    assert read.wait(10)
+    db.session.add(Hashtag(name='#sunrise'))
+    db.session.commit()
+
+    release.set()
+    assert index.wait(10)
+    assert names(index.suggest('sun', ['hashtags'])) == ['#sunrise', '#sunset']
@@ -0,0 +1,78 @@
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+import pytest
+from sqlalchemy import event
+from models import db, Users, Yap, YapMedia, Hashtag, YapHashtag
+
+# Yaps with their authors, their media, their hashtags (hashtag rows joined
+# in) and the image variants for ?w=, whatever the page size
+FEED_PAGE_STATEMENTS = 4
+
+
+@contextmanager
+def count_statements():
+    statements = []
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    event.listen(db.engine, 'after_cursor_execute', record)
+    try:
+        yield statements
+    finally:
+        event.remove(db.engine, 'after_cursor_execute', record)
+
+
+@pytest.fixture
+def feed(app):
+    users = [
+        Users(first_name=f'First{n}', last_name=f'Last{n}', username=f'user{n}',
+              email=f'user{n}@example.com', password='x', category='test')
+        for n in range(3)
+    ]
+    hashtags = [Hashtag(name=f'#tag{n}') for n in range(4)]
+    db.session.add_all(users + hashtags)
+    db.session.flush()
+
+    start = datetime(2026, 1, 1)
+    for n in range(50):
+        yap = Yap(content=f'yap {n}', user_id=users[n % len(users)].id, created_at=start + timedelta(minutes=n))
+        db.session.add(yap)
+        db.session.flush()
+        db.session.add_all([
+            YapMedia(yap_id=yap.id, media_url=f'https://cdn.example.com/{n}/{i}.jpg', media_type='image')
+            for i in range(2)
+        ])
+        db.session.add_all([
+            YapHashtag(yap_id=yap.id, hashtag_id=hashtags[(n + i) % len(hashtags)].id)
+            for i in range(2)
+        ])
+    db.session.commit()
+    db.session.remove()
+
+
+@pytest.mark.usefixtures('feed')
+@pytest.mark.parametrize('per_page', [5, 10, 20])
+def test_feed_page_query_count_does_not_grow_with_page_size(client, per_page):
+    first = client.get('/yaps', query_string={'cursor': '', 'per_page': per_page}).get_json()
+    assert len(first['yaps']) == per_page
+    assert all(len(yap['media']) == 2 and len(yap['hashtags']) == 2 for yap in first['yaps'])
+
+    with count_statements() as statements:
+        response = client.get('/yaps', query_string={'cursor': first['next_cursor'], 'per_page': per_page, 'w': 320})
+
+    assert response.status_code == 200
+    assert len(response.get_json()['yaps']) == per_page
+    assert len(statements) == FEED_PAGE_STATEMENTS, statements
+
+
+@pytest.mark.usefixtures('feed')
+def test_single_yap_keeps_the_feed_keys(client):
+    yap = client.get('/yaps').get_json()['yaps'][0]
+    single = client.get(f"/api/yaps/{yap['id']}")
+
+    assert single.status_code == 200
+    single = single.get_json()
+    assert {'id', 'content', 'created_at', 'username', 'replies', 'likes_count'} <= single.keys()
+    assert single['media'] == yap['media']
+    assert sorted(single['hashtags']) == sorted(yap['hashtags'])
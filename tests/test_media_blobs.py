@@ -0,0 +1,100 @@
+import hashlib
+import io
+from datetime import datetime, timedelta
+import pytest
+from models import db, MediaBlob, Users
+from services import media_blobs
+import services.storage
+from services.media_blobs import store, store_many, collect_garbage
+from services.storage import MediaStorage, LocalBackend, MediaUploadError, set_storage
+
+
+@pytest.fixture
+def storage(app, tmp_path):
+    storage = MediaStorage(LocalBackend(str(tmp_path / 'media'), '/media'), '/media')
+    set_storage(storage)
+    yield storage
+    set_storage(None)
+
+
+class BrokenFile(io.RawIOBase):
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        raise OSError('connection reset')
+
+
+def blob_keys():
+    db.session.expire_all()
+    return sorted(blob.key for blob in MediaBlob.query)
+
+
+def test_failed_batch_deletes_only_the_blobs_it_created(storage):
+    shared = store(io.BytesIO(b'shared'), 'shared.jpg')
+    shared_key = storage.key_for_url(shared)
+
+    with pytest.raises(MediaUploadError):
+        store_many([
+            {'fileobj': io.BytesIO(b'shared'), 'filename': 'again.jpg'},
+            {'fileobj': io.BytesIO(b'new'), 'filename': 'new.jpg'},
+            {'fileobj': BrokenFile(), 'filename': 'broken.jpg'},
+        ])
+
+    assert blob_keys() == [shared_key]
+    assert storage.head(shared_key) is not None
+    digest = hashlib.sha256(b'new').hexdigest()
+    assert storage.head(f'media/{digest[:2]}/{digest}.jpg') is None
+
+
+def test_failed_batch_keeps_a_blob_claimed_by_another_upload(storage):
+    registered_at = datetime.utcnow() - timedelta(seconds=1)
+    url = store(io.BytesIO(b'photo'), 'photo.jpg')
+    key = storage.key_for_url(url)
+    MediaBlob.query.filter_by(key=key).update({'last_uploaded_at': registered_at})
+    db.session.commit()
+
+    # Another request deduplicates against the blob before the cleanup runs
+    assert media_blobs._claim(key)
+    media_blobs._discard([key], registered_at)
+
+    assert blob_keys() == [key]
+    assert storage.head(key) is not None
+
+
+def test_garbage_collection_skips_young_and_referenced_blobs(storage):
+    keys = [storage.key_for_url(store(io.BytesIO(data), f'{n}.jpg')) for n, data in enumerate([b'old', b'young', b'used'])]
+    old = datetime.utcnow() - timedelta(hours=48)
+    MediaBlob.query.filter(MediaBlob.key.in_([keys[0], keys[2]])).update({'last_uploaded_at': old})
+    MediaBlob.query.filter_by(key=keys[2]).update({'ref_count': 1})
+    db.session.commit()
+
+    assert collect_garbage(grace_hours=24) == 1
+
+    assert blob_keys() == sorted(keys[1:])
+    assert storage.head(keys[0]) is None
+
+
+def test_garbage_collection_keeps_the_row_when_the_object_delete_fails(storage, monkeypatch):
+    key = storage.key_for_url(store(io.BytesIO(b'old'), 'old.jpg'))
+    MediaBlob.query.filter_by(key=key).update({'last_uploaded_at': datetime.utcnow() - timedelta(hours=48)})
+    db.session.commit()
+
+    def unavailable(keys):
+        raise OSError('bucket unavailable')
+
+    monkeypatch.setattr(storage.backend, 'delete_many', unavailable)
+    with pytest.raises(OSError):
+        collect_garbage(grace_hours=24)
+
+    assert blob_keys() == [key]
+
+
+def test_rows_without_media_do_not_build_the_storage(app, monkeypatch):
+    def no_storage():
+        raise AssertionError('storage built for a row without media')
+
+    monkeypatch.setattr(services.storage, 'get_storage', no_storage)
+    db.session.add(Users(first_name='Ada', last_name='L', username='ada', email='ada@example.com',
+                         password='x', category='test'))
+    db.session.commit()
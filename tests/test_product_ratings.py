@@ -0,0 +1,53 @@
+import pytest
+from models import db, Users, Seller, Products, Reviews
+from services.product_ratings import reconcile_product_ratings
+
+
+@pytest.fixture
+def seller(app):
+    user = Users(first_name='Ada', last_name='Seller', username='ada', email='ada@example.com',
+                 password='x', category='test')
+    db.session.add(user)
+    db.session.flush()
+    seller = Seller(display_name='Ada', user_id=user.id)
+    db.session.add(seller)
+    db.session.flush()
+
+    for title, ratings in [('Lamp', [4, 2]), ('Chair', [5])]:
+        product = Products(title=title, price=10, category='Home', seller_id=seller.id)
+        db.session.add(product)
+        db.session.flush()
+        db.session.add_all([Reviews(text='ok', rating=rating, user_id=user.id, product_id=product.id) for rating in ratings])
+    db.session.commit()
+    return seller.id
+
+
+def totals(seller_id):
+    db.session.expire_all()
+    seller = db.session.get(Seller, seller_id)
+    return seller.rating_sum, seller.rating_count
+
+
+def test_reviews_add_to_seller_totals(seller):
+    assert totals(seller) == (11.0, 3)
+
+
+def test_deleting_a_product_takes_its_reviews_off_the_seller_once(seller):
+    db.session.delete(Products.query.filter_by(title='Lamp').one())
+    db.session.commit()
+
+    assert totals(seller) == (5.0, 1)
+    reconcile_product_ratings()
+    assert totals(seller) == (5.0, 1)
+
+
+def test_catalog_without_paging_params_is_a_bare_list(client, seller):
+    response = client.get('/products')
+
+    assert response.status_code == 200
+    by_title = {product['title']: product for product in response.get_json()}
+    assert by_title['Lamp']['average_rating'] == 3.0
+    assert by_title['Lamp']['review_count'] == 2
+
+    page = client.get('/products?limit=1').get_json()
+    assert len(page['products']) == 1 and page['has_next']
@@ -0,0 +1,6 @@
+from services.query_plans import check_query_plans
+
+
+def test_hot_queries_use_indexes(app):
+    failures = {name: problems for name, plan, problems in check_query_plans() if problems}
+    assert failures == {}
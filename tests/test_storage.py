@@ -0,0 +1,73 @@
+import io
+import pytest
+from moto import mock_aws
+from services.storage import S3Backend, MediaStorage, MediaUploadError, MULTIPART_THRESHOLD, MULTIPART_CHUNKSIZE
+
+BUCKET = 'media'
+
+
+@pytest.fixture
+def storage(monkeypatch):
+    monkeypatch.setenv('AWS_DEFAULT_REGION', 'us-east-1')
+    with mock_aws():
+        backend = S3Backend(BUCKET, access_key_id='testing', secret_access_key='testing')
+        backend.client.create_bucket(Bucket=BUCKET)
+        yield MediaStorage(backend, 'https://cdn.example.com')
+
+
+def stored_keys(storage):
+    response = storage.backend.client.list_objects_v2(Bucket=BUCKET)
+    return sorted(item['Key'] for item in response.get('Contents', []))
+
+
+class BrokenFile(io.RawIOBase):
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        raise OSError('connection reset')
+
+
+def test_large_upload_is_sent_in_parts(storage):
+    data = b'x' * (MULTIPART_THRESHOLD + 1)
+
+    url = storage.put('videos/large.mp4', io.BytesIO(data), content_type='video/mp4')
+
+    assert url == 'https://cdn.example.com/videos/large.mp4'
+    assert storage.get('videos/large.mp4') == data
+    # Multipart ETags end in -<number of parts>
+    parts = -(-len(data) // MULTIPART_CHUNKSIZE)
+    etag = storage.backend.client.head_object(Bucket=BUCKET, Key='videos/large.mp4')['ETag']
+    assert etag.strip('"').endswith(f'-{parts}')
+
+
+def test_failed_batch_deletes_what_it_uploaded(storage, monkeypatch):
+    uploads = [
+        {'key': 'a.jpg', 'fileobj': io.BytesIO(b'a'), 'content_type': 'image/jpeg'},
+        {'key': 'b.jpg', 'fileobj': io.BytesIO(b'b'), 'content_type': 'image/jpeg'},
+        {'key': 'c.jpg', 'fileobj': BrokenFile(), 'content_type': 'image/jpeg'},
+    ]
+    deleted = []
+    delete_many = storage.backend.delete_many
+
+    def recording_delete_many(keys):
+        deleted.extend(keys)
+        delete_many(keys)
+
+    monkeypatch.setattr(storage.backend, 'delete_many', recording_delete_many)
+
+    with pytest.raises(MediaUploadError) as error:
+        storage.put_many(uploads)
+
+    assert error.value.key == 'c.jpg'
+    assert sorted(deleted) == ['a.jpg', 'b.jpg']
+    assert stored_keys(storage) == []
+
+
+def test_batch_uploads_every_file(storage):
+    uploads = [{'key': f'{n}.jpg', 'fileobj': io.BytesIO(b'%d' % n)} for n in range(3)]
+
+    results = storage.put_many(uploads)
+
+    assert [result['key'] for result in results] == ['0.jpg', '1.jpg', '2.jpg']
+    assert stored_keys(storage) == ['0.jpg', '1.jpg', '2.jpg']
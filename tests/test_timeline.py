@@ -0,0 +1,46 @@
+from datetime import datetime, timedelta
+import pytest
+from flask_jwt_extended import create_access_token
+from models import db, Users, Follow, Yap
+
+
+@pytest.fixture
+def reader(app):
+    users = [
+        Users(first_name=f'First{n}', last_name='Last', username=f'user{n}', email=f'user{n}@example.com',
+              password='x', category='test')
+        for n in range(3)
+    ]
+    db.session.add_all(users)
+    db.session.flush()
+    reader, followed, stranger = users
+    db.session.add(Follow(follower_id=reader.id, following_id=followed.id))
+
+    # Several yaps share each timestamp, so ties straddle page boundaries
+    start = datetime(2026, 1, 1)
+    for n in range(12):
+        db.session.add(Yap(content=f'followed {n}', user_id=followed.id, created_at=start + timedelta(minutes=n // 3)))
+        db.session.add(Yap(content=f'stranger {n}', user_id=stranger.id, created_at=start + timedelta(minutes=n // 3)))
+    db.session.commit()
+    return reader.id
+
+
+def test_pages_every_followed_yap_once(client, reader):
+    headers = {'Authorization': f'Bearer {create_access_token(identity=reader)}'}
+    seen, cursor = [], None
+    while True:
+        query = {'per_page': 2, **({'cursor': cursor} if cursor else {})}
+        page = client.get('/timeline', query_string=query, headers=headers).get_json()
+        seen += [yap['content'] for yap in page['yaps']]
+        cursor = page['next_cursor']
+        if not cursor:
+            break
+
+    assert sorted(seen) == sorted(f'followed {n}' for n in range(12))
+    assert len(seen) == 12
+
+
+def test_rejects_a_malformed_cursor(client, reader):
+    headers = {'Authorization': f'Bearer {create_access_token(identity=reader)}'}
+    response = client.get('/timeline', query_string={'cursor': 'not a cursor'}, headers=headers)
+    assert response.status_code == 400
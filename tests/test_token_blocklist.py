@@ -0,0 +1,27 @@
+from models import db, TokenBlocklist
+from services.token_blocklist import RevocationCache
+
+
+def test_revoked_tokens_are_rejected(app):
+    db.session.add(TokenBlocklist(jti='revoked'))
+    db.session.commit()
+    cache = RevocationCache()
+
+    assert cache.is_revoked('revoked')
+    assert not cache.is_revoked('valid')
+
+
+def test_revocation_published_during_a_rebuild_is_kept(app, monkeypatch):
+    cache = RevocationCache()
+    cache._rebuild()
+    max_age_seconds = cache._max_age_seconds
+
+    def revoked_while_loading():
+        # Another worker's /logout arrives over pub/sub while the table is being read
+        cache._on_revoked(b'just-revoked')
+        return max_age_seconds()
+
+    monkeypatch.setattr(cache, '_max_age_seconds', revoked_while_loading)
+    cache._rebuild()
+
+    assert cache.is_revoked('just-revoked')
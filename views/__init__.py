@@ -2,4 +2,7 @@ from .auth_view import *
 from .user_view import *
 from .event_view import *
 from .marketplace_view import *
-from .yap_view import *
\ No newline at end of file
+from .yap_view import *
+from .upload_view import *
+from .metrics_view import *
+from .autocomplete_view import *
\ No newline at end of file
@@ -1,7 +1,8 @@
 from models import db, Users, TokenBlocklist
+from services.token_blocklist import token_blocklist
 from flask import request, jsonify, Blueprint
-from werkzeug.security import check_password_hash, generate_password_hash
-from flask_jwt_extended import create_access_token, jwt_required, get_jwt_identity, get_jwt
+from services.passwords import hash_password, verify_password, PasswordHasherBusy
+from flask_jwt_extended import create_access_token, jwt_required, get_jwt_identity, get_jwt, current_user
 import base64
 
 auth_bp = Blueprint('auth_bp', __name__)
@@ -20,7 +21,16 @@ def login():
 
     user = Users.query.filter_by(username=username).first()
     if user:
-        if check_password_hash(user.password, password):
+        try:
+            valid, new_hash = verify_password(password, user.password)
+        except PasswordHasherBusy:
+            return jsonify(message="Too many logins in progress, please retry"), 503, {'Retry-After': '1'}
+
+        if valid:
+            # Upgrade legacy or low-cost hashes now that we have the password
+            if new_hash:
+                user.password = new_hash
+                db.session.commit()
             access_token = create_access_token(identity=user.id)
             return jsonify(access_token=access_token), 200
         return jsonify(message="Invalid username or password"), 401
@@ -31,8 +41,7 @@ def login():
 @auth_bp.route("/authenticated_user", methods=["GET"])
 @jwt_required()
 def authenticated_user():
-    current_user_id = get_jwt_identity()  # getting current user id
-    user = Users.query.get(current_user_id)
+    user = current_user  # cached profile, loaded by the user_lookup_loader
 
     if user:
         # Encoding binary image data to base64 string for JSON serialization
@@ -66,6 +75,9 @@ def logout():
     db.session.add(token_b)
     db.session.commit()
 
+    # Let every worker's revocation cache know straight away
+    token_blocklist.revoke(jti)
+
     return jsonify({"success": "Logged out successfully!"}), 200
 
 # Confirm user email
@@ -93,7 +105,10 @@ def reset_password():
 
     if user:
         # Update the password
-        user.password = generate_password_hash(new_password)
+        try:
+            user.password = hash_password(new_password)
+        except PasswordHasherBusy:
+            return jsonify(message="Server busy, please retry"), 503, {'Retry-After': '1'}
         db.session.commit()
 
         return jsonify({"message": "Password reset successfully"}), 200
@@ -0,0 +1,31 @@
+from services.autocomplete import autocomplete, KINDS
+from flask import request, jsonify, Blueprint
+from flask_jwt_extended import jwt_required
+
+autocomplete_bp = Blueprint('autocomplete_bp', __name__)
+
+AUTOCOMPLETE_LIMIT = 5
+AUTOCOMPLETE_MAX_LIMIT = 20
+
+
+@autocomplete_bp.route('/autocomplete', methods=['GET'])
+@jwt_required()
+def get_autocomplete():
+    """
+    Suggestions for a search box as the user types.
+
+    ?q= is matched word by word, the last word as a prefix, tolerating a
+    typo or two in longer words. ?types= picks from products, brands, users
+    and hashtags (comma-separated, all by default); ?limit= caps each list.
+    Answered from the in-memory index in services/autocomplete.py without
+    querying the database; the lists are empty while a freshly started
+    worker is still building it.
+    """
+    kinds = [kind.strip() for kind in request.args.get('types', ','.join(KINDS)).split(',') if kind.strip()]
+    unknown = [kind for kind in kinds if kind not in KINDS]
+    if unknown:
+        return jsonify({'error': f"Unknown type(s): {', '.join(unknown)}. Choose from {', '.join(KINDS)}"}), 400
+    limit = min(max(request.args.get('limit', AUTOCOMPLETE_LIMIT, type=int), 1), AUTOCOMPLETE_MAX_LIMIT)
+
+    q = request.args.get('q', '')
+    return jsonify({'q': q, 'suggestions': autocomplete.suggest(q, kinds or KINDS, limit)}), 200
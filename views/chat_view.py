@@ -5,7 +5,7 @@ from werkzeug.utils import secure_filename
 import os
 from models import Message, Reaction, ChatMedia, db, Friendship, Users # Import your models
 from. import redis_client  # Import your Redis client instance
-from. import upload_media_to_r2  # Import the R2 upload function
+from services.media_blobs import store
 
 chat_bp = Blueprint('chat', __name__)
 
@@ -46,11 +46,8 @@ def send_message(friend_id):
                     file_ext = filename.rsplit('.', 1).lower()
                     media_type = 'image' if file_ext in ['jpg', 'jpeg', 'png', 'gif', 'webp', 'avif'] else 'video'
                     
-                    # Construct the S3 (R2) file path
-                    s3_path = f"messages/{user_id}/{filename}"
-                    
                     try:
-                        media_url = upload_media_to_r2(file.read(), s3_path, file.content_type)
+                        media_url = store(file, filename, content_type=file.content_type)
                         chat_media = ChatMedia(media_url=media_url, media_type=media_type, message_id=new_message.id)
                         db.session.add(chat_media)
                     except Exception as e:
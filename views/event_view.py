@@ -1,4 +1,7 @@
 from models import db, Users, Events, Comment_events
+from services.media_blobs import store
+from services.uploads import confirm_upload, UploadValidationError
+from services.media_variants import enqueue_variants, variant_picker
 from flask import request, jsonify, Blueprint,make_response
 from werkzeug.security import generate_password_hash
 from flask_jwt_extended import jwt_required, get_jwt_identity
@@ -8,35 +11,21 @@ import base64
 from flask import request
 import json
 import os
-import boto3
 import base64
 from dotenv import load_dotenv
 load_dotenv()
 
 event_bp = Blueprint('event_bp', __name__)
 
-R2_ACCESS_KEY_ID = os.getenv('R2_ACCESS_KEY_ID')
-R2_SECRET_ACCESS_KEY = os.getenv('R2_SECRET_ACCESS_KEY')
-R2_BUCKET_NAME = os.getenv('R2_BUCKET_NAME')
-R2_ENDPOINT_URL = os.getenv('R2_ENDPOINT_URL')
-IMAGE_PREFIX = os.getenv('IMAGE_PREFIX')
-
-
-s3_client = boto3.client(
-    's3',
-    endpoint_url=R2_ENDPOINT_URL,
-    aws_access_key_id=R2_ACCESS_KEY_ID,
-    aws_secret_access_key=R2_SECRET_ACCESS_KEY
-)    
-
 @event_bp.route('/events', methods=['GET'])
 def get_events():
     events = Events.query.all()
+    picker = variant_picker([event.image_url for event in events])
     output = [{
         'eventId': event.id,
         'title': event.title,
         'description': event.description,
-        'poster': event.image_url if event.image_url else None,
+        'poster': picker(event.image_url) if event.image_url else None,
         'start_time': event.start_time,
         'end_time': event.end_time,
         'date': event.date_of_event.strftime('%d %b %Y'),
@@ -119,18 +108,20 @@ def add_event():
         # Access the image file
         image_file = request.files.get('image_url')
 
-        # Handle R2 image upload
-        image_key = None
-        if image_file:
-            image_key = f'event_images/{current_user}/{image_file.filename}'
+        # Handle R2 image upload, keeping the uploaded image's R2 URL
+        r2_image_url = None
+        if data.get('image_key'):
+            # Image already uploaded straight to R2 via /uploads/presign
+            try:
+                r2_image_url = confirm_upload(current_user, data['image_key'], 'event')['url']
+            except UploadValidationError as e:
+                return make_response(jsonify({"error": str(e)}), 400)
+        elif image_file:
             try:
-                s3_client.upload_fileobj(image_file, R2_BUCKET_NAME, image_key)
+                r2_image_url = store(image_file, image_file.filename, content_type=image_file.mimetype)
             except Exception as e:
                 return jsonify({'error': f"Failed to upload image: {str(e)}"}), 500
 
-        # Use the uploaded image's R2 URL
-        r2_image_url = f"{IMAGE_PREFIX}/{image_key}" if image_key else None
-
         # Create new event
         new_event = Events(
             title=title,
@@ -147,6 +138,9 @@ def add_event():
         db.session.add(new_event)
         db.session.commit()
 
+        # Resize the poster in the background
+        enqueue_variants(r2_image_url)
+
         return make_response(jsonify({"message": "New event created!"}), 201)
     except Exception as e:
         db.session.rollback()
@@ -163,7 +157,8 @@ def update_event(event_id):
     if not event:
         return jsonify({'message': 'Event not found or you are not authorized to update this event'}), 404
 
-    data = request.form  # Handle form data for file uploads
+    # Form data for file uploads, or JSON when the image was uploaded directly
+    data = request.get_json() if request.is_json else request.form
 
     # Extract data from the request form
     title = data.get('title')
@@ -192,18 +187,20 @@ def update_event(event_id):
     # Access the image file
     image_file = request.files.get('image_url')
 
-    # Handle R2 image upload
-    image_key = None
-    if image_file:
-        image_key = f'event_images/{current_user}/{image_file.filename}'
+    # Handle R2 image upload, keeping the uploaded image's R2 URL
+    r2_image_url = None
+    if data.get('image_key'):
+        # Image already uploaded straight to R2 via /uploads/presign
+        try:
+            r2_image_url = confirm_upload(current_user, data['image_key'], 'event')['url']
+        except UploadValidationError as e:
+            return make_response(jsonify({"error": str(e)}), 400)
+    elif image_file:
         try:
-            s3_client.upload_fileobj(image_file, R2_BUCKET_NAME, image_key)
+            r2_image_url = store(image_file, image_file.filename, content_type=image_file.mimetype)
         except Exception as e:
             return jsonify({'error': f"Failed to upload image: {str(e)}"}), 500
 
-    # Use the uploaded image's R2 URL
-    r2_image_url = f"{IMAGE_PREFIX}/{image_key}" if image_key else None
-
     # Update event data
     event.title = title
     event.description = description
@@ -216,6 +213,9 @@ def update_event(event_id):
 
     db.session.commit()
 
+    if r2_image_url:
+        enqueue_variants(r2_image_url)
+
     return jsonify({'message': 'Event updated successfully'})
 @event_bp.route('/delete-event/<int:event_id>', methods=['DELETE'])
 @jwt_required()
@@ -1,75 +1,127 @@
 from models import db, Products, Wishlists, Reviews, Users, ProductVariation, ProductImages, Order,Seller,Cart, CartItem, OrderItem
+from services.media_blobs import store, store_many
+from services.uploads import confirm_upload, confirm_uploads, requested_keys, UploadValidationError
+from services.media_variants import enqueue_variants, variant_picker
+from services import product_search
 from flask import request, jsonify, Blueprint,make_response
 from werkzeug.security import generate_password_hash
 from werkzeug.utils import secure_filename
 from flask_jwt_extended import jwt_required, get_jwt_identity
-from sqlalchemy import or_, func
+from sqlalchemy import desc, tuple_
+from sqlalchemy.orm import joinedload, selectinload
 from datetime import datetime
 import base64
 import os
-import boto3
 import requests
 from dotenv import load_dotenv
 load_dotenv()
 
 marketplace_bp = Blueprint('marketplace_bp', __name__)
 
-R2_ACCESS_KEY_ID = os.getenv('R2_ACCESS_KEY_ID')
-R2_SECRET_ACCESS_KEY = os.getenv('R2_SECRET_ACCESS_KEY')
-R2_BUCKET_NAME = os.getenv('R2_BUCKET_NAME')
-R2_ENDPOINT_URL = os.getenv('R2_ENDPOINT_URL')
-IMAGE_PREFIX = os.getenv('IMAGE_PREFIX')
 PAYSTACK_SECRET_KEY = os.getenv('PAYSTACK_SECRET_KEY')
 
+CATALOG_PAGE_SIZE = 20
+CATALOG_MAX_PAGE_SIZE = 100
+
+def _encode_cursor(product):
+    raw = f"{product.created_at.isoformat()}|{product.id}"
+    return base64.urlsafe_b64encode(raw.encode()).decode()
+
+
+def _decode_cursor(cursor):
+    raw = base64.urlsafe_b64decode(cursor.encode()).decode()
+    created_at, product_id = raw.split('|', 1)
+    return datetime.fromisoformat(created_at), product_id
+
+
+def _catalog_item(product, picker):
+    return {
+        'id': product.id,
+        'title': product.title,
+        'description': product.description,
+        'contact_info': product.contact_info,
+        'brand': product.brand,
+        'price': product.price,
+        'category': product.category,
+        'created_at': product.created_at.isoformat(),
+        'updated_at': product.updated_at.isoformat(),
+        'average_rating': product.average_rating(),
+        'review_count': product.rating_count,
+        'images': [picker(image.image_url) for image in product.images],
+        'variations': [
+            {
+                'size': variation.variation_name,
+                'color': variation.variation_value,
+                'stock': variation.stock,
+                'price': variation.price
+            } for variation in product.variations
+        ],
+        'seller': {
+            'name': product.seller.display_name if product.seller else None,
+            'avatar': picker(product.seller.avatar) if product.seller else None,
+            'verified': product.seller.is_verified if product.seller else None,
+            'id': product.seller.id if product.seller else None,
+        }
+    }
+
+
+def _catalog_picker(products):
+    return variant_picker(
+        [image.image_url for product in products for image in product.images]
+        + [product.seller.avatar for product in products if product.seller]
+    )
 
-s3_client = boto3.client(
-    's3',
-    endpoint_url=R2_ENDPOINT_URL,
-    aws_access_key_id=R2_ACCESS_KEY_ID,
-    aws_secret_access_key=R2_SECRET_ACCESS_KEY
-)   
 
 @marketplace_bp.route('/products', methods=['GET'])
 def get_products():
     """
-    Get all products.
+    Paginated product catalog, newest first.
+
+    Keyset pagination on (created_at, id): pass ?cursor= (empty for the
+    first page) and/or ?limit=, then the returned next_cursor as ?cursor= to
+    get the following page. A page costs three queries however many
+    products it holds: the products with their sellers (ratings are columns
+    on products), and one SELECT ... IN each for images and variations.
+    Responses carry an ETag, so an unchanged page is answered with 304.
+
+    Without either parameter the whole catalog is returned as a bare list,
+    as before pagination, for clients that have not moved to pages yet.
     """
     try:
-        products = Products.query.all()
-        result = [
-            {
-                'id': product.id,
-                'title': product.title,
-                'description': product.description,
-                'contact_info': product.contact_info,
-                'brand': product.brand,
-                'price': product.price,
-                'category': product.category,
-                'created_at': product.created_at.isoformat(),
-                'updated_at': product.updated_at.isoformat(),
-                'average_rating': product.average_rating(), 
-                # Include URLs to product images if needed
-                'images': [image.image_url for image in product.images],
-                # Include variations if needed
-                'variations': [
-                    {
-                        'size': variation.variation_name,
-                        'color': variation.variation_value,
-                        'stock': variation.stock,
-                        'price': variation.price
-                    } for variation in product.variations
-                ],
-               'seller': {
-    'name': product.seller.display_name if product.seller else None, 
-    'avatar': product.seller.avatar if product.seller else None,
-    'verified': product.seller.is_verified if product.seller else None,
-    'id': product.seller.id if product.seller else None, 
-
-
-}
-            } for product in products
-        ]
-        return jsonify(result)
+        query = Products.query.options(
+            joinedload(Products.seller),
+            selectinload(Products.images),
+            selectinload(Products.variations)
+        )
+        if 'cursor' not in request.args and 'limit' not in request.args:
+            products = query.order_by(desc(Products.created_at), desc(Products.id)).all()
+            picker = _catalog_picker(products)
+            return jsonify([_catalog_item(product, picker) for product in products])
+
+        limit = min(max(request.args.get('limit', CATALOG_PAGE_SIZE, type=int), 1), CATALOG_MAX_PAGE_SIZE)
+        cursor = request.args.get('cursor')
+        if cursor:
+            try:
+                created_at, product_id = _decode_cursor(cursor)
+            except (ValueError, UnicodeDecodeError):
+                return jsonify({'error': 'Invalid cursor'}), 400
+            query = query.filter(tuple_(Products.created_at, Products.id) < (created_at, product_id))
+
+        # Fetch one extra row to know whether there is another page
+        products = query.order_by(desc(Products.created_at), desc(Products.id)).limit(limit + 1).all()
+        has_next = len(products) > limit
+        products = products[:limit]
+
+        picker = _catalog_picker(products)
+        response = jsonify({
+            'products': [_catalog_item(product, picker) for product in products],
+            'next_cursor': _encode_cursor(products[-1]) if has_next else None,
+            'has_next': has_next
+        })
+        # Clients revalidate every time; a matching If-None-Match gets an empty 304
+        response.cache_control.no_cache = True
+        response.add_etag()
+        return response.make_conditional(request)
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
@@ -99,16 +151,9 @@ def add_seller():
                 # Generate a unique file name using UUID and secure it
                 filename = secure_filename(file.filename)
                 
-                # Upload file to Cloudflare R2 bucket
-                s3_client.upload_fileobj(
-                    file,
-                    R2_BUCKET_NAME,
-                    filename,
-                    ExtraArgs={"ACL": "public-read"}  # Public read access
-                )
-                
-                # Construct the public URL for the avatar
-                avatar_url = f"{IMAGE_PREFIX}/{filename}"
+                # Upload file to Cloudflare R2 bucket with public read access,
+                # keeping the public URL for the avatar
+                avatar_url = store(file, filename, content_type=file.mimetype, public=True)
 
         # If a custom avatar URL is provided instead of a file
         if 'avatar_url' in data :
@@ -145,13 +190,6 @@ def get_seller(seller_id):
         total_products = seller.product_count()
         total_sales = seller.total_sales()
 
-        # Calculate average rating across all products
-        all_reviews = []
-        for product in seller.products:
-            all_reviews.extend([review.rating for review in product.reviews])
-
-        average_rating = sum(all_reviews) / len(all_reviews) if all_reviews else None
-
         # Construct seller data with detailed product info
         seller_data = {
             "name": seller.display_name,
@@ -160,7 +198,7 @@ def get_seller(seller_id):
             "avatar": seller.avatar,
             "total_products": total_products,
             "totalSales": total_sales,
-            "rating": average_rating,
+            "rating": seller.average_rating(),
             "products": []
         }
 
@@ -189,7 +227,7 @@ def get_seller(seller_id):
                 "updated_at": product.updated_at,
                 "images": images,
                 "variations": variations,
-                "reviews": [{"rating": review.rating, "content": review.content} for review in product.reviews]
+                "reviews": [{"rating": review.rating, "content": review.text} for review in product.reviews]
             }
 
             seller_data["products"].append(product_data)
@@ -208,8 +246,9 @@ def get_single_product(product_id):
         if not product:
             return jsonify({"error": "Product not found"}), 404
 
-        # Get images associated with the product
-        images = [image.image_url for image in product.images]
+        # Get images associated with the product, resized to ?w= if given
+        picker = variant_picker([image.image_url for image in product.images])
+        images = [picker(image.image_url) for image in product.images]
 
         # Get variations for the product
         variations = [
@@ -534,8 +573,8 @@ def get_my_products():
     products = Products.query.filter_by(user_id=current_user).all()
     output = []
     for product in products:
-        # Calculate the average rating for each product
-        average_rating = db.session.query(func.avg(Reviews.rating)).filter(Reviews.product_id == product.id).scalar()
+        # Average rating from the product's stored aggregates
+        average_rating = product.average_rating()
         if average_rating is None:
             average_rating = 0  # If there are no reviews, set average rating to 0
         else:
@@ -571,7 +610,9 @@ def get_my_products():
 
 # Route to create a new product
 @marketplace_bp.route('/add-product', methods=['POST'])
+@jwt_required()
 def add_product():
+    current_user = get_jwt_identity()
     data = request.form  # For handling non-file form data
     files = request.files.getlist('images')  # For handling multiple image files
 
@@ -587,6 +628,22 @@ def add_product():
     created_at = datetime.utcnow()
     updated_at = datetime.utcnow()
 
+    # Products can only be listed under the current user's own seller account
+    seller = db.session.get(Seller, seller_id) if seller_id else None
+    if not seller:
+        return jsonify({'error': 'Seller not found'}), 400
+    if seller.user_id != current_user:
+        return jsonify({'error': 'Unauthorized to add products for this seller'}), 403
+
+    # Images the seller already uploaded straight to R2 via /uploads/presign
+    direct_uploads = []
+    image_keys = requested_keys('image_keys')
+    if image_keys:
+        try:
+            direct_uploads = confirm_uploads(current_user, image_keys, 'product')
+        except UploadValidationError as e:
+            return jsonify({'error': str(e)}), 400
+
     # Create the base product
     try:
         new_product = Products(
@@ -596,7 +653,7 @@ def add_product():
             price=float(price) if price else None,  # Base price is optional if variations exist
             category=category,
             brand = brand,
-            seller_id=int(seller_id),
+            seller_id=seller.id,
             created_at=created_at,
             updated_at=updated_at
         )
@@ -621,29 +678,36 @@ def add_product():
                 )
                 db.session.add(product_variation)
 
-        # Handle image upload to Cloudflare R2
-        image_urls = []
-        for file in files:
-            if file:
-                filename = secure_filename(file.filename)
-                file_key = f"products/{new_product.id}/{filename}"  # Store under product folder by ID
+        # Handle image upload to Cloudflare R2, all images in parallel.
+        # Keys come from the content hash, so images shared between listings are stored once.
+        uploads = [
+            {
+                'fileobj': file,
+                'filename': secure_filename(file.filename),
+                'content_type': file.mimetype
+            }
+            for file in files if file
+        ]
+        store_many(uploads)
 
-                # Upload to R2
-                s3_client.upload_fileobj(file, R2_BUCKET_NAME, file_key)
+        # Get the public URL for each uploaded image
+        image_urls = [upload['url'] for upload in uploads]
+        image_urls += [upload['url'] for upload in direct_uploads]
 
-                # Get the public URL for the uploaded image
-                image_url = f"{R2_ENDPOINT_URL}/{R2_BUCKET_NAME}/{file_key}"
-                image_urls.append(image_url)
+        for image_url in image_urls:
 
-                # Store image URL in ProductImages
-                product_image = ProductImages(
-                    product_id=new_product.id,
-                    url=image_url
-                )
-                db.session.add(product_image)
+            # Store image URL in ProductImages
+            product_image = ProductImages(
+                product_id=new_product.id,
+                image_url=image_url
+            )
+            db.session.add(product_image)
 
         db.session.commit()  # Commit images and variations to the database
 
+        # Resize the images in the background
+        enqueue_variants(*image_urls)
+
         return jsonify({
             'message': 'Product added successfully',
             'product': {
@@ -671,17 +735,19 @@ def create_product():
 
     image_file = request.files.get('image_url')
 
-    # Handle R2 image upload
-    image_key = None
-    if image_file:
-        image_key = f'product_images/{current_user}/{image_file.filename}'
+    # Handle R2 image upload, using the uploaded image's R2 URL if image is provided
+    r2_image_url = None
+    if data.get('image_key'):
+        # Image already uploaded straight to R2 via /uploads/presign
         try:
-            s3_client.upload_fileobj(image_file, R2_BUCKET_NAME, image_key)
+            r2_image_url = confirm_upload(current_user, data['image_key'], 'product')['url']
+        except UploadValidationError as e:
+            return jsonify({'error': str(e)}), 400
+    elif image_file:
+        try:
+            r2_image_url = store(image_file, image_file.filename, content_type=image_file.mimetype)
         except Exception as e:
             return jsonify({'error': f"Failed to upload image: {str(e)}"}), 500
-
-    # Use the uploaded image's R2 URL if image is provided
-    r2_image_url = f"{IMAGE_PREFIX}/{image_key}" if image_key else None
     
     # Set the contact info
     contact_info = data.get('contact_info') or Users.query.filter_by(id=current_user).first().phone_no
@@ -699,6 +765,9 @@ def create_product():
     
     db.session.add(new_product)
     db.session.commit()
+
+    # Resize the image in the background
+    enqueue_variants(r2_image_url)
     return jsonify({'message': 'Product created successfully'})
 
 # Route to update a product
@@ -716,21 +785,24 @@ def update_product(product_id):
     if product.user_id != current_user:
         return jsonify({'message': 'Unauthorized'}), 401
     
-    data = request.form  # Handle form data for file uploads
+    # Form data for file uploads, or JSON when the image was uploaded directly
+    data = request.get_json() if request.is_json else request.form
     image_file = request.files.get('image_url')
 
-    # Handle R2 image upload if a new image is provided
-    image_key = None
-    if image_file:
-        image_key = f'product_images/{current_user}/{image_file.filename}'
+    # Handle R2 image upload if a new image is provided, using its R2 URL
+    r2_image_url = product.image_url
+    if data.get('image_key'):
+        # Image already uploaded straight to R2 via /uploads/presign
+        try:
+            r2_image_url = confirm_upload(current_user, data['image_key'], 'product')['url']
+        except UploadValidationError as e:
+            return jsonify({'error': str(e)}), 400
+    elif image_file:
         try:
-            s3_client.upload_fileobj(image_file, R2_BUCKET_NAME, image_key)
+            r2_image_url = store(image_file, image_file.filename, content_type=image_file.mimetype)
         except Exception as e:
             return jsonify({'error': f"Failed to upload image: {str(e)}"}), 500
 
-    # Use the uploaded image's R2 URL if image is provided
-    r2_image_url = f"{IMAGE_PREFIX}/{image_key}" if image_key else product.image_url
-
     # Update product details
     product.title = data.get('title', product.title)
     product.description = data.get('description', product.description)
@@ -740,6 +812,10 @@ def update_product(product_id):
     product.image_url = r2_image_url  # Update with the new image URL if applicable
     
     db.session.commit()
+
+    # Resize the new image in the background
+    if image_file or data.get('image_key'):
+        enqueue_variants(r2_image_url)
     return jsonify({'message': 'Product updated successfully'})
 # Route to delete a product
 @marketplace_bp.route('/delete-product/<int:product_id>', methods=['DELETE'])
@@ -764,8 +840,8 @@ def get_products_by_category(category):
     products = Products.query.filter_by(category=category).all()
     output = []
     for product in products:
-        # Calculate the average rating for each product
-        average_rating = db.session.query(func.avg(Reviews.rating)).filter(Reviews.product_id == product.id).scalar()
+        # Average rating from the product's stored aggregates
+        average_rating = product.average_rating()
         if average_rating is None:
             average_rating = 0  # If there are no reviews, set average rating to 0
         else:
@@ -803,65 +879,66 @@ def get_products_by_category(category):
 
 @marketplace_bp.route('/marketplace/search', methods=['GET'])
 def search_products():
-    search_term = request.args.get('q', '')
-    category_filter = request.args.get('category', None)
-
-    # Perform the search query
-    if category_filter:
-        products = Products.query.filter(
-            Products.category == category_filter,
-            or_(
-                Products.title.ilike(f'%{search_term}%'),
-                Products.description.ilike(f'%{search_term}%')
-            )
-        ).all()
-    else:
-        products = Products.query.filter(
-            or_(
-                Products.title.ilike(f'%{search_term}%'),
-                Products.description.ilike(f'%{search_term}%')
-            )
-        ).all()
+    """
+    Full-text product search.
 
+    ?q= is matched against title, brand and description (the last word as a
+    prefix) and results are ranked by relevance; without q, products are
+    listed newest first. Optional filters: ?category=, ?min_price=,
+    ?max_price=. Paginated with ?page= and ?per_page=. The response
+    includes category and price facets for the matched products.
+    """
+    page = max(request.args.get('page', 1, type=int), 1)
+    per_page = min(max(request.args.get('per_page', product_search.SEARCH_PAGE_SIZE, type=int), 1), product_search.SEARCH_MAX_PAGE_SIZE)
+
+    results = product_search.search_products(
+        q=request.args.get('q', ''),
+        category=request.args.get('category') or None,
+        min_price=request.args.get('min_price', type=float),
+        max_price=request.args.get('max_price', type=float),
+        page=page,
+        per_page=per_page,
+        options=[
+            selectinload(Products.images),
+            joinedload(Products.seller),
+            selectinload(Products.reviews).joinedload(Reviews.user)
+        ]
+    )
     output = []
-    for product in products:
-        # Calculate the average rating for each product
-        average_rating = db.session.query(func.avg(Reviews.rating)).filter(Reviews.product_id == product.id).scalar()
-        if average_rating is None:
-            average_rating = 0  # If there are no reviews, set average rating to 0
-        else:
-            average_rating = round(average_rating, 1)  # Round the average rating to one decimal place
-
-        # Get reviews associated with the product
+    for product, rank in results['products']:
+        average_rating = product.average_rating()
         reviews = [{
             'id': review.id,
             'text': review.text,
             'rating': review.rating,
-            'username': review.user.username,
-            'user_image_url': review.user.image_url if review.user.image_url else None
+            'username': review.user.username if review.user else None,
+            'user_image_url': review.user.avatar if review.user else None
         } for review in product.reviews]
-
-        # Determine the contact information for the product
-        if product.contact_info:
-            contact_info = product.contact_info
-        else:
-            contact_info = product.user.phone_no
-
-        # Include product data along with reviews and contact info
-        product_data = {
+        output.append({
             'id': product.id,
             'title': product.title,
             'description': product.description,
+            'brand': product.brand,
             'price': product.price,
-            'image_url': product.image_url if product.image_url else None, 
+            'image_url': product.images[0].image_url if product.images else None,
             'category': product.category,
-            'average_rating': average_rating,
+            'average_rating': round(average_rating, 1) if average_rating is not None else 0,
+            'review_count': product.rating_count,
             'reviews': reviews,
-            'contact_info': contact_info
-        }
-        output.append(product_data)
+            'contact_info': product.contact_info or (product.seller.phone_no if product.seller else None),
+            'rank': rank
+        })
 
-    return jsonify({'products': output})
+    total = results['total']
+    return jsonify({
+        'products': output,
+        'facets': results['facets'],
+        'page': page,
+        'per_page': per_page,
+        'total': total,
+        'pages': -(-total // per_page),
+        'has_next': page * per_page < total
+    })
 
 # Route to add a review and rating
 @marketplace_bp.route('/product/<string:product_id>/review', methods=['POST'])
@@ -0,0 +1,18 @@
+from services.instrumentation import metrics, render_prometheus
+from flask import request, Blueprint, Response, abort
+import hmac
+import os
+
+metrics_bp = Blueprint('metrics_bp', __name__)
+
+# Optional bearer token for scrapers; /metrics is open when unset
+METRICS_TOKEN = os.getenv('METRICS_TOKEN')
+
+
+# Prometheus scrape endpoint: per-endpoint request counts, latency histogram,
+# SQL statement counts and time, and JSON serialization time.
+@metrics_bp.route('/metrics', methods=['GET'])
+def get_metrics():
+    if METRICS_TOKEN and not hmac.compare_digest(request.headers.get('Authorization', ''), f'Bearer {METRICS_TOKEN}'):
+        abort(401)
+    return Response(render_prometheus(metrics.snapshot()), mimetype='text/plain; version=0.0.4')
@@ -0,0 +1,40 @@
+from services.uploads import create_upload, UploadValidationError, MAX_FILES_PER_REQUEST
+from flask import request, jsonify, Blueprint
+from flask_jwt_extended import jwt_required, get_jwt_identity
+
+upload_bp = Blueprint('upload_bp', __name__)
+
+
+# Presigned URLs for uploading media straight to the R2 bucket.
+# The client PUTs each file to its URL, then sends the returned keys to the
+# create/update endpoint (media_keys, image_key, ...), which validates them.
+@upload_bp.route('/uploads/presign', methods=['POST'])
+@jwt_required()
+def presign_uploads():
+    current_user = get_jwt_identity()
+    data = request.get_json(silent=True) or {}
+
+    purpose = data.get('purpose')
+    files = data.get('files') or []
+    if not files:
+        return jsonify({"error": "files is required"}), 400
+    if len(files) > MAX_FILES_PER_REQUEST:
+        return jsonify({"error": f"At most {MAX_FILES_PER_REQUEST} files per request"}), 400
+
+    try:
+        uploads = [
+            create_upload(
+                current_user,
+                purpose,
+                file.get('filename'),
+                file.get('content_type'),
+                file.get('size')
+            )
+            for file in files
+        ]
+    except UploadValidationError as e:
+        return jsonify({"error": str(e)}), 400
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+    return jsonify({"uploads": uploads}), 200
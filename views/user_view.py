@@ -1,30 +1,23 @@
 from models import db, Users, Events, Friendship
+from services.media_blobs import store
+from services.uploads import confirm_upload, UploadValidationError
+from services.media_variants import enqueue_variants
+from services.friend_graph import friend_graph, recommend_friends, invalidate_recommendations, RECOMMENDATIONS_TOP_K
 from flask import request, jsonify, Blueprint
-from werkzeug.security import generate_password_hash
-from flask_jwt_extended import jwt_required, get_jwt_identity
+from services.passwords import hash_password, PasswordHasherBusy
+from services.user_profiles import invalidate_user_profile
+from flask_jwt_extended import jwt_required, get_jwt_identity, current_user
 from sqlalchemy import or_, func
 import base64
 import os
-import boto3
 from dotenv import load_dotenv
 load_dotenv()
 
 user_bp = Blueprint('user_bp', __name__)
 
+DIRECTORY_PAGE_SIZE = 50
+DIRECTORY_MAX_PAGE_SIZE = 100
 
-R2_ACCESS_KEY_ID = os.getenv('R2_ACCESS_KEY_ID')
-R2_SECRET_ACCESS_KEY = os.getenv('R2_SECRET_ACCESS_KEY')
-R2_BUCKET_NAME = os.getenv('R2_BUCKET_NAME')
-R2_ENDPOINT_URL = os.getenv('R2_ENDPOINT_URL')
-IMAGE_PREFIX = os.getenv('IMAGE_PREFIX')
-
-
-s3_client = boto3.client(
-    's3',
-    endpoint_url=R2_ENDPOINT_URL,
-    aws_access_key_id=R2_ACCESS_KEY_ID,
-    aws_secret_access_key=R2_SECRET_ACCESS_KEY
-)    
 
 @user_bp.route("/signup", methods=["POST"])
 def add_users():
@@ -40,7 +33,7 @@ def add_users():
         if existing_user:
             return jsonify({"message": "Username or email already exists"}), 400
 
-        hashed_password = generate_password_hash(data["password"])
+        hashed_password = hash_password(data["password"])
 
         new_user = Users(
             first_name=data.get("first_name", ""),
@@ -58,6 +51,8 @@ def add_users():
         return jsonify({"message": "User added successfully"}), 201
     except AssertionError as e:
         return jsonify({"message": str(e)}), 400
+    except PasswordHasherBusy:
+        return jsonify({"message": "Server busy, please retry"}), 503, {'Retry-After': '1'}
     except Exception as e:
         print(str(e))
         db.session.rollback()
@@ -67,58 +62,87 @@ def add_users():
 @user_bp.route('/users', methods=['GET'])
 @jwt_required()
 def get_all_users():
-    # Get the current user's identity from the JWT
-    user_identity = get_jwt_identity()
-    current_user = Users.query.filter_by(id=user_identity).first()
-
+    """
+    Paginated user directory.
+
+    Keyset pagination on Users.id: pass the returned next_cursor back as
+    ?cursor= to get the following page. Optional filters: ?category= and
+    ?q= (prefix of username, first name or last name).
+    """
+    # Cached profile of the current user, loaded by the user_lookup_loader
     if not current_user:
         return jsonify(message="Current user not found"), 404
 
-    # Fetch all users
-    users = Users.query.all()
-    if users:
-        all_users = []
-        for user in users:
-            # Skip the current user in the response
-            if user.id == current_user.id:
-                continue
-
-            # Calculate mutual friends
-            mutual_friends_count = len(current_user.get_friend_ids() & user.get_friend_ids())
-
-            # Determine friendship status
-            friendship = Friendship.query.filter(
-                (Friendship.user_id == current_user.id) & (Friendship.friend_id == user.id)
-                | (Friendship.user_id == user.id) & (Friendship.friend_id == current_user.id)
-            ).first()
-
-            if friendship:
-                if friendship.status == 'accepted':
-                    friendship_status = 'friend'
-                elif friendship.user_id == current_user.id:
-                    friendship_status = 'request_sent'
-                elif friendship.friend_id == current_user.id:
-                    friendship_status = 'request_received'
-            else:
-                friendship_status = 'none'
-
-            # Add user details
-            all_users.append({
-                'first_name': user.first_name,
-                'last_name': user.last_name,
-                'email': user.email,
-                'username': user.username,
-                'phone_no': user.phone_no,
-                'category': user.category,
-                'photoUrl': user.avatar if user.avatar else None,
-                'id': user.id,
-                'mutual_friends': mutual_friends_count,
-                'friendship_status': friendship_status  # Add status to response
-            })
-
-        return jsonify({'users': all_users})
-    else:
-        return jsonify(message="No users found"), 404
+    limit = min(max(request.args.get('limit', DIRECTORY_PAGE_SIZE, type=int), 1), DIRECTORY_MAX_PAGE_SIZE)
+    cursor = request.args.get('cursor', type=int)
+    category = request.args.get('category')
+    name_prefix = request.args.get('q', '').strip()
+
+    query = Users.query.filter(Users.id != current_user.id)
+    if cursor:
+        query = query.filter(Users.id > cursor)
+    if category:
+        query = query.filter(Users.category == category)
+    if name_prefix:
+        pattern = f"{name_prefix}%"
+        query = query.filter(or_(
+            Users.username.ilike(pattern),
+            Users.first_name.ilike(pattern),
+            Users.last_name.ilike(pattern)
+        ))
+
+    # Fetch one extra row to know whether there is another page
+    users = query.order_by(Users.id).limit(limit + 1).all()
+    has_next = len(users) > limit
+    users = users[:limit]
+    user_ids = [user.id for user in users]
+
+    # Mutual friend counts for the whole page in one pass over the friend graph
+    mutual_friends = friend_graph.mutual_counts(current_user.id, user_ids)
+
+    # Friendships between the current user and this page, in one query
+    friendships = {}
+    if user_ids:
+        for friendship in Friendship.query.filter(or_(
+            (Friendship.user_id == current_user.id) & Friendship.friend_id.in_(user_ids),
+            (Friendship.friend_id == current_user.id) & Friendship.user_id.in_(user_ids)
+        )).all():
+            other_id = friendship.friend_id if friendship.user_id == current_user.id else friendship.user_id
+            friendships[other_id] = friendship
+
+    all_users = []
+    for user in users:
+        # Determine friendship status
+        friendship = friendships.get(user.id)
+        if friendship:
+            if friendship.status == 'accepted':
+                friendship_status = 'friend'
+            elif friendship.user_id == current_user.id:
+                friendship_status = 'request_sent'
+            elif friendship.friend_id == current_user.id:
+                friendship_status = 'request_received'
+        else:
+            friendship_status = 'none'
+
+        # Add user details
+        all_users.append({
+            'first_name': user.first_name,
+            'last_name': user.last_name,
+            'email': user.email,
+            'username': user.username,
+            'phone_no': user.phone_no,
+            'category': user.category,
+            'photoUrl': user.avatar if user.avatar else None,
+            'id': user.id,
+            'mutual_friends': mutual_friends[user.id],
+            'friendship_status': friendship_status  # Add status to response
+        })
+
+    return jsonify({
+        'users': all_users,
+        'next_cursor': str(user_ids[-1]) if has_next else None,
+        'has_next': has_next
+    })
 
 # Route to get a specific user by id
 @user_bp.route('/users/<int:user_id>', methods=['GET'])
@@ -141,8 +165,7 @@ def get_user(user_id):
 @user_bp.route('/profile', methods=['GET'])
 @jwt_required()
 def get_profile():
-    current_user_id = get_jwt_identity()
-    user = Users.query.get(current_user_id)
+    user = current_user
     
     if user:
         # Serialize user data
@@ -154,8 +177,7 @@ def get_profile():
             'email': user.email,
             'phone_no': user.phone_no,
             'category': user.category,
-            'image_url': user.image_url if user.image_url else None,
-            'gender': user.gender
+            'image_url': user.avatar if user.avatar else None
         }
         return jsonify(user_data), 200
     else:
@@ -177,27 +199,30 @@ def update_profile():
     user.email = data.get('email', user.email)
     user.phone_no = data.get('phone_no', user.phone_no)
     user.category = data.get('category', user.category)
-    user.gender = data.get('gender', user.gender)
 
     # Handle image upload to R2
     image_file = request.files.get('profile_image')  # Expecting a file input with name 'profile_image'
-    
-    if image_file:
-        # Create an image key (filename) for the uploaded object
-        image_key = f'profile_images/{current_user}/{image_file.filename}'
-        
-        try:
-            # Upload image to R2 bucket
-            s3_client.upload_fileobj(image_file, R2_BUCKET_NAME, image_key)
 
-            # You can store the image key or a full URL in the user's profile
-            r2_image_url = f"{IMAGE_PREFIX}/{image_key}"
-            user.image_url = r2_image_url
+    if data.get('profile_image_key'):
+        # Image already uploaded straight to R2 via /uploads/presign
+        try:
+            user.avatar = confirm_upload(current_user, data['profile_image_key'], 'avatar')['url']
+        except UploadValidationError as e:
+            return jsonify({'error': str(e)}), 400
+    elif image_file:
+        try:
+            # Upload image to R2 bucket and store its URL as the user's avatar
+            user.avatar = store(image_file, image_file.filename, content_type=image_file.mimetype)
         except Exception as e:
             return jsonify({'error': f"Failed to upload image: {str(e)}"}), 500
 
     # Commit changes to the database
     db.session.commit()
+    invalidate_user_profile(current_user)
+
+    # Resize a new avatar in the background
+    if data.get('profile_image_key') or image_file:
+        enqueue_variants(user.avatar)
 
     return jsonify({'message': 'Profile updated successfully'})
 
@@ -211,6 +236,8 @@ def delete_user():
     if user:
         db.session.delete(user)
         db.session.commit()
+        friend_graph.remove_user(current_user_id)
+        invalidate_user_profile(current_user_id)
         return jsonify({"message": "User deleted successfully"}), 200
     else:
         return jsonify({"message": "User you are trying to delete is not found!"}), 404
@@ -265,6 +292,33 @@ def get_friends():
 
     return jsonify({'friends': friends_list}), 200
 
+@user_bp.route('/friends/recommendations', methods=['GET'])
+@jwt_required()
+def get_friend_recommendations():
+    user_id = get_jwt_identity()  # Authenticated user's ID
+    limit = min(max(request.args.get('limit', 20, type=int), 1), RECOMMENDATIONS_TOP_K)
+
+    ranked = recommend_friends(user_id, limit)
+
+    # Fetch the recommended users in one query
+    users = {user.id: user for user in Users.query.filter(Users.id.in_([candidate for candidate, _ in ranked])).all()}
+
+    recommendations = [
+        {
+            'id': candidate,
+            'username': users[candidate].username,
+            'first_name': users[candidate].first_name,
+            'last_name': users[candidate].last_name,
+            'photoUrl': users[candidate].avatar,
+            'course': users[candidate].category,
+            'mutual_friends': mutual_friends
+        }
+        for candidate, mutual_friends in ranked
+        if candidate in users
+    ]
+
+    return jsonify({'recommendations': recommendations}), 200
+
 @user_bp.route('/friends/block', methods=['POST'])
 @jwt_required()
 def block_user():
@@ -281,6 +335,8 @@ def block_user():
         ((Friendship.user_id == target_id) & (Friendship.friend_id == user_id))
     ).first()
 
+    was_friend = friendship is not None and friendship.status == 'accepted'
+
     if not friendship:
         friendship = Friendship(user_id=user_id, friend_id=target_id, status='blocked' if action == 'block' else 'pending')
         db.session.add(friendship)
@@ -294,6 +350,10 @@ def block_user():
 
     db.session.commit()
 
+    if was_friend and friendship.status != 'accepted':
+        friend_graph.remove_friendship(user_id, target_id)
+    invalidate_recommendations(user_id, target_id)
+
     return jsonify({"message": f"User {'blocked' if action == 'block' else 'unblocked'} successfully"}), 200
 
 @user_bp.route('/friends/remove', methods=['DELETE'])
@@ -317,6 +377,7 @@ def remove_friend():
 
     db.session.delete(friendship)
     db.session.commit()
+    friend_graph.remove_friendship(user_id, friend_id)
 
     return jsonify({"message": "Friend removed successfully"}), 200
 
@@ -336,6 +397,7 @@ def add_friend():
 
     friend_request.status = 'accepted'
     db.session.commit()
+    friend_graph.add_friendship(requester_id, user_id)
 
     return jsonify({"message": "Friend request accepted"}), 200
 
@@ -359,6 +421,7 @@ def send_friend_request():
     new_request = Friendship(user_id=sender_id, friend_id=recipient_id, status='pending')
     db.session.add(new_request)
     db.session.commit()
+    invalidate_recommendations(sender_id, recipient_id)
 
     return jsonify({"message": "Friend request sent successfully"}), 201
 
@@ -410,6 +473,7 @@ def reject_friend_request():
     # Delete the friend request to reject it
     db.session.delete(friend_request)
     db.session.commit()
+    invalidate_recommendations(requester_id, user_id)
 
     return jsonify({"message": "Friend request rejected successfully"}), 200
 
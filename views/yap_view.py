@@ -1,4 +1,9 @@
-from models import db, YapMedia, Yap, Users
+from models import db, YapMedia, Yap, Users, YapHashtag
+from services.timeline import fan_out, read_timeline
+from services.storage import MediaUploadError
+from services.media_blobs import store_many
+from services.uploads import confirm_uploads, requested_keys, UploadValidationError
+from services.media_variants import enqueue_variants, variant_picker
 from flask import request, jsonify, Blueprint, make_response
 from werkzeug.security import generate_password_hash
 from flask_jwt_extended import jwt_required, get_jwt_identity
@@ -6,58 +11,70 @@ from sqlalchemy import or_, func
 from datetime import datetime
 import base64
 import os
-import boto3
 from werkzeug.utils import secure_filename
 from dotenv import load_dotenv
-from sqlalchemy import desc
-from botocore.exceptions import NoCredentialsError
+from sqlalchemy import desc, tuple_
+from sqlalchemy.orm import selectinload, joinedload
 load_dotenv()
 
 yap_bp = Blueprint('yap', __name__)
 
 
-R2_ACCESS_KEY_ID = os.getenv('R2_ACCESS_KEY_ID')
-R2_SECRET_ACCESS_KEY = os.getenv('R2_SECRET_ACCESS_KEY')
-R2_BUCKET_NAME = os.getenv('R2_BUCKET_NAME')
-R2_ENDPOINT_URL = os.getenv('R2_ENDPOINT_URL')
-IMAGE_PREFIX = os.getenv('IMAGE_PREFIX')
+def _feed_query():
+    """
+    Yaps joined with their author's columns.
+
+    Reply/like/retweet counts are plain columns on Yap and media/hashtags are
+    loaded with one SELECT ... IN per page, so serializing a page never
+    touches a lazy relationship.
+    """
+    return db.session.query(
+        Yap,
+        Users.first_name,
+        Users.last_name,
+        Users.username,
+        Users.avatar
+    ).join(Users, Users.id == Yap.user_id).options(
+        selectinload(Yap.media),
+        selectinload(Yap.hashtags).joinedload(YapHashtag.hashtag)
+    )
+
+
+def _serialize_feed_row(row, picker):
+    yap = row.Yap
+    return {
+        'id': yap.id,
+        'content': yap.content,
+        'timestamp': yap.created_at,
+        'updated_at': yap.updated_at,
+        'location': yap.location,
+        'user_id': yap.user_id,
+        'display_name': row.first_name + ' ' + row.last_name,
+        'username': row.username,
+        'avatar': picker(row.avatar),
+        'original_yap_id': yap.original_yap_id,
+        'replies_count': yap.reply_count,
+        'likes_count': yap.like_count,
+        'retweets_count': yap.retweet_count,
+        'media': [{'id': media.id, 'url': picker(media.media_url), 'type': media.media_type} for media in yap.media],
+        'hashtags': [yap_hashtag.hashtag.name for yap_hashtag in yap.hashtags]
+    }
+
+
+def _serialize_feed_rows(rows):
+    # Images are swapped for their smallest variant that fits ?w=, if given
+    picker = variant_picker(
+        [row.avatar for row in rows] + [media.media_url for row in rows for media in row.Yap.media]
+    )
+    return [_serialize_feed_row(row, picker) for row in rows]
 
 
-s3_client = boto3.client(
-    's3',
-    endpoint_url=R2_ENDPOINT_URL,
-    aws_access_key_id=R2_ACCESS_KEY_ID,
-    aws_secret_access_key=R2_SECRET_ACCESS_KEY
-)  
-
-r2_client = boto3.client(
-    's3',
-    endpoint_url=R2_ENDPOINT_URL,
-    aws_access_key_id=R2_ACCESS_KEY_ID,
-    aws_secret_access_key=R2_SECRET_ACCESS_KEY
-)
-
-def upload_media_to_r2(file_content, file_name, content_type):
-    try:
-        # Upload the file to R2
-        r2_client.put_object(
-            Bucket=R2_BUCKET_NAME,
-            Key=file_name,
-            Body=file_content,
-            ContentType=content_type
-        )
-        return f"{R2_ENDPOINT_URL}/{R2_BUCKET_NAME}/{file_name}"
-
-    except NoCredentialsError:
-        raise Exception("R2 credentials are incorrect or missing.")
-    except Exception as e:
-        raise Exception(f"An error occurred while uploading to R2: {str(e)}")
-
 @yap_bp.route('/add_yap', methods=['POST'])
 @jwt_required()
 def add_yap():
     try:
-        data = request.form  # Use form data to handle text and file uploads
+        # Form data to handle text and file uploads, or JSON when media was uploaded directly
+        data = (request.get_json(silent=True) or {}) if request.is_json else request.form
         files = request.files.getlist('media')  # Get media files (images/videos)
         
         # Get user from JWT
@@ -71,45 +88,49 @@ def add_yap():
         if not content:
             return jsonify({"error": "Content is required"}), 400
 
-        # List to hold media URLs after successful upload
-        uploaded_media = []
+        # Validate every file before uploading any of them
+        pending_uploads = []
+        for file in files:
+            if file:
+                filename = secure_filename(file.filename)
+                file_ext = filename.split('.')[-1].lower()
+
+                # Validate media type
+                if file_ext not in ['jpg', 'jpeg', 'png', 'gif', 'mp4', 'mov', 'avif', 'webp']:
+                    return jsonify({"error": f"Invalid file type: {file_ext}"}), 400
+
+                pending_uploads.append({
+                    'fileobj': file,
+                    'filename': filename,  # Stored under a key derived from the content hash
+                    'content_type': file.mimetype,
+                    'public': True,
+                    # Set media type
+                    'media_type': 'image' if file_ext in ['jpg', 'jpeg', 'png', 'gif', 'webp', 'avif'] else 'video'
+                })
 
-        # Handle media uploads if any
-        if files:
-            for file in files:
-                if file:
-                    filename = secure_filename(file.filename)
-                    file_ext = filename.split('.')[-1].lower()
+        # Media the client already uploaded straight to R2 via /uploads/presign
+        try:
+            direct_uploads = confirm_uploads(user_id, requested_keys('media_keys'), 'yap')
+        except UploadValidationError as e:
+            return jsonify({"error": str(e)}), 400
 
-                    # Validate media type
-                    if file_ext not in ['jpg', 'jpeg', 'png', 'gif', 'mp4', 'mov', 'avif', 'webp']:
-                        return jsonify({"error": f"Invalid file type: {file_ext}"}), 400
+        # Upload all media to the R2 bucket in parallel
+        try:
+            timings = store_many(pending_uploads)
+        except MediaUploadError as e:
+            return jsonify({"error": f"Error uploading media: {str(e.cause)}"}), 500
 
-                    # Set media type
-                    media_type = 'image' if file_ext in ['jpg', 'jpeg', 'png', 'gif', 'webp', 'avif'] else 'video'
-
-                    # Define the S3 (R2) file path
-                    s3_path = f"yaps/{user_id}/{filename}"
-
-                    # Upload the file to the R2 bucket
-                    try:
-                        s3_client.upload_fileobj(
-                            file,
-                            os.getenv('R2_BUCKET_NAME'),
-                            s3_path,
-                            ExtraArgs={'ACL': 'public-read'}
-                        )
-                    except Exception as e:
-                        return jsonify({"error": f"Error uploading media: {str(e)}"}), 500
-
-                    # Generate the R2 URL for the uploaded media
-                    r2_url = f"{IMAGE_PREFIX}/{s3_path}"
-
-                    # Add the uploaded media details to the list
-                    uploaded_media.append({
-                        "media_url": r2_url,
-                        "media_type": media_type
-                    })
+        # List to hold media URLs after successful upload
+        uploaded_media = [
+            {
+                "media_url": upload['url'],  # R2 URL for the uploaded media
+                "media_type": upload['media_type']
+            }
+            for upload in pending_uploads
+        ] + [
+            {"media_url": upload['url'], "media_type": upload['media_type']}
+            for upload in direct_uploads
+        ]
 
         # Now add the Yap to the database since media uploads are successful
         new_yap = Yap(
@@ -136,9 +157,16 @@ def add_yap():
         # Commit the session to finalize changes
         db.session.commit()
 
+        # Push the yap into the author's and followers' home timelines
+        fan_out(new_yap)
+
+        # Resize uploaded images in the background
+        enqueue_variants(*[media['media_url'] for media in uploaded_media if media['media_type'] == 'image'])
+
         return jsonify({
             "message": "Yap added successfully!",
-            "yap_id": new_yap.id
+            "yap_id": new_yap.id,
+            "uploads": timings
         }), 201
 
     except Exception as e:
@@ -153,28 +181,15 @@ def fetch_yaps():
         page = request.args.get('page', 1, type=int)
         per_page = request.args.get('per_page', 10, type=int)
 
+        # Cursor mode: ?cursor= (empty for the first page) skips OFFSET and COUNT(*)
+        if 'cursor' in request.args:
+            return _fetch_yaps_by_cursor(request.args.get('cursor'), per_page)
+
         # Fetch yaps with pagination, ordering by creation date (newest first)
-        yaps = Yap.query.order_by(desc(Yap.created_at)).paginate(page=page, per_page=per_page, error_out=False)
+        yaps = _feed_query().order_by(desc(Yap.created_at)).paginate(page=page, per_page=per_page, error_out=False)
 
         # Serialize yaps into JSON format
-        yaps_list = []
-        for yap in yaps.items:
-            yaps_list.append({
-                'id': yap.id,
-                'content': yap.content,
-                'timestamp': yap.created_at,
-                'updated_at': yap.updated_at,
-                'location': yap.location,
-                'user_id': yap.user_id,
-                'display_name' : yap.user.first_name + ' '+ yap.user.last_name,
-                'username': yap.user.username,
-                'avatar': yap.user.avatar,
-                'original_yap_id': yap.original_yap_id,
-                'replies_count': len(yap.replies),
-                'likes_count': len(yap.likes),
-                'media': [{'id': media.id, 'url': media.media_url, 'type': media.media_type} for media in yap.media] if yap.media else [],
-                'hashtags': [hashtag.tag for hashtag in yap.hashtags] if yap.hashtags else []
-            })
+        yaps_list = _serialize_feed_rows(yaps.items)
 
         # Return JSON response with pagination info
         return jsonify({
@@ -190,6 +205,94 @@ def fetch_yaps():
         return jsonify({'error': str(e)}), 500
 
 
+def _encode_cursor(yap):
+    raw = f"{yap.created_at.isoformat()}|{yap.id}"
+    return base64.urlsafe_b64encode(raw.encode()).decode()
+
+
+def _decode_cursor(cursor):
+    raw = base64.urlsafe_b64decode(cursor.encode()).decode()
+    created_at, yap_id = raw.split('|', 1)
+    return datetime.fromisoformat(created_at), yap_id
+
+
+def _encode_timeline_cursor(entry):
+    yap_id, score = entry
+    return base64.urlsafe_b64encode(f"{score!r}|{yap_id}".encode()).decode()
+
+
+def _decode_timeline_cursor(cursor):
+    """(score, yap_id); a bare score from older clients continues after every yap with that score."""
+    try:
+        return float(cursor), ''
+    except ValueError:
+        pass
+    score, yap_id = base64.urlsafe_b64decode(cursor.encode()).decode().split('|', 1)
+    return float(score), yap_id
+
+
+def _fetch_yaps_by_cursor(cursor, per_page):
+    """
+    Keyset page of the timeline, newest first, keyed on (created_at, id).
+
+    Served by the ix_yaps_created_at_id index, so a page costs the same
+    however deep the client has scrolled.
+    """
+    per_page = max(1, min(per_page, 100))
+    query = _feed_query()
+    if cursor:
+        try:
+            created_at, yap_id = _decode_cursor(cursor)
+        except (ValueError, UnicodeDecodeError):
+            return jsonify({'error': 'Invalid cursor'}), 400
+        query = query.filter(tuple_(Yap.created_at, Yap.id) < (created_at, yap_id))
+
+    # Fetch one extra row to know whether there is another page
+    rows = query.order_by(desc(Yap.created_at), desc(Yap.id)).limit(per_page + 1).all()
+    has_next = len(rows) > per_page
+    rows = rows[:per_page]
+
+    return jsonify({
+        'yaps': _serialize_feed_rows(rows),
+        'next_cursor': _encode_cursor(rows[-1].Yap) if has_next else None,
+        'has_next': has_next
+    }), 200
+
+
+@yap_bp.route('/timeline', methods=['GET'])
+@jwt_required()
+def fetch_timeline():
+    """
+    Home timeline: yaps by the current user and the accounts they follow.
+
+    Pass the returned next_cursor back as ?cursor= to get older yaps.
+    """
+    try:
+        user_id = get_jwt_identity()
+        per_page = max(1, min(request.args.get('per_page', 10, type=int), 100))
+        cursor = request.args.get('cursor')
+        before = None
+        if cursor:
+            try:
+                before = _decode_timeline_cursor(cursor)
+            except (ValueError, UnicodeDecodeError):
+                return jsonify({'error': 'Invalid cursor'}), 400
+
+        entries = read_timeline(user_id, before=before, limit=per_page)
+
+        # Hydrate the page in one query, keeping timeline order
+        rows = {row.Yap.id: row for row in _feed_query().filter(Yap.id.in_([yap_id for yap_id, _ in entries]))}
+        yaps_list = _serialize_feed_rows([rows[yap_id] for yap_id, _ in entries if yap_id in rows])
+
+        return jsonify({
+            'yaps': yaps_list,
+            'next_cursor': _encode_timeline_cursor(entries[-1]) if len(entries) == per_page else None
+        }), 200
+
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+
 @yap_bp.route('/api/yaps/<string:yap_id>', methods=['GET'])
 def get_specific_yap(yap_id):
     try:
@@ -198,6 +301,7 @@ def get_specific_yap(yap_id):
             return jsonify({'error': 'Yap not found'}), 404
 
         # Serialize yap with its replies
+        picker = variant_picker([media.media_url for media in yap.media])
         yap_data = {
             'id': yap.id,
             'content': yap.content,
@@ -215,9 +319,10 @@ def get_specific_yap(yap_id):
                 'user_id': reply.user_id,
                 'username': reply.user.username  # Include the username of the reply's author
             } for reply in yap.replies],
-            'likes_count': len(yap.likes),
-            'media': [{'id': media.id, 'url': media.url} for media in yap.media] if yap.media else [],
-            'hashtags': [hashtag.tag for hashtag in yap.hashtags] if yap.hashtags else []
+            'likes_count': yap.like_count,
+            'retweets_count': yap.retweet_count,
+            'media': [{'id': media.id, 'url': picker(media.media_url), 'type': media.media_type} for media in yap.media],
+            'hashtags': [yap_hashtag.hashtag.name for yap_hashtag in yap.hashtags]
         }
 
         return jsonify(yap_data), 200
@@ -235,11 +340,13 @@ def get_user_yaps(user_id):
             return jsonify({'error': 'User not found'}), 404
 
         # Fetch all yaps by the user
-        yaps = Yap.query.filter_by(user_id=user_id).order_by(desc(Yap.created_at)).all()
+        rows = _feed_query().filter(Yap.user_id == user_id).order_by(desc(Yap.created_at)).all()
 
         # Serialize yaps into JSON format
+        picker = variant_picker([media.media_url for row in rows for media in row.Yap.media])
         yaps_list = []
-        for yap in yaps:
+        for row in rows:
+            yap = row.Yap
             yaps_list.append({
                 'id': yap.id,
                 'content': yap.content,
@@ -247,13 +354,14 @@ def get_user_yaps(user_id):
                 'updated_at': yap.updated_at,
                 'location': yap.location,
                 'user_id': yap.user_id,
-                'username': yap.user.username,  
-                'display_name' : yap.user.first_name + yap.user.last_name,
+                'username': row.username,  
+                'display_name' : row.first_name + row.last_name,
                 'original_yap_id': yap.original_yap_id,
-                'replies_count': len(yap.replies),
-                'likes_count': len(yap.likes),
-                'media': [{'id': media.id, 'url': media.url} for media in yap.media] if yap.media else [],
-                'hashtags': [hashtag.tag for hashtag in yap.hashtags] if yap.hashtags else []
+                'replies_count': yap.reply_count,
+                'likes_count': yap.like_count,
+                'retweets_count': yap.retweet_count,
+                'media': [{'id': media.id, 'url': picker(media.media_url)} for media in yap.media],
+                'hashtags': [yap_hashtag.hashtag.name for yap_hashtag in yap.hashtags]
             })
 
         return jsonify({
@@ -262,7 +370,7 @@ def get_user_yaps(user_id):
                 'username': user.username,
                 'first_name': user.first_name,
                 'last_name': user.last_name,
-                'image_url': user.image_url
+                'image_url': user.avatar
             },
             'yaps': yaps_list
         }), 200
@@ -0,0 +1,10 @@
+"""
+WSGI entry point for production servers.
+
+    gunicorn -c gunicorn.conf.py wsgi:app
+
+Worker model, preloading and recycling are configured in gunicorn.conf.py.
+"""
+from app import create_app
+
+app = create_app()